@@ -0,0 +1,17 @@
+import hashlib
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(file_path: str) -> str:
+    """Returns the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def bytes_sha256(data: bytes) -> str:
+    """Returns the SHA-256 hex digest of an in-memory buffer."""
+    return hashlib.sha256(data).hexdigest()
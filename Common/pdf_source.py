@@ -0,0 +1,21 @@
+from typing import Union
+
+import fitz
+
+from Common.hashing import bytes_sha256, file_sha256
+
+# A PDF on disk (path) or held in memory (raw bytes, e.g. a small upload)
+PdfSource = Union[str, bytes]
+
+
+def open_pdf(source: PdfSource) -> fitz.Document:
+    """Opens a PDF from a path or straight from an in-memory buffer."""
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+
+def source_sha256(source: PdfSource) -> str:
+    if isinstance(source, (bytes, bytearray)):
+        return bytes_sha256(source)
+    return file_sha256(source)
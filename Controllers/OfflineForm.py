@@ -693,17 +693,46 @@ import asyncio
 import json
 import os
 import shutil
+import tempfile
+import time
 import uuid
-from typing import Dict, Any, List, Optional
-import fitz
+from contextlib import AsyncExitStack
+from typing import Dict, Any, List, Optional, Tuple, Iterator
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.httpsredirect import HTTPSRedirectMiddleware
 from pydantic import BaseModel, Field
 
+from Common.pdf_source import PdfSource
 from Services.GenericFiller import MultiAgentFormFiller as StandardFormFiller
+from Services.GenericFiller import create_field_matcher_agent as create_standard_agent
 from Services.GenFiler import MultiAgentFormFiller as OCRFormFiller
+from Services.GenFiler import create_field_matcher_agent as create_ocr_agent
+from Services.GenFiler import create_ocr_reader, warm_ocr_worker
+from Services.BatchFiller import (BATCH_MATCH_CONCURRENCY, BATCH_MAX_ITEMS, BatchFormFiller, BatchItemResult,
+                                  build_results_zip)
+from Services.APIKeyPool import get_key_pool
+from Services.JobQueue import DEFAULT_JOB_INPUT_DIR, JobQueue, JobWorkerPool
+from Services.LabelStore import LABEL_EXTRACT_ON_FIRST_SIGHT, FieldLabelStore, extract_template_labels
+from Services.EnginePool import (AGENT_POOL_SIZE, OCR_ENGINE_POOL_SIZE, register_engine_pool, get_engine_pool,
+                                 warm_engine_pools, engine_pools_health)
+from Services.MappingCache import FieldMappingCache
+from Services.OCRResultCache import OCRResultCache
+from Services.TemplateRegistry import TemplateRegistry, TemplateMetadata, read_template_metadata
+from Services.WorkerPool import (WORKER_POOL_ENABLED, configure_worker_pool, get_worker_pool, shutdown_worker_pool,
+                                 run_in_worker)
+
+# Uploads up to this size are processed straight from memory; larger ones are spooled to disk
+UPLOAD_IN_MEMORY_LIMIT = int(os.environ.get("UPLOAD_IN_MEMORY_LIMIT", 16 * 1024 * 1024))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Where large uploads are spooled; never the working directory
+UPLOAD_SPOOL_DIR = os.environ.get("UPLOAD_SPOOL_DIR", tempfile.gettempdir())
+RESPONSE_CHUNK_SIZE = 256 * 1024
+# Finished batch job entries are forgotten this long after they finish
+BATCH_JOB_TTL_SECONDS = float(os.environ.get("BATCH_JOB_TTL_SECONDS", 24 * 3600))
+# Whether filled PDFs are also kept in filled_forms/ by default
+PERSIST_FILLED_FORMS = os.environ.get("PERSIST_FILLED_FORMS", "1") == "1"
 
 app = FastAPI(
     title="Smart PDF Form Filler API",
@@ -738,50 +767,36 @@ class FormResponse(BaseModel):
     requires_ocr: bool = Field(False, description="Whether OCR was required")
     file_path: Optional[str] = Field(None, description="Path to processed file")
     field_matches: List[FieldMatch] = Field(default_factory=list, description="Field matching details")
+    cache_hit: bool = Field(False, description="Whether the field mapping was served from the mapping cache")
+    degraded: bool = Field(False, description="Whether fields were matched locally only because the LLM circuit was open")
     error_details: Optional[str] = Field(None, description="Error details if processing failed")
 
 
 class PDFProcessingService:
     @staticmethod
-    async def analyze_form_fields(pdf_path: str) -> tuple[bool, list]:
+    async def load_template(pdf_path: PdfSource) -> Optional[TemplateMetadata]:
+        """Reads widget metadata for an uploaded PDF in the render worker pool."""
         try:
-            doc = fitz.open(pdf_path)
-            fields = []
-            total_interactive_fields = 0
-            total_pages = len(doc)
-            filled_fields = 0
-            empty_fields = 0
-
-            for page in doc:
-                for widget in page.widgets():
-                    if widget.field_name:
-                        total_interactive_fields += 1
-                        field_value = widget.field_value
-                        if field_value:
-                            filled_fields += 1
-                        else:
-                            empty_fields += 1
-                        fields.append({
-                            'name': widget.field_name,
-                            'type': widget.field_type,
-                            'value': field_value
-                        })
-
-            doc.close()
-            needs_ocr = (
-                    total_interactive_fields == 0 or
-                    (total_pages > 2 and total_interactive_fields < 3) or
-                    (total_interactive_fields > 0 and empty_fields == total_interactive_fields)
-            )
+            return await run_in_worker("render", read_template_metadata, pdf_path)
+        except Exception as e:
+            print(f"Field analysis error: {e}")
+            return None
 
-            print(f"OCR Detection Analysis: pages={total_pages}, fields={total_interactive_fields}, "
-                  f"filled={filled_fields}, empty={empty_fields}, needs_ocr={needs_ocr}")
+    @staticmethod
+    async def analyze_form_fields(pdf_path: PdfSource, template: Optional[TemplateMetadata] = None) -> tuple[bool, list]:
+        if template is None:
+            template = await PDFProcessingService.load_template(pdf_path)
+            if template is None:
+                return True, []
 
-            return needs_ocr, fields
+        fields = template.analysis_fields()
+        filled_fields = sum(1 for field in fields if field['value'])
 
-        except Exception as e:
-            print(f"Field analysis error: {e}")
-            return True, []
+        print(f"OCR Detection Analysis: pages={template.page_count}, fields={len(fields)}, "
+              f"filled={filled_fields}, empty={len(fields) - filled_fields}, needs_ocr={template.needs_ocr} "
+              f"({'; '.join(template.ocr_reasons)})")
+
+        return template.needs_ocr, fields
 
 
 class TemporaryFileManager:
@@ -790,6 +805,56 @@ class TemporaryFileManager:
         unique_id = str(uuid.uuid4())
         return f"{prefix}{unique_id}{extension}"
 
+    @staticmethod
+    async def spool_upload(upload: UploadFile) -> Tuple[PdfSource, str]:
+        """Reads an upload in chunks without holding more than UPLOAD_IN_MEMORY_LIMIT of it in memory.
+
+        Returns the PDF bytes for small uploads, or the path of a temp file in
+        UPLOAD_SPOOL_DIR for large ones (the second value is that path, to
+        clean up afterwards). Disk writes run off the event loop. Only the
+        input is bounded: the filled PDF is still built and returned in memory.
+        """
+        buffer = bytearray()
+        temp_file = None
+        try:
+            while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                if temp_file is None and len(buffer) + len(chunk) <= UPLOAD_IN_MEMORY_LIMIT:
+                    buffer.extend(chunk)
+                    continue
+                if temp_file is None:
+                    os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+                    temp_file = await asyncio.to_thread(
+                        tempfile.NamedTemporaryFile, mode="wb", prefix="temp_input_", suffix=".pdf",
+                        dir=UPLOAD_SPOOL_DIR, delete=False
+                    )
+                    await asyncio.to_thread(temp_file.write, bytes(buffer))
+                    buffer = bytearray()
+                await asyncio.to_thread(temp_file.write, chunk)
+        except BaseException:
+            if temp_file is not None:
+                await asyncio.to_thread(temp_file.close)
+                TemporaryFileManager.cleanup_file(temp_file.name)
+            raise
+
+        if temp_file is not None:
+            await asyncio.to_thread(temp_file.close)
+            print(f"Spooled large upload to disk: {temp_file.name}")
+            return temp_file.name, temp_file.name
+        return bytes(buffer), ""
+
+    @staticmethod
+    def iter_chunks(data: bytes, chunk_size: int = RESPONSE_CHUNK_SIZE) -> Iterator[bytes]:
+        view = memoryview(data)
+        for start in range(0, len(view), chunk_size):
+            yield view[start:start + chunk_size]
+
+    @staticmethod
+    def write_file(file_path: str, data: bytes):
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        with open(file_path, "wb") as f:
+            f.write(data)
+        print(f"Persisted filled form: {file_path}")
+
     @staticmethod
     def cleanup_file(file_path: str):
         try:
@@ -806,29 +871,23 @@ class StateFormManager:
     # Base directory for state form templates
     TEMPLATE_DIR = "D:\\demo\\state_templates"
 
-    @staticmethod
-    def get_state_form_path(entity_type: str, state: str) -> str:
-
-        # Normalize inputs
-        entity_type = entity_type.lower().strip()
-        state = state.upper().strip()
-
-        # Check if state directory exists
-        state_dir = os.path.join(StateFormManager.TEMPLATE_DIR, state)
-        if not os.path.exists(state_dir):
-            raise FileNotFoundError(f"No forms available for state: {state}")
-
-        # List all PDFs in the state directory to find matching forms
-        available_forms = [f for f in os.listdir(state_dir) if f.lower().endswith('.pdf')]
+    _registry: Optional[TemplateRegistry] = None
 
-        # Try to find a form that matches the entity type
-        matching_forms = [f for f in available_forms if entity_type.lower() in f.lower()]
+    @classmethod
+    def get_registry(cls) -> TemplateRegistry:
+        """Returns the template index, building it on first use."""
+        if cls._registry is None:
+            cls._registry = TemplateRegistry(cls.TEMPLATE_DIR)
+            cls._registry.build()
+        return cls._registry
 
-        if not matching_forms:
-            raise FileNotFoundError(f"No form template found for {entity_type} in {state}")
+    @staticmethod
+    def get_state_form(entity_type: str, state: str) -> TemplateMetadata:
+        return StateFormManager.get_registry().get(entity_type, state)
 
-        # Use the first matching form
-        return os.path.join(state_dir, matching_forms[0])
+    @staticmethod
+    def get_state_form_path(entity_type: str, state: str) -> str:
+        return StateFormManager.get_state_form(entity_type, state).path
 
 
 class PDFFormFillerAPI:
@@ -848,21 +907,75 @@ class PDFFormFillerAPI:
         # Enforce HTTPS redirection on this app instance as well
         self.app.add_middleware(HTTPSRedirectMiddleware)
 
+        self.mapping_cache = FieldMappingCache()
+        self.ocr_cache = OCRResultCache()
+        # Vision labels per template; extracted once, in the background, the first time a template is filled
+        self.label_store = FieldLabelStore()
+        self.label_tasks: Dict[str, asyncio.Task] = {}
+        self.warmup_tasks = []
+        # Status of items submitted through the batch endpoint in "jobs" mode, kept BATCH_JOB_TTL_SECONDS
+        # after they finish; in memory only, so a restart forgets them (use /api/jobs for durable jobs)
+        self.batch_jobs: Dict[str, Dict[str, Any]] = {}
+        self.batch_tasks = set()
+        # Persistent queue behind /api/jobs; workers start with the app
+        self.job_queue = JobQueue()
+        self.job_workers = JobWorkerPool(self.job_queue, self.run_queued_job)
+
         self.setup_routes()
 
     def setup_routes(self):
+        @self.app.on_event("startup")
+        async def startup():
+            # Only the serving process builds the index and spawns workers;
+            # spawned workers re-import this module and must not do either.
+            StateFormManager.get_registry()
+
+            register_engine_pool("standard_agent", create_standard_agent, AGENT_POOL_SIZE)
+            register_engine_pool("ocr_agent", create_ocr_agent, AGENT_POOL_SIZE)
+            if WORKER_POOL_ENABLED:
+                # OCR workers load their own PaddleOCR once, at process start
+                worker_pool = configure_worker_pool(initializers={"ocr": warm_ocr_worker})
+                self.warmup_tasks.append(asyncio.create_task(worker_pool.prestart()))
+            else:
+                register_engine_pool("paddle_ocr", create_ocr_reader, OCR_ENGINE_POOL_SIZE)
+            # Warm in the background; /api/health reports readiness
+            self.warmup_tasks.append(asyncio.create_task(warm_engine_pools()))
+            self.job_workers.start()
+
+        @self.app.on_event("shutdown")
+        async def shutdown():
+            # Jobs cut off here are still "processing" and get re-queued on the next start
+            await self.job_workers.stop()
+            shutdown_worker_pool()
+
+        @self.app.get("/api/health")
+        async def health():
+            engines = engine_pools_health()
+            worker_pool = get_worker_pool()
+            workers = worker_pool.health() if worker_pool else {}
+            ready = (all(engine["ready"] for engine in engines.values()) and
+                     all(stage["ready"] for stage in workers.values()))
+            return JSONResponse(
+                status_code=200 if ready else 503,
+                content={"status": "ready" if ready else "warming", "engines": engines, "workers": workers,
+                         "api_keys": get_key_pool().metrics(), "job_queue": self.job_workers.health(),
+                         "labels": self.label_store.stats()}
+            )
+
         @self.app.post("/api/process-form", response_model=FormResponse)
         async def process_form(
                 pdf_file: Optional[UploadFile] = File(None),
                 form_data: str = Form(...),
                 force_ocr: bool = Form(False),
                 return_json: bool = Form(False),
+                persist: bool = Form(PERSIST_FILLED_FORMS),
                 background_tasks: BackgroundTasks = BackgroundTasks()
         ):
+            input_path: PdfSource = ""
             temp_input_path = ""
-            output_path = ""
             permanent_path = ""
             selected_template = None
+            template = None
 
             try:
                 json_data = json.loads(form_data)
@@ -875,16 +988,14 @@ class PDFFormFillerAPI:
                 if entity_type and state:
                     try:
                         # Try to get state form based on entity type and state
-                        state_form_path = StateFormManager.get_state_form_path(entity_type, state)
-                        selected_template = os.path.basename(state_form_path)
+                        template = StateFormManager.get_state_form(entity_type, state)
+                        state_form_path = template.path
+                        selected_template = template.filename
 
                         print(f"Using state form template: {state_form_path} for {entity_type} in {state}")
 
-                        # Use state form as input file
-                        temp_input_path = TemporaryFileManager.generate_unique_filename(
-                            prefix="temp_input_", extension=".pdf"
-                        )
-                        shutil.copy2(state_form_path, temp_input_path)
+                        # Templates are only read by the fillers, so no working copy is needed
+                        input_path = state_form_path
                     except FileNotFoundError as e:
                         print(f"State form error: {e}")
                         # If uploaded file is available, use it as fallback
@@ -895,38 +1006,35 @@ class PDFFormFillerAPI:
                                 f"No state form template found for {entity_type} in {state} and no file was uploaded")
 
                 # If no entity_type/state or form wasn't found, use uploaded file
-                if not temp_input_path and pdf_file:
+                if not input_path and pdf_file:
                     print(f"Processing uploaded file: filename={pdf_file.filename}, force_ocr={force_ocr}")
 
-                    temp_input_path = TemporaryFileManager.generate_unique_filename(
-                        prefix="temp_input_", extension=".pdf"
-                    )
-
-                    with open(temp_input_path, "wb") as f:
-                        content = await pdf_file.read()
-                        f.write(content)
-
-                # Create output path
-                output_path = TemporaryFileManager.generate_unique_filename(
-                    prefix="filled_", extension=".pdf"
-                )
+                    # Small uploads stay in memory and are opened by fitz from the buffer
+                    input_path, temp_input_path = await TemporaryFileManager.spool_upload(pdf_file)
 
                 # Process the file
-                needs_ocr, fields = await PDFProcessingService.analyze_form_fields(temp_input_path)
+                if template is None:
+                    template = await PDFProcessingService.load_template(input_path)
+                needs_ocr, fields = await PDFProcessingService.analyze_form_fields(input_path, template)
                 final_ocr_decision = needs_ocr or force_ocr
 
-                form_filler = OCRFormFiller() if final_ocr_decision else StandardFormFiller()
-                result = await form_filler.match_and_fill_fields(temp_input_path, json_data, output_path)
+                # Fill in memory; the output is written once, straight to filled_forms
+                output_bytes, cache_hit, degraded = await self.fill_single(input_path, json_data, template,
+                                                                           final_ocr_decision)
 
-                if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+                if not output_bytes:
                     raise ValueError("Failed to generate filled PDF")
 
-                os.makedirs("filled_forms", exist_ok=True)
-                permanent_path = os.path.join(
-                    "filled_forms",
-                    TemporaryFileManager.generate_unique_filename(prefix="filled_", extension=".pdf")
-                )
-                shutil.copy2(output_path, permanent_path)
+                if persist or return_json:
+                    permanent_path = os.path.join(
+                        "filled_forms",
+                        TemporaryFileManager.generate_unique_filename(prefix="filled_", extension=".pdf")
+                    )
+                    if return_json:
+                        # The JSON response points at the file, so it has to exist before we reply
+                        await asyncio.to_thread(TemporaryFileManager.write_file, permanent_path, output_bytes)
+                    else:
+                        background_tasks.add_task(TemporaryFileManager.write_file, permanent_path, output_bytes)
 
                 # Get output filename from JSON if available, otherwise use default naming
                 output_filename = json_data.get("filename", None)
@@ -946,7 +1054,8 @@ class PDFFormFillerAPI:
                 if not output_filename.lower().endswith('.pdf'):
                     output_filename += '.pdf'
 
-                print(f"Form successfully filled: output={permanent_path}, filename={output_filename}")
+                print(f"Form successfully filled: output={permanent_path or 'not persisted'}, filename={output_filename}, "
+                      f"cache_hit={cache_hit}, degraded={degraded}")
 
                 field_matches = [
                     FieldMatch(
@@ -958,8 +1067,8 @@ class PDFFormFillerAPI:
                     )
                 ]
 
-                background_tasks.add_task(TemporaryFileManager.cleanup_file, temp_input_path)
-                background_tasks.add_task(TemporaryFileManager.cleanup_file, output_path)
+                if temp_input_path:
+                    background_tasks.add_task(TemporaryFileManager.cleanup_file, temp_input_path)
 
                 if return_json:
                     return FormResponse(
@@ -967,13 +1076,21 @@ class PDFFormFillerAPI:
                         message="Form processed successfully",
                         requires_ocr=final_ocr_decision,
                         file_path=permanent_path,
-                        field_matches=field_matches
+                        field_matches=field_matches,
+                        cache_hit=cache_hit,
+                        degraded=degraded
                     )
                 else:
-                    return FileResponse(
-                        path=permanent_path,
-                        filename=output_filename,
-                        media_type="application/pdf"
+                    return StreamingResponse(
+                        TemporaryFileManager.iter_chunks(output_bytes),
+                        media_type="application/pdf",
+                        headers={
+                            "Content-Disposition": f'attachment; filename="{output_filename}"',
+                            "Content-Length": str(len(output_bytes)),
+                            "X-Mapping-Cache": "hit" if cache_hit else "miss",
+                            "X-LLM-Degraded": "true" if degraded else "false"
+                        },
+                        background=background_tasks
                     )
 
             except Exception as e:
@@ -981,12 +1098,351 @@ class PDFFormFillerAPI:
                 print(f"Form processing error: {error_msg}")
 
                 # Clean up any temporary files
-                for path in [temp_input_path, output_path]:
+                for path in [temp_input_path]:
                     if path and os.path.exists(path):
                         background_tasks.add_task(TemporaryFileManager.cleanup_file, path)
 
                 raise HTTPException(status_code=500, detail={"error": error_msg})
 
+        @self.app.post("/api/process-forms/batch")
+        async def process_forms_batch(
+                pdf_file: Optional[UploadFile] = File(None),
+                form_data: str = Form(...),
+                force_ocr: bool = Form(False),
+                response_mode: str = Form("zip"),
+                max_concurrency: int = Form(BATCH_MATCH_CONCURRENCY),
+                background_tasks: BackgroundTasks = BackgroundTasks()
+        ):
+            """Fills N payloads against one template: one extraction, N mapping and fill steps.
+
+            form_data is either a JSON list of payloads or an object with "items"
+            (and optionally "entity_type"/"state"). response_mode "zip" streams
+            a ZIP of the filled PDFs; "jobs" returns one job ID per item.
+            """
+            temp_input_path = ""
+            try:
+                batch = json.loads(form_data)
+                payloads = batch if isinstance(batch, list) else batch.get("items", [])
+                if not payloads:
+                    raise ValueError("form_data must contain at least one payload")
+                if len(payloads) > BATCH_MAX_ITEMS:
+                    raise ValueError(f"Batch size {len(payloads)} exceeds the limit of {BATCH_MAX_ITEMS}")
+                if response_mode not in ("zip", "jobs"):
+                    raise ValueError("response_mode must be 'zip' or 'jobs'")
+
+                defaults = batch if isinstance(batch, dict) else payloads[0]
+                entity_type = defaults.get("entity_type")
+                state = defaults.get("state")
+
+                input_path: PdfSource = ""
+                template = None
+                if entity_type and state:
+                    try:
+                        template = StateFormManager.get_state_form(entity_type, state)
+                        input_path = template.path
+                    except FileNotFoundError as e:
+                        print(f"State form error: {e}")
+                        if not pdf_file:
+                            raise ValueError(
+                                f"No state form template found for {entity_type} in {state} and no file was uploaded")
+                if not input_path:
+                    if not pdf_file:
+                        raise ValueError("Either entity_type/state or a PDF upload is required")
+                    input_path, temp_input_path = await TemporaryFileManager.spool_upload(pdf_file)
+                    template = await PDFProcessingService.load_template(input_path)
+
+                needs_ocr, _ = await PDFProcessingService.analyze_form_fields(input_path, template)
+                use_ocr = needs_ocr or force_ocr
+                base_name = template.filename if template and template.filename else "form.pdf"
+                filenames = [f"{i:04d}_filled_{base_name}" for i in range(len(payloads))]
+
+                if response_mode == "jobs":
+                    self.prune_batch_jobs()
+                    batch_id = str(uuid.uuid4())
+                    job_ids = [str(uuid.uuid4()) for _ in payloads]
+                    for job_id in job_ids:
+                        self.batch_jobs[job_id] = {"batch_id": batch_id, "status": "pending"}
+                    task = asyncio.create_task(self.run_batch_jobs(
+                        input_path, payloads, template, use_ocr, max_concurrency, job_ids, temp_input_path))
+                    # Keep a reference so the task isn't garbage collected mid-run
+                    self.batch_tasks.add(task)
+                    task.add_done_callback(self.batch_tasks.discard)
+                    return JSONResponse(status_code=202, content={
+                        "batch_id": batch_id,
+                        "requires_ocr": use_ocr,
+                        "jobs": [{"index": i, "job_id": job_id} for i, job_id in enumerate(job_ids)]
+                    })
+
+                results = await self.run_batch(input_path, payloads, template, use_ocr, max_concurrency)
+                if temp_input_path:
+                    background_tasks.add_task(TemporaryFileManager.cleanup_file, temp_input_path)
+
+                archive = build_results_zip(results, filenames)
+                succeeded = sum(1 for result in results if result.success)
+                print(f"Batch filled: {succeeded}/{len(results)} succeeded, requires_ocr={use_ocr}")
+                return StreamingResponse(
+                    TemporaryFileManager.iter_chunks(archive),
+                    media_type="application/zip",
+                    headers={
+                        "Content-Disposition": f'attachment; filename="filled_batch_{uuid.uuid4()}.zip"',
+                        "Content-Length": str(len(archive)),
+                        "X-Batch-Succeeded": str(succeeded),
+                        "X-Batch-Failed": str(len(results) - succeeded)
+                    },
+                    background=background_tasks
+                )
+
+            except Exception as e:
+                error_msg = str(e)
+                print(f"Batch processing error: {error_msg}")
+                if temp_input_path:
+                    background_tasks.add_task(TemporaryFileManager.cleanup_file, temp_input_path)
+                raise HTTPException(status_code=500, detail={"error": error_msg})
+
+        @self.app.post("/api/jobs")
+        async def submit_job(
+                pdf_file: Optional[UploadFile] = File(None),
+                form_data: str = Form(...),
+                force_ocr: bool = Form(False),
+                priority: int = Form(0),
+                dedup_key: Optional[str] = Form(None),
+                callback_url: Optional[str] = Form(None)
+        ):
+            """Queues a fill and returns its job ID at once.
+
+            Higher priority jobs run first. A dedup_key that matches a queued,
+            running or completed job returns that job instead of adding one.
+            When callback_url is set the outcome is POSTed there as JSON.
+            """
+            input_file = ""
+            try:
+                json_data = json.loads(form_data)
+                if not (json_data.get("entity_type") and json_data.get("state")) and not pdf_file:
+                    raise ValueError("Either entity_type/state or a PDF upload is required")
+
+                if pdf_file:
+                    # The upload has to outlive this request (and a restart), so it always goes to disk
+                    input_file = os.path.join(
+                        DEFAULT_JOB_INPUT_DIR,
+                        TemporaryFileManager.generate_unique_filename(prefix="job_input_", extension=".pdf")
+                    )
+                    data, temp_path = await TemporaryFileManager.spool_upload(pdf_file)
+                    if temp_path:
+                        os.makedirs(DEFAULT_JOB_INPUT_DIR, exist_ok=True)
+                        await asyncio.to_thread(shutil.move, temp_path, input_file)
+                    else:
+                        await asyncio.to_thread(TemporaryFileManager.write_file, input_file, data)
+
+                payload = {"form_data": json_data, "input_file": input_file, "force_ocr": force_ocr,
+                           "filename": pdf_file.filename if pdf_file else None}
+                job, created = await asyncio.to_thread(
+                    self.job_queue.enqueue, payload, priority, dedup_key, callback_url)
+            except Exception as e:
+                if input_file:
+                    TemporaryFileManager.cleanup_file(input_file)
+                print(f"Job submission error: {e}")
+                raise HTTPException(status_code=400, detail={"error": str(e)})
+
+            if not created:
+                if input_file:
+                    TemporaryFileManager.cleanup_file(input_file)
+                print(f"Job deduplicated onto {job['job_id']} (dedup_key={dedup_key})")
+            else:
+                self.job_workers.notify()
+            return JSONResponse(status_code=202, content={
+                "job_id": job["job_id"],
+                "status": job["status"],
+                "deduplicated": not created
+            })
+
+        @self.app.get("/api/jobs/{job_id}")
+        async def job_status(job_id: str):
+            # SQLite reads run in a thread, like the worker pool's queue calls
+            job = await asyncio.to_thread(self.job_queue.get, job_id)
+            if job is None:
+                raise HTTPException(status_code=404, detail={"error": f"Unknown job: {job_id}"})
+            queue_position = await asyncio.to_thread(self.job_queue.position, job_id)
+            return {
+                "job_id": job_id,
+                "status": job["status"],
+                "priority": job["priority"],
+                "queue_position": queue_position,
+                "attempts": job["attempts"],
+                "result": job["result"],
+                "error": job["error"],
+                "callback_status": job["callback_status"],
+                "created_at": job["created_at"],
+                "started_at": job["started_at"],
+                "finished_at": job["finished_at"]
+            }
+
+        @self.app.get("/api/jobs/{job_id}/result")
+        async def job_result(job_id: str):
+            job = await asyncio.to_thread(self.job_queue.get, job_id)
+            if job is None:
+                raise HTTPException(status_code=404, detail={"error": f"Unknown job: {job_id}"})
+            if job["status"] != "completed":
+                raise HTTPException(status_code=409, detail={"error": f"Job is {job['status']}"})
+            result = job["result"]
+            return FileResponse(result["file_path"], media_type="application/pdf", filename=result["filename"])
+
+        @self.app.get("/api/process-forms/batch/jobs/{job_id}")
+        async def batch_job_status(job_id: str):
+            self.prune_batch_jobs()
+            job = self.batch_jobs.get(job_id)
+            if job is None:
+                raise HTTPException(status_code=404, detail={"error": f"Unknown job: {job_id}"})
+            return {"job_id": job_id, **job}
+
+    def prune_batch_jobs(self) -> None:
+        """Drops batch job entries that finished more than BATCH_JOB_TTL_SECONDS ago."""
+        cutoff = time.time() - BATCH_JOB_TTL_SECONDS
+        expired = [job_id for job_id, job in self.batch_jobs.items()
+                   if job.get("finished_at") is not None and job["finished_at"] < cutoff]
+        for job_id in expired:
+            del self.batch_jobs[job_id]
+        if expired:
+            print(f"🧹 Forgot {len(expired)} expired batch jobs")
+
+    def schedule_label_extraction(self, template: Optional[TemplateMetadata]) -> None:
+        """Starts vision label extraction for a stored template the store hasn't seen; the current fill doesn't wait.
+
+        Only registry templates qualify: uploads (spooled or queued) are read
+        from files that are deleted as soon as the fill ends. An upload of a
+        registered form is extracted from the registry's copy.
+        """
+        if not LABEL_EXTRACT_ON_FIRST_SIGHT or template is None:
+            return
+        template = StateFormManager.get_registry().get_by_hash(template.content_hash)
+        if template is None or not template.path:
+            return
+        template_hash = template.content_hash
+        if template_hash in self.label_tasks or self.label_store.has(template_hash):
+            return
+
+        async def extract():
+            try:
+                await extract_template_labels(template.path, self.label_store, template_hash)
+            except Exception as e:
+                print(f"⚠️ Label extraction failed for {template.filename}: {e}")
+            finally:
+                self.label_tasks.pop(template_hash, None)
+
+        print(f"🏷️ First fill of {template.filename}; extracting field labels in the background")
+        self.label_tasks[template_hash] = asyncio.create_task(extract())
+
+    async def fill_single(self, input_path: PdfSource, json_data: Dict[str, Any],
+                          template: Optional[TemplateMetadata], use_ocr: bool) -> Tuple[bytes, bool, bool]:
+        """Fills one payload with pooled engines.
+
+        Returns the PDF bytes, whether the mapping cache hit and whether the
+        fill is degraded (local matches only, the LLM circuit being open).
+        """
+        self.schedule_label_extraction(template)
+        async with AsyncExitStack() as engines:
+            if use_ocr:
+                agent = await engines.enter_async_context(get_engine_pool("ocr_agent").checkout())
+                ocr_reader = None
+                if get_worker_pool() is None:
+                    ocr_reader = await engines.enter_async_context(get_engine_pool("paddle_ocr").checkout())
+                form_filler = OCRFormFiller(agent=agent, ocr_reader=ocr_reader, ocr_cache=self.ocr_cache,
+                                            label_store=self.label_store)
+            else:
+                agent = await engines.enter_async_context(get_engine_pool("standard_agent").checkout())
+                form_filler = StandardFormFiller(agent=agent, label_store=self.label_store)
+
+            await form_filler.match_and_fill_fields(
+                input_path, json_data, None,
+                mapping_cache=self.mapping_cache, template=template
+            )
+            return form_filler.output_bytes, form_filler.cache_hit, form_filler.degraded
+
+    async def run_queued_job(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Job queue handler: resolves the template like /api/process-form and persists the filled PDF."""
+        payload = job["payload"]
+        json_data = payload["form_data"]
+        input_file = payload.get("input_file") or ""
+        entity_type = json_data.get("entity_type")
+        state = json_data.get("state")
+
+        input_path: PdfSource = ""
+        template = None
+        if entity_type and state:
+            try:
+                template = StateFormManager.get_state_form(entity_type, state)
+                input_path = template.path
+            except FileNotFoundError as e:
+                print(f"State form error: {e}")
+        if not input_path:
+            if not input_file or not os.path.exists(input_file):
+                raise ValueError(f"No state form template found for {entity_type} in {state} and no file was uploaded")
+            input_path = input_file
+            template = await PDFProcessingService.load_template(input_path)
+
+        # The upload is removed by the worker pool once the job's outcome is recorded
+        needs_ocr, _ = await PDFProcessingService.analyze_form_fields(input_path, template)
+        use_ocr = needs_ocr or payload.get("force_ocr", False)
+        output_bytes, cache_hit, degraded = await self.fill_single(input_path, json_data, template, use_ocr)
+        if not output_bytes:
+            raise ValueError("Failed to generate filled PDF")
+
+        file_path = os.path.join("filled_forms", f"filled_{job['job_id']}.pdf")
+        await asyncio.to_thread(TemporaryFileManager.write_file, file_path, output_bytes)
+
+        filename = json_data.get("filename") or (
+            f"filled_{template.filename}" if template and template.filename else f"filled_{payload.get('filename') or 'form.pdf'}")
+        if not filename.lower().endswith('.pdf'):
+            filename += '.pdf'
+        return {"file_path": file_path, "filename": filename, "requires_ocr": use_ocr, "cache_hit": cache_hit,
+                "degraded": degraded}
+
+    async def run_batch(self, input_path: PdfSource, payloads: List[Dict[str, Any]],
+                        template: Optional[TemplateMetadata], use_ocr: bool,
+                        max_concurrency: int) -> List[BatchItemResult]:
+        """Checks out one pooled agent (and OCR reader if needed) for the whole batch."""
+        self.schedule_label_extraction(template)
+        async with AsyncExitStack() as engines:
+            if use_ocr:
+                agent = await engines.enter_async_context(get_engine_pool("ocr_agent").checkout())
+                ocr_reader = None
+                if get_worker_pool() is None:
+                    ocr_reader = await engines.enter_async_context(get_engine_pool("paddle_ocr").checkout())
+                form_filler = OCRFormFiller(agent=agent, ocr_reader=ocr_reader, ocr_cache=self.ocr_cache,
+                                            label_store=self.label_store)
+            else:
+                agent = await engines.enter_async_context(get_engine_pool("standard_agent").checkout())
+                form_filler = StandardFormFiller(agent=agent, label_store=self.label_store)
+
+            batch_filler = BatchFormFiller(form_filler, self.mapping_cache, max_concurrency)
+            return await batch_filler.run(input_path, payloads, template)
+
+    async def run_batch_jobs(self, input_path: PdfSource, payloads: List[Dict[str, Any]],
+                             template: Optional[TemplateMetadata], use_ocr: bool, max_concurrency: int,
+                             job_ids: List[str], temp_input_path: str = ""):
+        """Background variant of a batch: each item's PDF is persisted and its job entry updated."""
+        for job_id in job_ids:
+            self.batch_jobs[job_id]["status"] = "processing"
+        try:
+            results = await self.run_batch(input_path, payloads, template, use_ocr, max_concurrency)
+            for result, job_id in zip(results, job_ids):
+                job = self.batch_jobs[job_id]
+                if not result.success:
+                    job.update(status="failed", error=result.error, finished_at=time.time())
+                    continue
+                file_path = os.path.join("filled_forms", f"filled_{job_id}.pdf")
+                await asyncio.to_thread(TemporaryFileManager.write_file, file_path, result.output_bytes)
+                job.update(status="completed", file_path=file_path, cache_hit=result.cache_hit,
+                           degraded=result.degraded, finished_at=time.time())
+        except Exception as e:
+            print(f"Batch job error: {e}")
+            for job_id in job_ids:
+                job = self.batch_jobs.get(job_id)
+                if job is not None and job.get("finished_at") is None:
+                    job.update(status="failed", error=str(e), finished_at=time.time())
+        finally:
+            if temp_input_path:
+                TemporaryFileManager.cleanup_file(temp_input_path)
+
     def get_app(self):
         return self.app
 
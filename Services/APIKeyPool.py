@@ -0,0 +1,248 @@
+import asyncio
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Any, List, Callable, Optional, Tuple
+
+from Common.constants import API_KEY_1, API_KEY_2, API_KEY_3, API_KEY_4, API_KEY_5
+from Services.LLMCaller import CircuitBreaker, CircuitOpenError, get_circuit_breaker, is_rate_limit_error
+
+# Per-key request budget; bursts up to the full minute's allowance are allowed
+GEMINI_KEY_RPM = float(os.environ.get("GEMINI_KEY_RPM", 15))
+# First cool-down after a 429, doubled for each consecutive one up to the max
+KEY_COOLDOWN_SECONDS = float(os.environ.get("KEY_COOLDOWN_SECONDS", 20))
+KEY_COOLDOWN_MAX_SECONDS = float(os.environ.get("KEY_COOLDOWN_MAX_SECONDS", 300))
+
+
+def configured_keys() -> List[str]:
+    """GEMINI_API_KEYS (comma separated) if set, otherwise API_KEY_1..5, without duplicates."""
+    env_keys = [k.strip() for k in os.environ.get("GEMINI_API_KEYS", "").split(",") if k.strip()]
+    keys = env_keys or [API_KEY_1, API_KEY_2, API_KEY_3, API_KEY_4, API_KEY_5]
+    return list(dict.fromkeys(k for k in keys if k))
+
+
+@dataclass
+class KeyState:
+    key: str
+    label: str
+    tokens: float
+    refilled_at: float
+    cooldown_until: float = 0.0
+    consecutive_rate_limits: int = 0
+    in_flight: int = 0
+    requests: int = 0
+    successes: int = 0
+    rate_limited: int = 0
+    errors: int = 0
+
+    def metrics(self, now: float) -> Dict[str, Any]:
+        return {
+            "key": self.label,
+            "requests": self.requests,
+            "successes": self.successes,
+            "rate_limited": self.rate_limited,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "tokens": round(self.tokens, 2),
+            "cooling_down_for": round(max(0.0, self.cooldown_until - now), 1)
+        }
+
+
+class APIKeyPool:
+    """Spreads Gemini calls across every configured API key.
+
+    Each key has a token bucket refilled at ``rpm`` per minute. acquire()
+    hands out the available key with the most tokens left (fewest calls in
+    flight on a tie) and waits when all of them are empty or cooling down.
+    A 429 puts the key on an exponentially growing cool-down. State is kept
+    under a lock, so event loops in other threads can share the pool.
+    """
+
+    def __init__(self, keys: Optional[List[str]] = None, rpm: float = GEMINI_KEY_RPM,
+                 cooldown_seconds: float = KEY_COOLDOWN_SECONDS,
+                 max_cooldown_seconds: float = KEY_COOLDOWN_MAX_SECONDS):
+        self.rpm = rpm
+        self.cooldown_seconds = cooldown_seconds
+        self.max_cooldown_seconds = max_cooldown_seconds
+        self._lock = threading.Lock()
+        self._keys: Dict[str, KeyState] = {}
+        for key in keys if keys is not None else configured_keys():
+            self.add_key(key)
+
+    def add_key(self, key: str) -> None:
+        if not key:
+            return
+        with self._lock:
+            if key not in self._keys:
+                label = f"key_{len(self._keys) + 1}…{key[-4:]}"
+                self._keys[key] = KeyState(key=key, label=label, tokens=self.rpm, refilled_at=time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _refill(self, state: KeyState, now: float) -> None:
+        state.tokens = min(self.rpm, state.tokens + (now - state.refilled_at) * self.rpm / 60.0)
+        state.refilled_at = now
+
+    def try_acquire(self, admit: Optional[Callable[[str], bool]] = None) -> Tuple[Optional[str], float]:
+        """Takes a token from the best available key, or returns how long to wait for one.
+
+        admit, if given, is asked about ready keys in order of preference
+        (under the pool lock) and can refuse one, e.g. while its circuit is
+        open. When it refuses every key, CircuitOpenError is raised.
+        """
+        with self._lock:
+            if not self._keys:
+                raise RuntimeError("No Gemini API keys configured")
+            now = time.monotonic()
+            ready, wait = [], float("inf")
+            for state in self._keys.values():
+                self._refill(state, now)
+                if state.cooldown_until > now:
+                    wait = min(wait, state.cooldown_until - now)
+                elif state.tokens >= 1:
+                    ready.append(state)
+                else:
+                    wait = min(wait, (1 - state.tokens) * 60.0 / self.rpm)
+            ready.sort(key=lambda state: (-state.tokens, state.in_flight))
+            best, refused = None, 0
+            for state in ready:
+                if admit is None or admit(state.key):
+                    best = state
+                    break
+                refused += 1
+            if best is None:
+                if refused == len(self._keys):
+                    raise CircuitOpenError("Circuits for every API key are open")
+                return None, max(wait, 0.05)
+            best.tokens -= 1
+            best.in_flight += 1
+            best.requests += 1
+            return best.key, 0.0
+
+    async def acquire(self, admit: Optional[Callable[[str], bool]] = None) -> str:
+        while True:
+            key, wait = self.try_acquire(admit)
+            if key:
+                return key
+            await asyncio.sleep(wait)
+
+    def report_success(self, key: str) -> None:
+        with self._lock:
+            state = self._keys[key]
+            state.in_flight -= 1
+            state.successes += 1
+            state.consecutive_rate_limits = 0
+
+    def circuit_breaker(self, name: str, key: str) -> CircuitBreaker:
+        """The breaker for calls named name (usually the model) on one key."""
+        return get_circuit_breaker(f"{name}:{self._keys[key].label}")
+
+    def report_failure(self, key: str, error: BaseException) -> None:
+        """Records a failed call; rate limits put the key on cool-down."""
+        with self._lock:
+            state = self._keys[key]
+            state.in_flight -= 1
+            if not is_rate_limit_error(error):
+                state.errors += 1
+                return
+            state.rate_limited += 1
+            state.consecutive_rate_limits += 1
+            cooldown = min(self.max_cooldown_seconds,
+                           self.cooldown_seconds * 2 ** (state.consecutive_rate_limits - 1))
+            state.cooldown_until = time.monotonic() + cooldown
+            state.tokens = 0.0
+        print(f"🧊 {state.label} rate limited; cooling down for {cooldown:.0f}s")
+
+    def metrics(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            now = time.monotonic()
+            for state in self._keys.values():
+                self._refill(state, now)
+            return [state.metrics(now) for state in self._keys.values()]
+
+    async def call(self, fn: Callable[[str], Any], circuit: Optional[str] = None) -> Any:
+        """Awaits fn(key) with a pooled key and reports the outcome.
+
+        With a circuit name, keys whose breaker for that name is open are
+        skipped and the outcome is recorded on the chosen key's breaker.
+        """
+        admit = (lambda key: self.circuit_breaker(circuit, key).allow()) if circuit else None
+        key = await self.acquire(admit)
+        try:
+            result = await fn(key)
+        except Exception as e:
+            self.report_failure(key, e)
+            if circuit:
+                self.circuit_breaker(circuit, key).record_failure()
+            raise
+        self.report_success(key)
+        if circuit:
+            self.circuit_breaker(circuit, key).record_success()
+        return result
+
+
+_pool: Optional[APIKeyPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_key_pool() -> APIKeyPool:
+    """The process-wide pool over the configured keys."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = APIKeyPool()
+            print(f"🔑 API key pool with {len(_pool)} keys at {GEMINI_KEY_RPM:.0f} RPM each")
+        return _pool
+
+
+class PooledAgent:
+    """Drop-in for an Agent whose run() goes out on a pooled key.
+
+    One Agent per key is built lazily by ``factory(api_key)``; each call
+    takes a key from the pool, so a 429 on one key sends the retry to another.
+    Each key has its own circuit breaker under ``name`` (the model), which
+    LLMCaller uses instead of its own.
+    """
+
+    per_key_circuits = True
+
+    def __init__(self, factory: Callable[[str], Any], pool: Optional[APIKeyPool] = None, name: str = "agent"):
+        self.factory = factory
+        self.pool = pool or get_key_pool()
+        self.name = name
+        self._agents: Dict[str, Any] = {}
+
+    def agent_for(self, key: str) -> Any:
+        if key not in self._agents:
+            self._agents[key] = self.factory(key)
+        return self._agents[key]
+
+    async def run(self, prompt: Any, **kwargs) -> Any:
+        return await self.pool.call(lambda key: self.agent_for(key).run(prompt, **kwargs), circuit=self.name)
+
+
+def configure_genai(key: str):
+    """Points google.generativeai at a pooled key.
+
+    The library keeps one global client, so concurrent callers must issue
+    their request right after configuring, without yielding in between.
+    """
+    import google.generativeai as genai
+    genai.configure(api_key=key)
+    return genai
+
+
+async def generate_content_pooled(model_name: str, contents: Any, pool: Optional[APIKeyPool] = None,
+                                  **kwargs) -> Any:
+    """GenerativeModel.generate_content_async on a pooled key."""
+    pool = pool or get_key_pool()
+
+    async def call(key: str):
+        genai = configure_genai(key)
+        # The async client is bound when the call starts, before anything else can reconfigure
+        return await genai.GenerativeModel(model_name).generate_content_async(contents, **kwargs)
+
+    return await pool.call(call)
+
@@ -0,0 +1,140 @@
+import asyncio
+import io
+import json
+import os
+import zipfile
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Tuple
+
+from Common.pdf_source import PdfSource
+from Services.MappingCache import FieldMappingCache
+from Services.TemplateRegistry import TemplateMetadata
+
+# Concurrent agent calls per batch, overridable through the environment
+BATCH_MATCH_CONCURRENCY = int(os.environ.get("BATCH_MATCH_CONCURRENCY", 4))
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", 500))
+
+
+@dataclass
+class BatchItemResult:
+    index: int
+    success: bool
+    cache_hit: bool = False
+    # Filled from local matches only while the agent's circuit was open
+    degraded: bool = False
+    output_bytes: Optional[bytes] = None
+    error: Optional[str] = None
+
+    def summary(self) -> Dict[str, Any]:
+        return {"index": self.index, "success": self.success, "cache_hit": self.cache_hit,
+                "degraded": self.degraded, "error": self.error}
+
+
+class BatchFormFiller:
+    """Fills many payloads against one template with a single extraction.
+
+    Fields (and, for the OCR filler, OCR plus field context) are prepared
+    once. Payloads are grouped by the key signature of their flattened JSON:
+    every payload in a group has the same shape, so one agent call maps the
+    whole group and the rest reuse that mapping through the mapping cache
+    with their own values. Agent calls across groups are bounded by a
+    semaphore; fills run in the worker pool's "fill" stage.
+    """
+
+    def __init__(self, form_filler, mapping_cache: Optional[FieldMappingCache] = None,
+                 max_concurrency: int = BATCH_MATCH_CONCURRENCY):
+        self.form_filler = form_filler
+        # A private in-memory cache still lets payloads of the same shape share one agent call
+        self.mapping_cache = mapping_cache or FieldMappingCache(":memory:")
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def run(self, pdf_path: PdfSource, payloads: List[Dict[str, Any]],
+                  template: Optional[TemplateMetadata] = None) -> List[BatchItemResult]:
+        prepared = await self.form_filler.prepare_template(pdf_path, template)
+        flat_payloads = [self.form_filler.flatten_json(payload) for payload in payloads]
+
+        groups: Dict[str, List[int]] = {}
+        for index, flat_json in enumerate(flat_payloads):
+            groups.setdefault(FieldMappingCache.key_signature(flat_json), []).append(index)
+        print(f"📦 Batch of {len(payloads)} payloads in {len(groups)} shape groups")
+
+        results: List[Optional[BatchItemResult]] = [None] * len(payloads)
+
+        async def fill_item(index: int, matches: List, cache_hit: bool, degraded: bool) -> None:
+            try:
+                output_bytes = await self.form_filler.fill_matches(prepared, matches)
+                results[index] = BatchItemResult(index=index, success=output_bytes is not None,
+                                                 cache_hit=cache_hit, degraded=degraded, output_bytes=output_bytes,
+                                                 error=None if output_bytes else "Failed to generate filled PDF")
+            except Exception as e:
+                results[index] = BatchItemResult(index=index, success=False, error=str(e))
+
+        def cached_matches(index: int) -> List:
+            return self.form_filler.lookup_cached_matches(self.mapping_cache, prepared, flat_payloads[index])
+
+        async def ask_agent(index: int) -> Tuple[List, bool]:
+            try:
+                async with self._semaphore:
+                    return await self.form_filler.match_payload(prepared, flat_payloads[index])
+            except Exception as e:
+                print(f"❌ Batch item {index} matching failed: {e}")
+                return [], False
+
+        async def process_item(index: int, matches: List, cache_hit: bool, degraded: bool = False) -> None:
+            if not matches:
+                results[index] = BatchItemResult(index=index, success=False, degraded=degraded,
+                                                 error="No valid field matches were found")
+                return
+            await fill_item(index, matches, cache_hit, degraded)
+
+        async def process_follower(index: int, leader_count: int) -> None:
+            matches = cached_matches(index)
+            if len(matches) < leader_count:
+                # The leader's mapping wasn't cached (transformed values, or degraded), so ask for this one
+                matches, degraded = await ask_agent(index)
+                await process_item(index, matches, False, degraded)
+            else:
+                await process_item(index, matches, True)
+
+        async def process_group(indices: List[int]) -> None:
+            leader, followers = indices[0], indices[1:]
+
+            matches = cached_matches(leader)
+            cache_hit, degraded = bool(matches), False
+            if not cache_hit:
+                matches, degraded = await ask_agent(leader)
+                # Local-only matches from an open circuit would outlive the outage in the cache
+                if matches and not degraded:
+                    leader_key = self.mapping_cache.build_key(prepared.template_hash, flat_payloads[leader])
+                    self.mapping_cache.store(leader_key, matches, flat_payloads[leader])
+
+            if not matches:
+                # Same shape, same prompt: the followers would fail the same way
+                for index in indices:
+                    await process_item(index, [], False, degraded)
+                return
+
+            await asyncio.gather(
+                process_item(leader, matches, cache_hit, degraded),
+                *(process_follower(index, len(matches)) for index in followers)
+            )
+
+        await asyncio.gather(*(process_group(indices) for indices in groups.values()))
+        return [result or BatchItemResult(index=i, success=False, error="Not processed")
+                for i, result in enumerate(results)]
+
+
+def build_results_zip(results: List[BatchItemResult], filenames: List[str]) -> bytes:
+    """Packs the filled PDFs plus a manifest.json of per-item outcomes."""
+    buffer = io.BytesIO()
+    # PDFs are already deflated; storing them avoids recompressing for no gain
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as archive:
+        manifest = []
+        for result in results:
+            entry = result.summary()
+            if result.success and result.output_bytes:
+                entry["filename"] = filenames[result.index]
+                archive.writestr(filenames[result.index], result.output_bytes)
+            manifest.append(entry)
+        archive.writestr("manifest.json", json.dumps(manifest, indent=2))
+    return buffer.getvalue()
@@ -0,0 +1,113 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Callable, Optional
+
+AGENT_POOL_SIZE = int(os.environ.get("AGENT_POOL_SIZE", 4))
+OCR_ENGINE_POOL_SIZE = int(os.environ.get("OCR_ENGINE_POOL_SIZE", 1))
+
+
+class EnginePool:
+    """Lazily initialised pool of expensive, reusable engines (PaddleOCR readers, Agents).
+
+    Handlers check an engine out for the duration of a request and return it
+    afterwards, so model weights are loaded at most ``size`` times per process.
+    Factories run in a thread because model loading blocks.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any], size: int):
+        self.name = name
+        self.size = size
+        self._factory = factory
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._created = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._last_error: Optional[str] = None
+        self._load_seconds: Optional[float] = None
+
+    async def _create(self) -> Any:
+        self._created += 1
+        start = time.perf_counter()
+        try:
+            engine = await asyncio.to_thread(self._factory)
+        except Exception as e:
+            self._created -= 1
+            self._last_error = str(e)
+            print(f"❌ Failed to initialise engine '{self.name}': {e}")
+            raise
+        self._load_seconds = time.perf_counter() - start
+        # A transient load failure shouldn't keep the pool unhealthy once an engine loads
+        self._last_error = None
+        print(f"✅ Engine '{self.name}' ready in {self._load_seconds:.2f}s ({self._created}/{self.size})")
+        return engine
+
+    async def acquire(self) -> Any:
+        try:
+            engine = self._idle.get_nowait()
+        except asyncio.QueueEmpty:
+            if self._created < self.size:
+                engine = await self._create()
+            else:
+                engine = await self._idle.get()
+        self._in_use += 1
+        self._checkouts += 1
+        return engine
+
+    def release(self, engine: Any) -> None:
+        self._in_use -= 1
+        self._idle.put_nowait(engine)
+
+    @asynccontextmanager
+    async def checkout(self):
+        engine = await self.acquire()
+        try:
+            yield engine
+        finally:
+            self.release(engine)
+
+    async def warm(self) -> None:
+        """Pre-loads every engine so the first requests don't pay the load cost."""
+        while self._created < self.size:
+            try:
+                self._idle.put_nowait(await self._create())
+            except Exception:
+                return
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "ready": self._created > 0 and self._last_error is None,
+            "size": self.size,
+            "created": self._created,
+            "idle": self._idle.qsize(),
+            "in_use": self._in_use,
+            "checkouts": self._checkouts,
+            "load_seconds": self._load_seconds,
+            "last_error": self._last_error
+        }
+
+
+_engine_pools: Dict[str, EnginePool] = {}
+
+
+def register_engine_pool(name: str, factory: Callable[[], Any], size: int) -> EnginePool:
+    """Registers a process-wide engine pool; re-registering a name returns the existing pool."""
+    if name not in _engine_pools:
+        _engine_pools[name] = EnginePool(name, factory, size)
+    return _engine_pools[name]
+
+
+def get_engine_pool(name: str) -> EnginePool:
+    if name not in _engine_pools:
+        raise KeyError(f"Engine pool not registered: {name}")
+    return _engine_pools[name]
+
+
+async def warm_engine_pools() -> None:
+    await asyncio.gather(*(pool.warm() for pool in _engine_pools.values()))
+
+
+def engine_pools_health() -> Dict[str, Dict[str, Any]]:
+    return {name: pool.health() for name, pool in _engine_pools.items()}
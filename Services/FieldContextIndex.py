@@ -0,0 +1,114 @@
+import os
+from typing import Dict, Any, List
+
+import numpy as np
+
+# Turn the Gemini field-context round-trip back on (the spatial index is used otherwise and as its fallback)
+FIELD_CONTEXT_LLM = os.environ.get("FIELD_CONTEXT_LLM", "0") == "1"
+FIELD_CONTEXT_NEIGHBOURS = int(os.environ.get("FIELD_CONTEXT_NEIGHBOURS", 3))
+
+# Largest gap (PDF points) at which text still counts as a neighbour, per direction
+MAX_GAP = {"left": 200.0, "right": 120.0, "above": 50.0, "below": 30.0}
+# Labels on forms sit mostly left of or above their widget
+DIRECTION_WEIGHT = {"left": 1.0, "above": 0.9, "right": 0.6, "below": 0.5}
+DIRECTIONS = ("left", "above", "right", "below")
+# Text this close to the widget's edge still counts as beside it (OCR boxes are loose)
+EDGE_TOLERANCE = 2.0
+DISTANCE_SCALE = 60.0
+
+
+class PageSpatialIndex:
+    """OCR boxes of one page as NumPy arrays, queried for many widgets at once.
+
+    Pages partition the elements, so each query is a dense
+    (widgets x elements) broadcast over a few hundred boxes at most.
+    """
+
+    def __init__(self, elements: List[Dict[str, Any]]):
+        self.elements = elements
+        self.boxes = np.array(
+            [[e["position"][k] for k in ("x1", "y1", "x2", "y2")] for e in elements],
+            dtype=np.float32
+        ).reshape(-1, 4)
+        self.confidence = np.array([e.get("confidence", 1.0) for e in elements], dtype=np.float32)
+
+    def neighbours(self, rects: np.ndarray, limit: int = FIELD_CONTEXT_NEIGHBOURS) -> List[List[Dict[str, Any]]]:
+        """Top `limit` scored neighbours for each widget rect (rows of x0, y0, x1, y1)."""
+        if not len(self.elements) or not len(rects):
+            return [[] for _ in range(len(rects))]
+
+        r = rects[:, None, :]
+        e = self.boxes[None, :, :]
+        gap_left = r[..., 0] - e[..., 2]    # widget x0 - text x2
+        gap_right = e[..., 0] - r[..., 2]   # text x0 - widget x1
+        gap_above = r[..., 1] - e[..., 3]   # widget y0 - text y2
+        gap_below = e[..., 1] - r[..., 3]   # text y0 - widget y1
+        overlap_y = np.minimum(r[..., 3], e[..., 3]) - np.maximum(r[..., 1], e[..., 1])
+        overlap_x = np.minimum(r[..., 2], e[..., 2]) - np.maximum(r[..., 0], e[..., 0])
+        # Text above a widget often starts at its left edge rather than overlapping it
+        aligned_x = (overlap_x > 0) | (np.abs(r[..., 0] - e[..., 0]) < MAX_GAP["left"])
+
+        gaps = np.stack([gap_left, gap_above, gap_right, gap_below])
+        beside = np.stack([overlap_y > 0, aligned_x, overlap_y > 0, overlap_x > 0])
+        max_gap = np.array([MAX_GAP[d] for d in DIRECTIONS], dtype=np.float32)[:, None, None]
+        weight = np.array([DIRECTION_WEIGHT[d] for d in DIRECTIONS], dtype=np.float32)[:, None, None]
+
+        valid = beside & (gaps >= -EDGE_TOLERANCE) & (gaps <= max_gap)
+        distance = np.clip(gaps, 0, None)
+        scores = np.where(
+            valid,
+            weight * np.exp(-distance / DISTANCE_SCALE) * (0.5 + 0.5 * self.confidence[None, None, :]),
+            0.0
+        )
+
+        # Best direction per (widget, element) pair, then the best elements per widget
+        direction = scores.argmax(axis=0)
+        best = scores.max(axis=0)
+        k = min(limit, best.shape[1])
+        top = np.argpartition(-best, k - 1, axis=1)[:, :k]
+
+        results = []
+        for row in range(best.shape[0]):
+            ranked = sorted(top[row], key=lambda col: -best[row, col])
+            nearby = []
+            for col in ranked:
+                if best[row, col] <= 0:
+                    continue
+                d = int(direction[row, col])
+                nearby.append({
+                    "text": self.elements[col]["text"],
+                    "position": DIRECTIONS[d],
+                    "distance": round(float(distance[d, row, col]), 1),
+                    "relevance_score": round(float(best[row, col]), 3)
+                })
+            results.append(nearby)
+        return results
+
+
+def build_field_context(pdf_fields: Dict[str, Dict[str, Any]], ocr_elements: List[Dict[str, Any]],
+                        limit: int = FIELD_CONTEXT_NEIGHBOURS) -> List[Dict[str, Any]]:
+    """Nearby OCR text for every widget, in the shape analyze_field_context returns."""
+    elements_by_page: Dict[int, List[Dict[str, Any]]] = {}
+    for element in ocr_elements:
+        elements_by_page.setdefault(element["page_num"], []).append(element)
+    fields_by_page: Dict[int, List[str]] = {}
+    for field_name, field_info in pdf_fields.items():
+        fields_by_page.setdefault(field_info["page_num"], []).append(field_name)
+
+    nearby_by_field: Dict[str, List[Dict[str, Any]]] = {}
+    for page_num, field_names in fields_by_page.items():
+        index = PageSpatialIndex(elements_by_page.get(page_num, []))
+        rects = np.array([pdf_fields[name]["rect"] for name in field_names], dtype=np.float32).reshape(-1, 4)
+        for field_name, nearby in zip(field_names, index.neighbours(rects, limit)):
+            nearby_by_field[field_name] = nearby
+
+    field_context = [
+        {
+            "field_name": field_name,
+            "page": field_info["page_num"] + 1,
+            "nearby_text": nearby_by_field.get(field_name, [])
+        } for field_name, field_info in pdf_fields.items()
+    ]
+    print(f"🧭 Field context from spatial index: {sum(1 for c in field_context if c['nearby_text'])}"
+          f"/{len(field_context)} fields have nearby text")
+    return field_context
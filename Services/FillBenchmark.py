@@ -0,0 +1,93 @@
+"""Benchmarks the batched widget fill engine against the old per-match widget scan.
+
+Usage:
+    python -m Services.FillBenchmark [--templates 3] [--iterations 5]
+
+Picks the templates in Services/*.pdf with the most widgets, fills every text
+widget with a dummy value both ways and reports the median time per fill.
+"""
+import argparse
+import glob
+import os
+import statistics
+import time
+from typing import Dict, Any, List, Tuple
+
+import fitz
+
+from Services.WidgetFillEngine import apply_field_updates
+
+SERVICES_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def count_widgets(pdf_path: str) -> int:
+    with fitz.open(pdf_path) as doc:
+        return sum(1 for page in doc for _ in page.widgets())
+
+
+def dummy_updates(pdf_path: str) -> Tuple[Dict[str, Any], Dict[str, int]]:
+    """One value per text widget, plus the name -> page map the fillers pass around."""
+    updates, pages = {}, {}
+    with fitz.open(pdf_path) as doc:
+        for page_num, page in enumerate(doc):
+            for widget in page.widgets():
+                if widget.field_name and widget.field_type == fitz.PDF_WIDGET_TYPE_TEXT:
+                    updates[widget.field_name] = f"Value {len(updates)}"
+                    pages[widget.field_name] = page_num
+    return updates, pages
+
+
+def legacy_fill(pdf_path: str, updates: Dict[str, Any], pages: Dict[str, int]) -> bytes:
+    """The previous fill loop: rescans the page's widgets for every match."""
+    doc = fitz.open(pdf_path)
+    for name, value in updates.items():
+        page = doc[pages.get(name, 0)]
+        for widget in page.widgets():
+            if widget.field_name == name:
+                widget.field_value = str(value)
+                widget.update()
+                break
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def batched_fill(pdf_path: str, updates: Dict[str, Any], pages: Dict[str, int]) -> bytes:
+    doc = fitz.open(pdf_path)
+    apply_field_updates(doc, updates)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def time_fill(fill, pdf_path: str, updates: Dict[str, Any], pages: Dict[str, int], iterations: int) -> float:
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fill(pdf_path, updates, pages)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the batched widget fill engine.")
+    parser.add_argument("--templates", type=int, default=3)
+    parser.add_argument("--iterations", type=int, default=5)
+    args = parser.parse_args()
+
+    pdf_paths: List[str] = glob.glob(os.path.join(SERVICES_DIR, "*.pdf"))
+    ranked = sorted(pdf_paths, key=count_widgets, reverse=True)[:args.templates]
+
+    print(f"{'template':<40} {'widgets':>8} {'legacy ms':>10} {'batched ms':>11} {'speedup':>8}")
+    for pdf_path in ranked:
+        updates, pages = dummy_updates(pdf_path)
+        if not updates:
+            continue
+        legacy = time_fill(legacy_fill, pdf_path, updates, pages, args.iterations)
+        batched = time_fill(batched_fill, pdf_path, updates, pages, args.iterations)
+        print(f"{os.path.basename(pdf_path):<40} {count_widgets(pdf_path):>8} "
+              f"{legacy * 1000:>10.1f} {batched * 1000:>11.1f} {legacy / batched:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,22 +3,30 @@ import json
 import os
 import re
 import numpy as np
-import cv2
 import fitz
 import time
-from typing import Dict, Any, List, Tuple, Optional
+from typing import Dict, Any, List, Tuple, Optional, Union
 
 from paddleocr import PaddleOCR
-from pdf2image import convert_from_path
 
 from pydantic_ai import Agent
 from pydantic_ai.models.gemini import GeminiModel
 from pydantic import BaseModel, field_validator, ConfigDict, ValidationError
 from Common.constants import *
+from Common.hashing import file_sha256
+from Services.OCRResultCache import OCRResultCache
+from Services.OCRPreprocess import (BASE_PIPELINE, Denoise, PreprocessedPage, PreprocessPipeline, Threshold,
+                                    pipeline_signature, preprocess_page)
+from Services.OCRTextIndex import OCRTextIndex
+from Services.PageRenderCache import render_page_cached
+from Services.TextPlacement import PageTextPlacer
 
 # Add timeout constants
 API_TIMEOUT = 30  # seconds
 OCR_TIMEOUT = 60  # seconds
+OCR_RENDER_DPI = 200  # part of the OCR cache key; OCR boxes are in pixels at this DPI
+# Finishing stages after the shared crop/downscale/grayscale pass
+GEN_PREPROCESS = PreprocessPipeline([Threshold("adaptive"), Denoise()], name="gen")
 
 API_KEYS = {
     "field_matcher": API_KEY_3,
@@ -31,15 +39,17 @@ class AIResponseValidationError(Exception):
 
 
 class AdvancedOCRProcessor:
-    def __init__(self, languages=['en'], use_gpu=True):
+    def __init__(self, languages=['en'], use_gpu=True, ocr_cache: Optional[OCRResultCache] = None):
         """
         Initialize advanced OCR processor with multi-language support and GPU acceleration
 
         Args:
             languages (List[str]): List of language codes to support
             use_gpu (bool): Enable GPU acceleration for OCR
+            ocr_cache (OCRResultCache): Optional store of per-page OCR results
         """
         print("Initializing OCR processor...")
+        self.ocr_cache = ocr_cache
         self.ocr_readers = {}
         for lang in languages:
             try:
@@ -53,47 +63,34 @@ class AdvancedOCRProcessor:
             except Exception as e:
                 print(f"Failed to initialize OCR reader for language {lang}: {e}")
 
-    def preprocess_image(self, image: np.ndarray) -> np.ndarray:
+    def preprocess_image(self, image: np.ndarray, dpi: int = OCR_RENDER_DPI) -> PreprocessedPage:
         """
-        Advanced image preprocessing for improved OCR accuracy
+        Runs the shared OCR preprocessing pipeline on a page image
 
         Args:
-            image (np.ndarray): Input image
+            image (np.ndarray): RGB page image rendered at dpi
+            dpi (int): Resolution the image was rendered at
 
         Returns:
-            np.ndarray: Preprocessed image
+            PreprocessedPage: Binarized image and its transform back to the input pixels
         """
-        print("Preprocessing image...")
-        # Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return GEN_PREPROCESS.apply(BASE_PIPELINE.run(image, dpi))
 
-        # Apply adaptive thresholding
-        thresh = cv2.adaptiveThreshold(
-            gray, 255,
-            cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-            cv2.THRESH_BINARY, 11, 2
-        )
-
-        # Denoise
-        denoised = cv2.fastNlMeansDenoising(thresh, None, 10, 7, 21)
-        print("Image preprocessing complete")
-
-        return denoised
-
-    def extract_text_multilingual(self, image: np.ndarray) -> List[Dict[str, Any]]:
+    def extract_text_multilingual(self, image: Union[np.ndarray, PreprocessedPage]) -> List[Dict[str, Any]]:
         """
         Extract text using multiple language OCR with advanced preprocessing
 
         Args:
-            image (np.ndarray): Input image
+            image (np.ndarray | PreprocessedPage): Input image, or a page already preprocessed
 
         Returns:
-            List[Dict[str, Any]]: Extracted text with details
+            List[Dict[str, Any]]: Extracted text with details; boxes are in input image pixels
         """
         print("Starting OCR text extraction...")
         start_time = time.time()
 
-        preprocessed_image = self.preprocess_image(image)
+        page = image if isinstance(image, PreprocessedPage) else self.preprocess_image(image)
+        preprocessed_image = page.image
 
         all_results = []
         for lang, ocr_reader in self.ocr_readers.items():
@@ -116,7 +113,7 @@ class AdvancedOCRProcessor:
                         if hasattr(result, '__iter__') and not hasattr(result, '__len__'):
                             result = list(result)
 
-                        for text_info in result:
+                        for text_info in page.map_lines(result):
                             all_results.append({
                                 'text': text_info[1][0],
                                 'confidence': text_info[1][1],
@@ -131,6 +128,69 @@ class AdvancedOCRProcessor:
         print(f"Extracted {len(results)} text elements in {time.time() - start_time:.2f} seconds")
         return results
 
+    @property
+    def cache_params(self) -> Dict[str, Any]:
+        """Everything that changes the OCR output for a page; part of the OCR cache key."""
+        return {
+            "pipeline": "gen_multilingual",
+            "languages": sorted(self.ocr_readers.keys()),
+            "preprocess": pipeline_signature(GEN_PREPROCESS),
+        }
+
+    def extract_pdf_text(self, pdf_path: str, dpi: int = OCR_RENDER_DPI) -> List[Dict[str, Any]]:
+        """
+        Extract text from every page of a PDF, serving pages from the OCR cache when possible
+
+        Only pages missing from the cache are rasterized and OCRed.
+
+        Args:
+            pdf_path (str): Input PDF path
+            dpi (int): Rasterization DPI
+
+        Returns:
+            List[Dict[str, Any]]: Extracted text with details and page numbers
+        """
+        ocr_start_time = time.time()
+        with fitz.open(pdf_path) as doc:
+            page_count = len(doc)
+
+        # The hash also keys the shared page render cache
+        pdf_hash = file_sha256(pdf_path)
+        cached_pages = self.ocr_cache.lookup_pages(pdf_hash, list(range(page_count)), dpi,
+                                                   self.cache_params) if self.ocr_cache else {}
+
+        all_ocr_results = []
+        for page_num in range(page_count):
+            if page_num in cached_pages:
+                all_ocr_results.extend(cached_pages[page_num])
+                continue
+
+            page_start_time = time.time()
+            print(f"Processing page {page_num + 1}/{page_count}")
+
+            image_path = render_page_cached(pdf_path, pdf_hash, page_num, dpi)
+            page_results = self.extract_text_multilingual(preprocess_page(image_path, dpi, GEN_PREPROCESS))
+
+            # Add page number to results
+            for result in page_results:
+                result['page'] = page_num
+
+            if self.ocr_cache:
+                self.ocr_cache.store_page(pdf_hash, page_num, dpi, self.cache_params, page_results)
+            all_ocr_results.extend(page_results)
+
+            page_time = time.time() - page_start_time
+            print(
+                f"Page {page_num + 1} processed in {page_time:.2f} seconds. Found {len(page_results)} text elements.")
+
+            # Break early if processing is taking too long
+            if time.time() - ocr_start_time > OCR_TIMEOUT:
+                print(
+                    f"OCR taking too long (> {OCR_TIMEOUT} seconds). Processing only the first {page_num + 1} pages.")
+                break
+
+        return all_ocr_results
+
 
 class FieldMatchingAgent:
     def __init__(self, model_name="gemini-1.5-flash"):
@@ -284,163 +344,11 @@ class FieldMatchingAgent:
             raise AIResponseValidationError(f"Failed to parse AI response: {e}")
 
 
-class FormFieldAnalyzer:
-    def __init__(self, model_name="gemini-1.5-flash"):
-        """
-        Initialize AI agent for form field analysis and placement
-
-        Args:
-            model_name (str): AI model to use
-        """
-        print(f"Initializing Form Field Analyzer with model: {model_name}")
-        try:
-            self.agent = Agent(
-                model=GeminiModel(model_name, api_key=API_KEYS.get("field_matcher")),
-                system_prompt="""
-                You are an AI specialized in analyzing PDF forms and determining the exact positions 
-                where field values should be placed.
-
-                For each form field, you need to identify:
-                1. The page number where the field is located
-                2. The precise coordinates where text should be inserted
-                3. Any special formatting requirements
-
-                CRITICAL OUTPUT REQUIREMENTS:
-                ALWAYS return a VALID JSON with this EXACT structure:
-                {
-                    "field_positions": [
-                        {
-                            "field_name": "Field name as it appears in PDF",
-                            "page": 0,  // 0-indexed page number
-                            "coordinates": {
-                                "x": 150.5,  // x-coordinate for text insertion
-                                "y": 225.3   // y-coordinate for text insertion
-                            },
-                            "max_width": 200,  // maximum width allowed for inserted text
-                            "formatting": {
-                                "alignment": "left",  // left, center, right
-                                "font_size": 10
-                            }
-                        }
-                    ]
-                }
-
-                DO NOT include code blocks, comments, or additional text outside the JSON structure.
-                """
-            )
-            print("Form Field Analyzer initialized successfully")
-        except Exception as e:
-            print(f"Failed to initialize Form Field Analyzer: {e}")
-            raise
-
-    async def analyze_form_structure(
-            self,
-            ocr_results: List[Dict[str, Any]],
-            pdf_width: int,
-            pdf_height: int,
-            field_matches: List[Dict[str, Any]]
-    ) -> List[Dict[str, Any]]:
-        """
-        Analyze form structure to determine optimal field placement
-
-        Args:
-            ocr_results: OCR results from the PDF
-            pdf_width: Width of the PDF in points
-            pdf_height: Height of the PDF in points
-            field_matches: List of field matches to place in the PDF
-
-        Returns:
-            List of field position mappings with exact coordinates
-        """
-        print("Starting form structure analysis...")
-        start_time = time.time()
-
-        # Use a truncated version of OCR results to avoid overwhelming the model
-        max_ocr_results = 100
-        truncated_ocr = ocr_results[:max_ocr_results] if len(ocr_results) > max_ocr_results else ocr_results
-        print(f"Using {len(truncated_ocr)} OCR results out of {len(ocr_results)}")
-
-        # Prepare the fields to place - limit to 20 fields max to avoid overwhelming the model
-        fields_to_place = [match['pdf_field'] for match in field_matches][:20]
-        print(f"Analyzing placement for {len(fields_to_place)} fields")
-
-        # Prepare the analysis prompt
-        prompt = json.dumps({
-            "ocr_results": truncated_ocr,
-            "pdf_dimensions": {
-                "width": pdf_width,
-                "height": pdf_height
-            },
-            "fields_to_place": fields_to_place,
-            "instructions": "Analyze the document structure and determine the exact positions where each field value should be placed. Look for form labels, underscores, boxes, or other indicators of field positions."
-        }, indent=2)
-
-        try:
-            print("Sending request to AI model for form analysis...")
-            # Add timeout to the API call
-            response_future = self.agent.run(prompt)
-            response = await asyncio.wait_for(response_future, timeout=API_TIMEOUT)
-            print(f"Received AI form analysis response in {time.time() - start_time:.2f} seconds")
-            return self._parse_and_validate_positions(response.data)
-        except asyncio.TimeoutError:
-            print(f"AI request timed out after {API_TIMEOUT} seconds")
-            return []
-        except Exception as e:
-            print(f"Form structure analysis error: {e}")
-            return []
-
-    def _parse_and_validate_positions(self, raw_response: str) -> List[Dict[str, Any]]:
-        """
-        Parse and validate the AI response for field positions
-
-        Args:
-            raw_response: Raw AI response
-
-        Returns:
-            List of validated field positions
-        """
-        print("Parsing field position analysis...")
-
-        try:
-            # Clean response
-            clean_response = re.sub(r'```(json)?', '', raw_response).strip()
-            print(f"Cleaned response length: {len(clean_response)} characters")
-            print(f"Response preview: {clean_response[:100]}...")
-
-            # Parse JSON
-            try:
-                parsed_positions = json.loads(clean_response)
-            except json.JSONDecodeError as json_err:
-                print(f"JSON Decoding Error: {json_err}")
-                print(f"First 200 chars of problematic response: {clean_response[:200]}")
-                return []
-
-            # Extract and validate field positions
-            field_positions = []
-            position_count = len(parsed_positions.get('field_positions', []))
-            print(f"Found {position_count} raw positions to validate")
-
-            for position in parsed_positions.get('field_positions', []):
-                if not all(key in position for key in ['field_name', 'page', 'coordinates']):
-                    print(f"Incomplete position data: {position}")
-                    continue
-
-                field_positions.append(position)
-
-            print(f"Parsed {len(field_positions)} valid field positions")
-            return field_positions
-
-        except Exception as e:
-            print(f"Position parsing error: {e}")
-            return []
-
-
 class PDFSmartFiller:
-    def __init__(self):
+    def __init__(self, ocr_cache: Optional[OCRResultCache] = None):
         print("Initializing PDF Smart Filler...")
-        self.ocr_processor = AdvancedOCRProcessor()
+        self.ocr_processor = AdvancedOCRProcessor(ocr_cache=ocr_cache)
         self.field_matcher = FieldMatchingAgent()
-        self.field_analyzer = FormFieldAnalyzer()
         print("PDF Smart Filler initialized")
 
     async def process_pdf(
@@ -472,43 +380,10 @@ class PDFSmartFiller:
                 os.makedirs(output_dir)
                 print(f"Created output directory: {output_dir}")
 
-            # Convert PDF to images with progress reporting
-            print(f"Converting PDF to images: {input_pdf_path}")
-            pdf_conversion_start = time.time()
-            pdf_images = convert_from_path(input_pdf_path)
-            # Convert to list if it's a generator
-            if hasattr(pdf_images, '__iter__') and not hasattr(pdf_images, '__len__'):
-                pdf_images = list(pdf_images)
-            pdf_conversion_time = time.time() - pdf_conversion_start
-            print(f"PDF conversion completed in {pdf_conversion_time:.2f} seconds. Found {len(pdf_images)} pages.")
-
-            # Extract text from images with progress reporting
+            # Extract text from page images; cached pages are never rasterized
             print("Starting OCR text extraction...")
             ocr_start_time = time.time()
-
-            all_ocr_results = []
-            for page_num, image in enumerate(pdf_images):
-                page_start_time = time.time()
-                print(f"Processing page {page_num + 1}/{len(pdf_images)}")
-
-                img_array = np.array(image)
-                page_results = self.ocr_processor.extract_text_multilingual(img_array)
-
-                # Add page number to results
-                for result in page_results:
-                    result['page'] = page_num
-
-                all_ocr_results.extend(page_results)
-
-                page_time = time.time() - page_start_time
-                print(
-                    f"Page {page_num + 1} processed in {page_time:.2f} seconds. Found {len(page_results)} text elements.")
-
-                # Break early if processing is taking too long
-                if time.time() - ocr_start_time > OCR_TIMEOUT:
-                    print(
-                        f"OCR taking too long (> {OCR_TIMEOUT} seconds). Processing only the first {page_num + 1} pages.")
-                    break
+            all_ocr_results = self.ocr_processor.extract_pdf_text(input_pdf_path)
 
             ocr_time = time.time() - ocr_start_time
             print(f"OCR completed in {ocr_time:.2f} seconds. Found {len(all_ocr_results)} total text elements.")
@@ -531,33 +406,13 @@ class PDFSmartFiller:
                     print("No field matches found. Skipping PDF filling.")
                     return
 
-                # Get PDF dimensions for AI analysis
-                print("Analyzing PDF structure...")
-                doc = fitz.open(input_pdf_path)
-                first_page = doc[0]
-                pdf_width, pdf_height = first_page.rect.width, first_page.rect.height
-                print(f"PDF dimensions: {pdf_width}x{pdf_height}")
-
-                # Analyze form structure to determine field positions
-                analysis_start_time = time.time()
-                field_positions = await self.field_analyzer.analyze_form_structure(
-                    all_ocr_results,
-                    pdf_width,
-                    pdf_height,
-                    field_matches
-                )
-
-                analysis_time = time.time() - analysis_start_time
-                print(
-                    f"Form structure analysis completed in {analysis_time:.2f} seconds. Found {len(field_positions)} field positions.")
-
-                # Fill PDF using the determined positions
+                # Values are placed from the page layout; no second model call for coordinates
                 filling_start_time = time.time()
-                await self._fill_pdf_with_ai_positions(
+                self._fill_pdf_with_layout(
                     input_pdf_path,
                     output_pdf_path,
                     field_matches,
-                    field_positions
+                    all_ocr_results
                 )
 
                 filling_time = time.time() - filling_start_time
@@ -576,21 +431,21 @@ class PDFSmartFiller:
             traceback.print_exc()
             raise
 
-    async def _fill_pdf_with_ai_positions(
+    def _fill_pdf_with_layout(
             self,
             input_pdf_path: str,
             output_pdf_path: str,
             field_matches: List[Dict[str, Any]],
-            field_positions: List[Dict[str, Any]]
+            ocr_results: List[Dict[str, Any]]
     ):
         """
-        Fill PDF using AI-determined field positions
+        Fill PDF form fields, or place values next to their labels on flat forms
 
         Args:
             input_pdf_path: Input PDF path
             output_pdf_path: Output PDF path
             field_matches: Field match data
-            field_positions: AI-determined field positions
+            ocr_results: OCR results used to find labels missing from the text layer
         """
         print(f"Opening PDF for filling: {input_pdf_path}")
         doc = fitz.open(input_pdf_path)
@@ -612,15 +467,9 @@ class PDFSmartFiller:
             print(f"PDF has {form_field_count} form fields. Filling those directly.")
             self._fill_form_fields(doc, field_matches)
         else:
-            # Method 2: Use AI-determined positions
-            print("Using AI-determined positions to place text")
-            self._place_text_with_ai_positions(doc, field_matches, field_positions)
-
-            # If AI didn't provide enough positions, fall back to a backup method
-            if len(field_positions) < len(field_matches):
-                print(f"AI provided positions for only {len(field_positions)} out of {len(field_matches)} fields")
-                print("Using backup method for remaining fields")
-                self._place_text_with_backup_method(doc, field_matches, field_positions)
+            # Method 2: Place text in the blank regions next to each label
+            print("Placing text from the page layout")
+            self._place_text_with_layout(doc, field_matches, ocr_results)
 
         print(f"Saving filled PDF to: {output_pdf_path}")
         doc.save(output_pdf_path)
@@ -656,128 +505,60 @@ class PDFSmartFiller:
 
         print(f"Filled {fields_filled} form fields out of {len(field_matches)} matches")
 
-    def _place_text_with_ai_positions(self, doc, field_matches, field_positions):
-        """Place text using AI-determined positions"""
-        print("Placing text using AI-determined positions...")
-        fields_placed = 0
-
-        # Create position lookup by field name
-        position_lookup = {pos['field_name']: pos for pos in field_positions}
+    def _find_label(self, doc, label: str, text_index: OCRTextIndex) -> Optional[Tuple[int, fitz.Rect]]:
+        """Page and rect of a field label: text layer first, then the best OCR match on any page"""
+        for page_num, page in enumerate(doc):
+            hits = page.search_for(label)
+            if hits:
+                return page_num, hits[0]
+
+        best = None
+        for page_num in range(len(doc)):
+            matches = text_index.lookup(label, page_num)
+            if matches and (best is None or matches[0].score > best[1].score):
+                best = (page_num, matches[0])
+        if best is None:
+            return None
+        position = best[1].position
+        return best[0], fitz.Rect(position['x1'], position['y1'], position['x2'], position['y2'])
+
+    def _place_text_with_layout(self, doc, field_matches, ocr_results, dpi: int = OCR_RENDER_DPI):
+        """Place each value in the nearest blank underline or box right of or below its label"""
+        print("Placing text from blank regions next to the labels...")
+        scale = 72.0 / dpi
+        # OCR boxes are in rendered pixels; the index works in page points
+        text_index = OCRTextIndex([
+            {
+                'text': result['text'],
+                'page_num': result['page'],
+                'position': {
+                    'x1': min(x for x, _ in result['bbox']) * scale,
+                    'y1': min(y for _, y in result['bbox']) * scale,
+                    'x2': max(x for x, _ in result['bbox']) * scale,
+                    'y2': max(y for _, y in result['bbox']) * scale
+                }
+            } for result in ocr_results if 'page' in result
+        ])
 
+        placers: Dict[int, PageTextPlacer] = {}
         for match in field_matches:
             pdf_field = match['pdf_field']
-            if pdf_field in position_lookup:
-                pos = position_lookup[pdf_field]
-                page_num = pos['page']
-
-                if page_num < len(doc):
-                    page = doc[page_num]
-
-                    # Get coordinates
-                    x = pos['coordinates']['x']
-                    y = pos['coordinates']['y']
-
-                    # Get formatting options with defaults
-                    formatting = pos.get('formatting', {})
-                    font_size = formatting.get('font_size', 10)
-                    alignment = formatting.get('alignment', 'left')
-                    max_width = pos.get('max_width', 200)
-
-                    # Determine alignment
-                    align_val = 0  # left
-                    if alignment == 'center':
-                        align_val = 1
-                    elif alignment == 'right':
-                        align_val = 2
-
-                    # Create a rectangle for text placement
-                    text_rect = fitz.Rect(x, y, x + max_width, y + font_size * 1.5)
-
-                    # Insert textbox with the value
-                    page.insert_textbox(
-                        text_rect,
-                        str(match['suggested_value']),
-                        fontname="Helvetica",
-                        fontsize=font_size,
-                        align=align_val
-                    )
-
-                    fields_placed += 1
-                    print(f"Placed '{match['suggested_value']}' for field '{pdf_field}' on page {page_num + 1}")
-
-        print(f"Placed {fields_placed} fields using AI-determined positions")
-
-    def _place_text_with_backup_method(self, doc, field_matches, field_positions):
-        """Backup method for placing text when AI positions are insufficient"""
-        print("Using backup method for positioning fields...")
-        fields_placed = 0
-
-        # Create a set of fields that already have positions
-        fields_with_positions = {pos['field_name'] for pos in field_positions}
-
-        # Process only fields without positions
-        remaining_matches = [match for match in field_matches if match['pdf_field'] not in fields_with_positions]
-        print(f"Attempting to place {len(remaining_matches)} remaining fields")
-
-        # Create a simple approximation of form field locations
-        for match in remaining_matches:
-            pdf_field = match['pdf_field']
-            field_placed = False
-
-            for page_num, page in enumerate(doc):
-                # Search for the field label text
-                text_instances = page.search_for(pdf_field)
-                placeholder_instances = page.search_for("___")
-
-                if text_instances:
-                    # Found the field label, place text to the right
-                    rect = text_instances[0]
-                    page.insert_text(
-                        (rect.x1 + 5, rect.y0 + 12),  # position slightly to the right and aligned with top
-                        str(match['suggested_value']),
-                        fontname="Helvetica",
-                        fontsize=10
-                    )
-                    fields_placed += 1
-                    field_placed = True
-                    print(
-                        f"Backup method: Placed '{match['suggested_value']}' for field '{pdf_field}' on page {page_num + 1}")
-                    break
-                elif placeholder_instances and not field_placed:
-                    # Found a placeholder, use it
-                    for rect in placeholder_instances:
-                        # Check if this placeholder is near any OCR text that might match our field
-                        ocr_matches = page.get_text("words")
-                        for word in ocr_matches:
-                            word_text = word[4]
-                            word_rect = fitz.Rect(word[0], word[1], word[2], word[3])
-
-                            # If the word is close to the placeholder and might be related to our field
-                            if (word_rect.distance_to(rect) < 50 and
-                                    (pdf_field.lower() in word_text.lower() or
-                                     any(token.lower() in word_text.lower() for token in pdf_field.lower().split()))):
-                                page.insert_text(
-                                    (rect.x0 + 2, rect.y0 + 12),
-                                    str(match['suggested_value']),
-                                    fontname="Helvetica",
-                                    fontsize=10
-                                )
-                                fields_placed += 1
-                                field_placed = True
-                                print(
-                                    f"Backup method: Placed '{match['suggested_value']}' near underscore for '{pdf_field}' on page {page_num + 1}")
-                                break
-
-                        if field_placed:
-                            break
-
-                    if field_placed:
-                        break
-
-            if not field_placed:
+            found = self._find_label(doc, pdf_field, text_index)
+            if found is None:
                 print(f"Could not find a position for field '{pdf_field}'")
+                continue
+
+            page_num, label = found
+            placer = placers.get(page_num)
+            if placer is None:
+                placer = placers[page_num] = PageTextPlacer(doc[page_num])
+            placement = placer.place_near_label(label, str(match['suggested_value']))
+            print(f"Placed '{placement.text}' for field '{pdf_field}' in {placement.kind} at "
+                  f"{placement.fontsize}pt on page {page_num + 1}")
 
-        print(f"Placed {fields_placed} fields using backup method")
+        # One batched write per page
+        fields_placed = sum(placer.flush() for placer in placers.values())
+        print(f"Placed {fields_placed} fields from the page layout")
 
 
 async def main():
@@ -786,7 +567,7 @@ async def main():
         print("Initializing Smart PDF Filler...")
 
         # Create smart filler instance
-        smart_filler = PDFSmartFiller()
+        smart_filler = PDFSmartFiller(ocr_cache=OCRResultCache())
 
         # Define paths
         input_pdf = "D:\\demo\\Services\\MIchiganCorp.pdf"
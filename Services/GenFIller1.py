@@ -11,13 +11,13 @@ import cv2
 from paddleocr import PaddleOCR
 from pypdf import PdfReader, PdfWriter
 from pypdf.generic import DictionaryObject, NameObject, BooleanObject, ArrayObject
-from difflib import SequenceMatcher
 
 from pydantic_ai import Agent
 from pydantic_ai.models.gemini import GeminiModel
 from pydantic import BaseModel, field_validator
 
 from Common.constants import *
+from Services.OCRTextIndex import OCRTextIndex
 
 API_KEYS = {
     "field_matcher": API_KEY_3,
@@ -464,6 +464,8 @@ class MultiAgentFormFiller:
         """Fills OCR-detected areas with text for readonly fields."""
         doc = fitz.open(pdf_path)
         annotations_added = 0
+        # Indexed once; every match below looks its label up in it
+        text_index = OCRTextIndex(ocr_elements)
 
         for match in ocr_matches:
             if match.suggested_value is not None:
@@ -472,7 +474,8 @@ class MultiAgentFormFiller:
 
                     position = None
                     if match.ocr_text:
-                        position = self.find_text_position(match.ocr_text, ocr_elements, match.page_num)
+                        position = self.find_text_position(match.ocr_text, ocr_elements, match.page_num,
+                                                           text_index)
 
                     if position:
                         x1, y1, x2, y2 = position["x1"], position["y1"], position["x2"], position["y2"]
@@ -554,44 +557,17 @@ class MultiAgentFormFiller:
             doc.close()
             return False
 
-    def find_text_position(self, text: str, ocr_elements: List[Dict[str, Any]], page_num: int) -> Dict[str, float]:
-        """Find the position of a text element in the OCR results with improved fuzzy matching."""
+    def find_text_position(self, text: str, ocr_elements: List[Dict[str, Any]], page_num: int,
+                           text_index: Optional[OCRTextIndex] = None) -> Dict[str, float]:
+        """Find the position of a text element in the OCR results: exact, then substring, then fuzzy.
+
+        Pass the document's text_index when looking up several labels; one is built here otherwise.
+        """
         if not text or not ocr_elements:
             return None
 
-        search_text = text.strip().lower()
-
-        for element in ocr_elements:
-            if element["page_num"] == page_num and element["text"].strip().lower() == search_text:
-                return element["position"]
-
-        for element in ocr_elements:
-            if element["page_num"] == page_num and search_text in element["text"].strip().lower():
-                return element["position"]
-
-        best_match = None
-        best_ratio = 0.7
-
-        for element in ocr_elements:
-            if element["page_num"] == page_num:
-                element_text = element["text"].strip().lower()
-
-                ratio = SequenceMatcher(None, search_text, element_text).ratio()
-
-                if ratio > best_ratio:
-                    best_ratio = ratio
-                    best_match = element["position"]
-
-                words_in_search = set(search_text.split())
-                words_in_element = set(element_text.split())
-                common_words = words_in_search.intersection(words_in_element)
-                if common_words:
-                    word_ratio = len(common_words) / max(len(words_in_search), 1)
-                    if word_ratio > 0.5 and word_ratio > best_ratio:
-                        best_ratio = word_ratio
-                        best_match = element["position"]
-
-        return best_match
+        text_index = text_index or OCRTextIndex(ocr_elements)
+        return text_index.find_position(text, page_num)
 
     def finalize_pdf(self, input_pdf: str, output_pdf: str) -> None:
         """Finalizes the PDF using PyPDF to avoid incremental save issues."""
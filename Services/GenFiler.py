@@ -1,15 +1,11 @@
 import asyncio
 import json
 import os
-import re
-import shutil
 from typing import Dict, Any, List, Tuple, Optional
 
 import fitz
 import numpy as np
-import cv2
 from paddleocr import PaddleOCR
-from pypdf import PdfReader, PdfWriter
 from pypdf.generic import DictionaryObject, NameObject, BooleanObject, ArrayObject
 from difflib import SequenceMatcher
 
@@ -18,11 +14,21 @@ from pydantic_ai.models.gemini import GeminiModel
 from pydantic import BaseModel, field_validator
 
 from Common.constants import *
-
-API_KEYS = {
-    "field_matcher": API_KEY_1,
-}
-
+from Common.pdf_source import PdfSource, open_pdf, source_sha256
+from Services.APIKeyPool import PooledAgent
+from Services.FieldContextIndex import FIELD_CONTEXT_LLM, build_field_context
+from Services.LabelStore import FieldLabelStore
+from Services.LLMCaller import CircuitOpenError, LLMCaller, repair_json
+from Services.LocalMatcher import LOCAL_MATCH_ENABLED, LocalFieldMatcher
+from Services.MappingCache import FieldMappingCache
+from Services.PromptBuilder import PromptBuilder
+from Services.TemplateRegistry import PreparedTemplate, TemplateMetadata
+from Services.OCRResultCache import OCRResultCache
+from Services.OCRPreprocess import (Denoise, PreprocessPipeline, Rect, Threshold, pipeline_signature,
+                                    preprocess_page, widget_rois)
+from Services.PageRenderCache import render_page_cached
+from Services.WidgetFillEngine import apply_field_updates, document_bytes, filled_widget_values
+from Services.WorkerPool import get_worker_pool, run_in_worker
 
 class NumpyEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -70,21 +76,173 @@ class OCRFieldMatch(BaseModel):
         return float(v)
 
 
+OCR_RENDER_DPI = 72  # widget rects are in PDF points, so OCR boxes stay at 72 DPI
+OCR_THRESHOLD_VARIANTS = ("adaptive", "fixed")
+# Adaptive threshold is the primary pass; the fixed threshold is the second chance
+OCR_VARIANT_PIPELINES = {
+    variant: PreprocessPipeline([Threshold(variant, invert=True), Denoise()], name=f"genfiler_{variant}")
+    for variant in OCR_THRESHOLD_VARIANTS
+}
+# Everything that changes the OCR output for a page; part of the OCR cache key
+OCR_CACHE_PARAMS = {
+    "pipeline": "genfiler",
+    "lang": "en",
+    "preprocess": [pipeline_signature(OCR_VARIANT_PIPELINES[variant]) for variant in OCR_THRESHOLD_VARIANTS],
+    "min_confidence": 0.4,
+}
+
+
+def ocr_page_variant(ocr_reader: PaddleOCR, image_path: str, variant: str, rois: Tuple[Rect, ...] = ()) -> List:
+    """OCRs one threshold variant of a rendered page, cropped to the widgets when rois are given."""
+    page = preprocess_page(image_path, OCR_RENDER_DPI, OCR_VARIANT_PIPELINES[variant], rois)
+    results = ocr_reader.ocr(page.image, cls=True)
+    return page.map_lines(results[0] or [])
+
+
+def collect_ocr_lines(lines: List, page_num: int, dpi: int = OCR_RENDER_DPI) -> List[Dict[str, Any]]:
+    """Dedupes PaddleOCR lines for a page and converts them to OCR elements in PDF points."""
+    scale = 72 / dpi
+    ocr_results = []
+    unique_results = []
+    seen_texts = set()
+
+    for line in lines:
+        bbox, (text, prob) = line
+
+        text = text.strip().lower()
+        if text and text not in seen_texts and prob >= 0.4:
+            seen_texts.add(text)
+            unique_results.append((bbox, text, prob))
+
+    for (bbox, text, prob) in unique_results:
+        if prob < 0.4 or not text.strip():
+            continue
+
+        # PaddleOCR format: [[x1,y1], [x2,y1], [x2,y2], [x1,y2]]
+        x1, y1 = bbox[0]
+        x2, y2 = bbox[2]
+
+        cleaned_text = text.strip()
+        cleaned_text = ''.join(c for c in cleaned_text if c.isprintable())
+
+        ocr_results.append({
+            "page_num": page_num,
+            "text": cleaned_text,
+            "raw_text": text,
+            "confidence": float(prob),
+            "position": {
+                "x1": float(x1) * scale,
+                "y1": float(y1) * scale,
+                "x2": float(x2) * scale,
+                "y2": float(y2) * scale
+            }
+        })
+
+    return ocr_results
+
+
+def count_pdf_pages(pdf_path: PdfSource) -> int:
+    doc = open_pdf(pdf_path)
+    try:
+        return len(doc)
+    finally:
+        doc.close()
+
+
+def extract_ocr_elements(pdf_path: PdfSource, ocr_reader: PaddleOCR,
+                         template_hash: Optional[str] = None,
+                         ocr_cache: Optional[OCRResultCache] = None,
+                         rois_by_page: Optional[Dict[int, Tuple[Rect, ...]]] = None) -> List[Dict[str, Any]]:
+    """Extract text from PDF using OCR with position information, one page at a time.
+
+    Pages with widgets in rois_by_page are cropped to the area around them before OCR.
+    """
+    rois_by_page = rois_by_page or {}
+    print("🔍 Extracting text using OCR...")
+    template_hash = template_hash or source_sha256(pdf_path)
+    page_count = count_pdf_pages(pdf_path)
+    cached_pages = ocr_cache.lookup_pages(template_hash, list(range(page_count)), OCR_RENDER_DPI,
+                                          OCR_CACHE_PARAMS) if ocr_cache else {}
+    ocr_results = []
+
+    for page_num in range(page_count):
+        if page_num in cached_pages:
+            ocr_results.extend(cached_pages[page_num])
+            continue
+
+        print(f"Processing OCR for page {page_num + 1}/{page_count}...")
+        image_path = render_page_cached(pdf_path, template_hash, page_num, OCR_RENDER_DPI)
+
+        rois = rois_by_page.get(page_num, ())
+        lines = ocr_page_variant(ocr_reader, image_path, "adaptive", rois)
+        if not lines:
+            lines = ocr_page_variant(ocr_reader, image_path, "fixed", rois)
+
+        page_results = collect_ocr_lines(lines, page_num)
+        if ocr_cache:
+            ocr_cache.store_page(template_hash, page_num, OCR_RENDER_DPI, OCR_CACHE_PARAMS, page_results)
+        ocr_results.extend(page_results)
+
+    print(f"✅ Extracted {len(ocr_results)} text elements using OCR.")
+    return ocr_results
+
+
+def create_field_matcher_agent() -> PooledAgent:
+    """Field matching agent whose calls are spread across the API key pool."""
+    return PooledAgent(lambda api_key: Agent(
+        model=GeminiModel("gemini-1.5-flash", api_key=api_key),
+        system_prompt="You are an expert at mapping PDF fields to JSON keys and filling them immediately."
+    ), name="gemini-1.5-flash")
+
+
+def create_ocr_reader() -> PaddleOCR:
+    return PaddleOCR(use_angle_cls=True, lang='en')
+
+
+_worker_ocr_reader: Optional[PaddleOCR] = None
+
+
+def warm_ocr_worker() -> None:
+    """Worker-process initializer; loads PaddleOCR once per process."""
+    global _worker_ocr_reader
+    if _worker_ocr_reader is None:
+        _worker_ocr_reader = create_ocr_reader()
+
+
+def ocr_page_in_worker(image_path: str, variant: str, rois: Tuple[Rect, ...] = ()) -> List:
+    """Worker-process entry point for OCR of one rendered page."""
+    warm_ocr_worker()
+    return ocr_page_variant(_worker_ocr_reader, image_path, variant, rois)
+
+
 class MultiAgentFormFiller:
-    def __init__(self):
-        self.agent = Agent(
-            model=GeminiModel("gemini-1.5-flash", api_key=API_KEYS["field_matcher"]),
-            system_prompt="You are an expert at mapping PDF fields to JSON keys and filling them immediately."
-        )
+    def __init__(self, agent: Optional[PooledAgent] = None, ocr_reader: Optional[PaddleOCR] = None,
+                 ocr_cache: Optional[OCRResultCache] = None, label_store: Optional[FieldLabelStore] = None):
+        # Pooled engines are injected by the API; scripts fall back to fresh ones
+        self.agent = agent or create_field_matcher_agent()
+        self.llm = LLMCaller("field_matcher")
 
-        self.ocr_reader = PaddleOCR(use_angle_cls=True, lang='en')
+        self._ocr_reader = ocr_reader
+        self.ocr_cache = ocr_cache
+        self.label_store = label_store
 
         self.matched_fields = {}
-
-    async def extract_pdf_fields(self, pdf_path: str) -> Dict[str, Dict[str, Any]]:
+        self.cache_hit = False
+        # Set when the agent was skipped because its circuit was open (local matches only)
+        self.degraded = False
+        self.output_bytes: Optional[bytes] = None
+
+    @property
+    def ocr_reader(self) -> PaddleOCR:
+        """In-process PaddleOCR, only loaded when OCR isn't offloaded to the worker pool."""
+        if self._ocr_reader is None:
+            self._ocr_reader = create_ocr_reader()
+        return self._ocr_reader
+
+    async def extract_pdf_fields(self, pdf_path: PdfSource) -> Dict[str, Dict[str, Any]]:
         """Extracts all fillable fields from a multi-page PDF with additional metadata."""
         print("🔍 Extracting all fillable fields...")
-        doc = fitz.open(pdf_path)
+        doc = open_pdf(pdf_path)
         fields = {}
 
         for page_num, page in enumerate(doc, start=0):
@@ -112,89 +270,167 @@ class MultiAgentFormFiller:
         doc.close()
         return fields
 
-    async def extract_ocr_text(self, pdf_path: str) -> List[Dict[str, Any]]:
-        """Extract text from PDF using OCR with position information."""
-        print("🔍 Extracting text using OCR...")
-        doc = fitz.open(pdf_path)
-        ocr_results = []
+    async def extract_ocr_text(self, pdf_path: PdfSource, template_hash: Optional[str] = None,
+                               page_count: Optional[int] = None,
+                               rois_by_page: Optional[Dict[int, Tuple[Rect, ...]]] = None) -> List[Dict[str, Any]]:
+        """Extract text from PDF using OCR with position information.
 
-        for page_num in range(len(doc)):
-            print(f"Processing OCR for page {page_num + 1}/{len(doc)}...")
-            pix = doc[page_num].get_pixmap(alpha=False)
-            img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.h, pix.w, pix.n)
-
-            if img.shape[2] == 4:
-                img = cv2.cvtColor(img, cv2.COLOR_RGBA2RGB)
-
-            gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
-
-            binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                           cv2.THRESH_BINARY_INV, 11, 2)
-
-
-            results = self.ocr_reader.ocr(binary, cls=True)
-
-            if not results[0]:
-                _, threshold = cv2.threshold(gray, 150, 255, cv2.THRESH_BINARY_INV)
-                additional_results = self.ocr_reader.ocr(threshold, cls=True)
-
-                if additional_results[0]:
-                    results = additional_results
+        With a worker pool, every page is rendered and OCRed concurrently and
+        both threshold passes run side by side instead of the fixed-threshold
+        pass waiting for the adaptive one to come back empty. Pages already in
+        the OCR result cache are not rendered or OCRed at all.
+        """
+        ocr_cache = self.ocr_cache
+        if get_worker_pool() is None:
+            return extract_ocr_elements(pdf_path, self.ocr_reader, template_hash, ocr_cache, rois_by_page)
 
-            if results[0]:
-                unique_results = []
-                seen_texts = set()
+        print("🔍 Extracting text using OCR...")
+        template_hash = template_hash or source_sha256(pdf_path)
+        if page_count is None:
+            page_count = await run_in_worker("render", count_pdf_pages, pdf_path)
+
+        page_results = ocr_cache.lookup_pages(template_hash, list(range(page_count)), OCR_RENDER_DPI,
+                                              OCR_CACHE_PARAMS) if ocr_cache else {}
+        missing_pages = [page_num for page_num in range(page_count) if page_num not in page_results]
+
+        image_paths = await asyncio.gather(*(
+            run_in_worker("render", render_page_cached, pdf_path, template_hash, page_num, OCR_RENDER_DPI)
+            for page_num in missing_pages
+        ))
+        rois_by_page = rois_by_page or {}
+        passes = await asyncio.gather(*(
+            run_in_worker("ocr", ocr_page_in_worker, image_path, variant, rois_by_page.get(page_num, ()))
+            for page_num, image_path in zip(missing_pages, image_paths)
+            for variant in OCR_THRESHOLD_VARIANTS
+        ))
+
+        for i, page_num in enumerate(missing_pages):
+            primary, fallback = passes[i * 2], passes[i * 2 + 1]
+            page_results[page_num] = collect_ocr_lines(primary or fallback, page_num)
+            if ocr_cache:
+                ocr_cache.store_page(template_hash, page_num, OCR_RENDER_DPI, OCR_CACHE_PARAMS,
+                                     page_results[page_num])
+
+        ocr_results = [element for page_num in range(page_count) for element in page_results[page_num]]
+
+        print(f"✅ Extracted {len(ocr_results)} text elements using OCR across {page_count} pages.")
+        return ocr_results
 
-                for line in results[0]:
-                    bbox, (text, prob) = line
+    async def prepare_template(self, pdf_path: PdfSource,
+                               template: Optional[TemplateMetadata] = None) -> PreparedTemplate:
+        """Collects the per-template inputs shared by every payload filled against it."""
+        if template is not None:
+            # Indexed templates already carry their widget list
+            pdf_fields = template.widget_fields()
+        else:
+            pdf_fields = await self.extract_pdf_fields(pdf_path)
+        template_hash = template.content_hash if template else source_sha256(pdf_path)
+        field_labels = self.label_store.labels_for(template_hash) if self.label_store else {}
+        return PreparedTemplate(source=pdf_path, pdf_fields=pdf_fields, template_hash=template_hash,
+                                page_count=template.page_count if template else None, field_labels=field_labels)
 
-                    text = text.strip().lower()
-                    if text and text not in seen_texts and prob >= 0.4:
-                        seen_texts.add(text)
-                        unique_results.append((bbox, text, prob))
+    async def ensure_field_context(self, prepared: PreparedTemplate) -> None:
+        """Runs OCR and field context analysis once per prepared template.
 
-                for (bbox, text, prob) in unique_results:
-                    if prob < 0.4 or not text.strip():
-                        continue
+        Context comes from the spatial index unless FIELD_CONTEXT_LLM asks for the model's analysis.
+        """
+        async with prepared.context_lock:
+            if prepared.field_context is not None:
+                return
+            prepared.ocr_text_elements = await self.extract_ocr_text(prepared.source, prepared.template_hash,
+                                                                     prepared.page_count,
+                                                                     widget_rois(prepared.pdf_fields))
+            if FIELD_CONTEXT_LLM:
+                prepared.field_context = await self.analyze_field_context(prepared.pdf_fields,
+                                                                          prepared.ocr_text_elements)
+            else:
+                prepared.field_context = build_field_context(prepared.pdf_fields, prepared.ocr_text_elements)
 
-                    # PaddleOCR format: [[x1,y1], [x2,y1], [x2,y2], [x1,y2]]
-                    x1, y1 = bbox[0]
-                    x2, y2 = bbox[2]
+    async def match_and_fill_fields(self, pdf_path: PdfSource, json_data: Dict[str, Any], output_pdf: Optional[str],
+                                    max_retries: int = 3,
+                                    mapping_cache: Optional[FieldMappingCache] = None,
+                                    template: Optional[TemplateMetadata] = None):
+        """Matches fields using AI and fills them immediately across multiple pages, ensuring OCR text is mapped to UUIDs properly.
 
-                    cleaned_text = text.strip()
-                    cleaned_text = ''.join(c for c in cleaned_text if c.isprintable())
+        The template is only read. The filled document is kept in
+        self.output_bytes and written to output_pdf once when a path is given.
+        """
+        self.output_bytes = None
 
-                    ocr_results.append({
-                        "page_num": page_num,
-                        "text": cleaned_text,
-                        "raw_text": text,
-                        "confidence": float(prob),
-                        "position": {
-                            "x1": float(x1),
-                            "y1": float(y1),
-                            "x2": float(x2),
-                            "y2": float(y2)
-                        }
-                    })
+        print(json_data)
 
-        doc.close()
-        print(f"✅ Extracted {len(ocr_results)} text elements using OCR.")
-        return ocr_results
+        prepared = await self.prepare_template(pdf_path, template)
+        pdf_fields = prepared.pdf_fields
+        flat_json = self.flatten_json(json_data)
 
-    async def match_and_fill_fields(self, pdf_path: str, json_data: Dict[str, Any], output_pdf: str,
-                                    max_retries: int = 3):
-        """Matches fields using AI and fills them immediately across multiple pages, ensuring OCR text is mapped to UUIDs properly."""
+        self.cache_hit = False
+        self.degraded = False
+        cache_key = None
+        combined_matches = []
+        if mapping_cache is not None:
+            cache_key = mapping_cache.build_key(prepared.template_hash, flat_json)
+            cached = mapping_cache.lookup(cache_key, flat_json)
+            if cached:
+                combined_matches = [FieldMatch(**m) for m in cached if m["pdf_field"] in pdf_fields]
+                self.cache_hit = bool(combined_matches)
+
+        if not self.cache_hit:
+            # OCR and field context only feed the prompt, so a cache hit skips them too
+            combined_matches, self.degraded = await self.match_payload(prepared, flat_json, max_retries)
+
+            if not combined_matches:
+                print("⚠️ No valid field matches were found after all attempts.")
+                return False
 
-        backup_pdf = f"{pdf_path}.backup"
-        shutil.copy2(pdf_path, backup_pdf)
-        print(f"Created backup of original PDF: {backup_pdf}")
+            if mapping_cache is not None and not self.degraded:
+                # A local-only result would be served to later fills after the circuit recovers
+                mapping_cache.store(cache_key, combined_matches, flat_json)
 
-        print(json_data)
+        self.output_bytes = await self.fill_matches(prepared, combined_matches)
+        if self.output_bytes is None:
+            return False
 
-        pdf_fields = await self.extract_pdf_fields(pdf_path)
-        ocr_text_elements = await self.extract_ocr_text(pdf_path)
-        flat_json = self.flatten_json(json_data)
-        field_context = await self.analyze_field_context(pdf_fields, ocr_text_elements)
+        if output_pdf:
+            with open(output_pdf, "wb") as f:
+                f.write(self.output_bytes)
+            print(f"✅ Filled PDF saved to: {output_pdf}")
+        return True
+
+    def lookup_cached_matches(self, mapping_cache: FieldMappingCache, prepared: PreparedTemplate,
+                              flat_json: Dict[str, Any]) -> List[FieldMatch]:
+        """Rebuilds matches for a payload from the mapping cache; empty on a miss."""
+        cache_key = mapping_cache.build_key(prepared.template_hash, flat_json)
+        cached = mapping_cache.lookup(cache_key, flat_json) or []
+        return [FieldMatch(**m) for m in cached if m["pdf_field"] in prepared.pdf_fields]
+
+    async def fill_matches(self, prepared: PreparedTemplate, matches: List[FieldMatch]) -> Optional[bytes]:
+        """Fills a fresh copy of the template in the "fill" worker stage and returns the PDF bytes."""
+        return await run_in_worker("fill", fill_pdf_to_bytes, prepared.source, matches, prepared.pdf_fields)
+
+    async def match_payload(self, prepared: PreparedTemplate, flat_json: Dict[str, Any],
+                            max_retries: int = 3) -> Tuple[List[FieldMatch], bool]:
+        """Runs the AI matching loop for one flattened payload.
+
+        OCR-detected matches are returned as FieldMatch entries keyed by their
+        UUID alongside the regular widget matches. The second value tells
+        whether the result is degraded: local matches only, because the
+        agent's circuit was open.
+        """
+        await self.ensure_field_context(prepared)
+        pdf_fields = prepared.pdf_fields
+        ocr_text_elements = prepared.ocr_text_elements
+        field_context = prepared.field_context
+
+        local_matches = []
+        if LOCAL_MATCH_ENABLED:
+            local = LocalFieldMatcher().match(flat_json, pdf_fields, field_context, prepared.field_labels)
+            local_matches = [FieldMatch(**m) for m in local.matches]
+            has_readonly = any(info["is_readonly"] for info in pdf_fields.values())
+            if not local.unresolved_fields and not has_readonly:
+                # Readonly fields are placed via OCR matches, which only the agent produces
+                return local_matches, False
+            # The payload stays whole: one value can legitimately fill several fields
+            pdf_fields = {name: pdf_fields[name] for name in local.unresolved_fields}
 
         state=""
         # Print available JSON fields for debugging
@@ -210,99 +446,39 @@ class MultiAgentFormFiller:
 
         if state=="Pennsylvania":
            print("Running 1")
-           prompt = FIELD_MATCHING_PROMPT_UPDATED4.format(
-            json_data=json.dumps(flat_json, indent=2, cls=NumpyEncoder),
-            pdf_fields=json.dumps([{"uuid": k, "info": v} for k, v in pdf_fields.items()], indent=2, cls=NumpyEncoder),
-            ocr_elements=json.dumps(ocr_text_elements, indent=2, cls=NumpyEncoder),
-            field_context=json.dumps(field_context, indent=2, cls=NumpyEncoder)
-           )
+           template = FIELD_MATCHING_PROMPT_UPDATED4
         elif state=="Michigan" :
             print("Running 2")
-            prompt = FIELD_MATCHING_PROMPT_UPDATED.format(
-                json_data=json.dumps(flat_json, indent=2, cls=NumpyEncoder),
-                pdf_fields=json.dumps([{"uuid": k, "info": v} for k, v in pdf_fields.items()], indent=2,
-                                      cls=NumpyEncoder),
-                ocr_elements=json.dumps(ocr_text_elements, indent=2, cls=NumpyEncoder),
-                field_context=json.dumps(field_context, indent=2, cls=NumpyEncoder)
-            )
+            template = FIELD_MATCHING_PROMPT_UPDATED
         else:
             print("Running 3")
-            prompt = FIELD_MATCHING_PROMPT_UPDATED1.format(
-                json_data=json.dumps(flat_json, indent=2, cls=NumpyEncoder),
-                pdf_fields=json.dumps([{"uuid": k, "info": v} for k, v in pdf_fields.items()], indent=2,
-                                      cls=NumpyEncoder),
-                ocr_elements=json.dumps(ocr_text_elements, indent=2, cls=NumpyEncoder),
-                field_context=json.dumps(field_context, indent=2, cls=NumpyEncoder)
-            )
-
-
-
-
-
-
-
-
-        matches, ocr_matches = [], []
-        for attempt in range(max_retries):
-            response = await self.agent.run(prompt)
-            print(response.data)
-            result = self.parse_ai_response(response.data)
-
-            if result:
-                matches = result.get("field_matches", [])
-                ocr_matches = result.get("ocr_matches", [])
-                if matches or ocr_matches:
-                    break
-
-            print(f"Attempt {attempt + 1}/{max_retries} failed to get valid matches. Retrying...")
-
-        if not matches and not ocr_matches:
-            print("⚠️ No valid field matches were found after all attempts.")
-            return False
-
-        temp_output = f"{output_pdf}.temp"
-        shutil.copy2(pdf_path, temp_output)
-
-        try:
-            print("Filling form fields and OCR-detected fields together with UUID-based matching...")
-            combined_matches = matches + [
-                FieldMatch(
-                    json_field=m.json_field,
-                    pdf_field=m.pdf_field,  # Ensuring OCR text maps correctly to UUID
-                    confidence=m.confidence,
-                    suggested_value=m.suggested_value,
-                    reasoning=m.reasoning
-                ) for m in ocr_matches
-            ]
-
-            success = self.fill_pdf_immediately(temp_output, combined_matches, pdf_fields)
-
-
-
-            if not success:
-                print("⚠️ Some fields may not have been filled correctly.")
-
-            if not success:
-                print("⚠️ Some fields may not have been filled correctly.")
-        except Exception as e:
-            print(f"❌ Error during filling: {e}")
-            return False
+            template = FIELD_MATCHING_PROMPT_UPDATED1
+        prompt = PromptBuilder().build(template, flat_json, pdf_fields, ocr_text_elements, field_context,
+                                       field_labels=prepared.field_labels)
 
+        known_fields = prepared.pdf_fields
+        degraded = False
         try:
-            self.finalize_pdf(temp_output, output_pdf)
-            print(f"✅ Finalized PDF saved to: {output_pdf}")
-            return self.verify_pdf_filled(output_pdf)
-        except Exception as e:
-            print(f"❌ Error during finalization: {e}")
-            print("Trying alternative finalization method...")
-
-            try:
-                shutil.copy2(temp_output, output_pdf)
-                print(f"✅ Alternative save successful: {output_pdf}")
-                return self.verify_pdf_filled(output_pdf)
-            except Exception as e2:
-                print(f"❌ Alternative save also failed: {e2}")
-                return False
+            result = await self.llm.run_validated(
+                self.agent, prompt,
+                {"matches": lambda m: self.validate_match(m, known_fields), "ocr_matches": self.validate_ocr_match},
+                max_rounds=max_retries
+            )
+            matches, ocr_matches = result["matches"], result["ocr_matches"]
+        except CircuitOpenError as e:
+            print(f"⚠️ {e}; using local matches only")
+            matches, ocr_matches, degraded = [], [], True
+
+        resolved = {m.pdf_field for m in local_matches}
+        return local_matches + [m for m in matches if m.pdf_field not in resolved] + [
+            FieldMatch(
+                json_field=m.json_field,
+                pdf_field=m.pdf_field,  # Ensuring OCR text maps correctly to UUID
+                confidence=m.confidence,
+                suggested_value=m.suggested_value,
+                reasoning=m.reasoning
+            ) for m in ocr_matches
+        ], degraded
 
     async def analyze_field_context(self, pdf_fields: Dict[str, Dict[str, Any]],
                                     ocr_elements: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -368,150 +544,52 @@ class MultiAgentFormFiller:
         """
 
         try:
-
-
-
-            # Use the existing agent to analyze field context
-            response = await self.agent.run(prompt)
-
-            # Robust parsing with multiple fallback mechanisms
-            cleaned_response = response.data.strip()
-
-            # Remove any markdown code block markers
-            if cleaned_response.startswith('```json'):
-                cleaned_response = cleaned_response[7:]
-            if cleaned_response.startswith('```'):
-                cleaned_response = cleaned_response[3:]
-            if cleaned_response.endswith('```'):
-                cleaned_response = cleaned_response[:-3]
-
-            cleaned_response = cleaned_response.strip()
-
-            try:
-                # First attempt: direct JSON parsing
-                result = json.loads(cleaned_response)
-            except json.JSONDecodeError:
-                # Second attempt: use ast for more lenient parsing
-                import ast
-                try:
-                    result = ast.literal_eval(cleaned_response)
-                except:
-                    print("⚠️ Failed to parse AI response for field context.")
-                    return self._fallback_field_context(pdf_fields, ocr_elements)
+            # Use the existing agent to analyze field context, with the shared retry/backoff layer
+            response = await self.llm.run(self.agent, prompt)
+            result = repair_json(response.data)
+            if not isinstance(result, dict):
+                print("⚠️ Failed to parse AI response for field context.")
+                return build_field_context(pdf_fields, ocr_elements)
 
             # Validate the parsed result
             field_context = result.get("field_contexts", [])
 
             if not field_context:
                 print("⚠️ No field contexts found. Falling back to default method.")
-                field_context = self._fallback_field_context(pdf_fields, ocr_elements)
+                field_context = build_field_context(pdf_fields, ocr_elements)
 
         except Exception as e:
             print(f"❌ Error in AI-based field context analysis: {e}")
-            field_context = self._fallback_field_context(pdf_fields, ocr_elements)
+            field_context = build_field_context(pdf_fields, ocr_elements)
 
         return field_context
 
-    def _fallback_field_context(self, pdf_fields: Dict[str, Dict[str, Any]],
-                                ocr_elements: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        field_context = []
-
-        for field_name, field_info in pdf_fields.items():
-            page_num = field_info["page_num"]
-            rect = field_info["rect"]
-
-            nearby_text = []
-            for ocr_elem in ocr_elements:
-                if ocr_elem["page_num"] != page_num:
-                    continue
-
-                ocr_pos = ocr_elem["position"]
-
-                distance_x = abs(rect[0] - ocr_pos["x2"])
-                distance_y = abs(rect[1] - ocr_pos["y2"])
-
-                if (ocr_pos["x2"] < rect[0] and distance_x < 200 and abs(rect[1] - ocr_pos["y1"]) < 30) or \
-                        (ocr_pos["y2"] < rect[1] and distance_y < 50 and abs(rect[0] - ocr_pos["x1"]) < 200):
-                    nearby_text.append({
-                        "text": ocr_elem["text"],
-                        "distance_x": distance_x,
-                        "distance_y": distance_y,
-                        "position": "left" if ocr_pos["x2"] < rect[0] else "above"
-                    })
-
-            nearby_text.sort(key=lambda x: x["distance_x"] + x["distance_y"])
-
-            field_context.append({
-                "field_name": field_name,
-                "page": page_num + 1,
-                "nearby_text": nearby_text[:3]
-            })
-
-        return field_context
-
-
-
-    def parse_ai_response(self, response_text: str) -> Dict[str, List]:
-        """Parses AI response and extracts valid JSON matches for both form fields and OCR text."""
-        json_patterns = [
-            r'```json\s*([\s\S]*?)\s*```',
-            r'```\s*([\s\S]*?)\s*```',
-            r'(\{[\s\S]*\})'
-        ]
-
-        for pattern in json_patterns:
-            json_match = re.search(pattern, response_text)
-            if json_match:
-                response_text = json_match.group(1)
-                break
-
-        response_text = response_text.strip()
-
-        try:
-            data = json.loads(response_text)
-            result = {
-                "field_matches": [],
-                "ocr_matches": []
-            }
-
-            for match in data.get("matches", []):
-                match.setdefault("confidence", 1.0)
-                match.setdefault("reasoning", "No reasoning provided.")
-
-                try:
-                    validated_match = FieldMatch(**match)
-                    result["field_matches"].append(validated_match)
-                except Exception as e:
-                    print(f"⚠️ Skipping malformed field match: {match} | Error: {e}")
-
-            for match in data.get("ocr_matches", []):
-                match.setdefault("confidence", 1.0)
-                match.setdefault("reasoning", "No reasoning provided.")
-                match.setdefault("page_num", 0)
-                match.setdefault("x1", 100)
-                match.setdefault("y1", 100)
-                match.setdefault("x2", 300)
-                match.setdefault("y2", 120)
-
-                try:
-                    validated_match = OCRFieldMatch(**match)
-                    result["ocr_matches"].append(validated_match)
-                except Exception as e:
-                    print(f"⚠️ Skipping malformed OCR match: {match} | Error: {e}")
-
-            return result
-        except json.JSONDecodeError as e:
-            print(f"❌ AI returned invalid JSON: {e}")
-            print(f"Failed text: {response_text[:100]}...")
-            return {}
-
-    def fill_pdf_immediately(self, output_pdf: str, matches: List[FieldMatch],
-                             pdf_fields: Dict[str, Dict[str, Any]]) -> bool:
-        """Fills PDF form fields using PyMuPDF (fitz) with improved handling of readonly fields."""
-        doc = fitz.open(output_pdf)
-        filled_fields = []
-
-        updates = []
+    @staticmethod
+    def validate_match(match: Dict[str, Any], pdf_fields: Dict[str, Any]) -> FieldMatch:
+        """Builds a FieldMatch from one reply entry, rejecting fields the form doesn't have."""
+        match.setdefault("confidence", 1.0)
+        match.setdefault("reasoning", "No reasoning provided.")
+        validated_match = FieldMatch(**match)
+        if validated_match.pdf_field not in pdf_fields:
+            raise ValueError(f"pdf_field '{validated_match.pdf_field}' is not one of the form's fields")
+        return validated_match
+
+    @staticmethod
+    def validate_ocr_match(match: Dict[str, Any]) -> OCRFieldMatch:
+        match.setdefault("confidence", 1.0)
+        match.setdefault("reasoning", "No reasoning provided.")
+        match.setdefault("page_num", 0)
+        match.setdefault("x1", 100)
+        match.setdefault("y1", 100)
+        match.setdefault("x2", 300)
+        match.setdefault("y2", 120)
+        return OCRFieldMatch(**match)
+
+    @staticmethod
+    def fill_pdf_immediately(doc: fitz.Document, matches: List[FieldMatch],
+                             pdf_fields: Dict[str, Dict[str, Any]]) -> List[str]:
+        """Fills form fields in an open document, skipping readonly fields left for OCR placement."""
+        updates = {}
         for match in matches:
             if match.pdf_field and match.suggested_value is not None:
                 field_info = pdf_fields.get(match.pdf_field)
@@ -524,84 +602,20 @@ class MultiAgentFormFiller:
                     print(f"⚠️ Skipping readonly field '{match.pdf_field}' - will handle via OCR")
                     continue
 
-                page_num = field_info["page_num"]
-                updates.append((page_num, match.pdf_field, match.suggested_value))
+                updates[match.pdf_field] = match.suggested_value
 
-        for page_num, field_name, value in updates:
-            page = doc[page_num]
-            for widget in page.widgets():
-                if widget.field_name == field_name:
-                    print(f"✍️ Filling: '{value}' → '{field_name}' (Page {page_num + 1})")
-                    try:
-                        widget.field_value = str(value)
-                        widget.update()
-                        filled_fields.append(field_name)
-                    except Exception as e:
-                        print(f"⚠️ Error filling {field_name}: {e}")
-                    break
+        filled_fields = apply_field_updates(doc, updates).applied
+        print(f"✅ Filled {len(filled_fields)} fields")
+        return filled_fields
 
+    @staticmethod
+    def verify_pdf_filled(doc: fitz.Document) -> bool:
+        """Verifies from the in-memory widget state that the PDF has been filled or has annotations."""
         try:
-            # Remove garbage and incremental parameters to fix the error
-            doc.save(output_pdf, deflate=True, clean=True)
-            print(f"✅ Saved PDF with {len(filled_fields)} filled fields")
-            doc.close()
-            return len(filled_fields) > 0
-        except Exception as e:
-            print(f"❌ Error saving PDF: {e}")
-
-            try:
-                temp_path = f"{output_pdf}.tmp"
-                doc.save(temp_path, deflate=True, clean=True)
-                doc.close()
-                shutil.move(temp_path, output_pdf)
-                print(f"✅ Saved PDF using alternative method")
-                return len(filled_fields) > 0
-            except Exception as e2:
-                print(f"❌ Alternative save also failed: {e2}")
-                doc.close()
-                return False
-
+            filled_fields = filled_widget_values(doc)
+            print(f"✅ Found {len(filled_fields)} filled form fields")
 
-
-    def finalize_pdf(self, input_pdf: str, output_pdf: str) -> None:
-        """Finalizes the PDF using PyPDF to avoid incremental save issues."""
-        try:
-            reader = PdfReader(input_pdf)
-            writer = PdfWriter()
-
-            for page in reader.pages:
-                writer.add_page(page)
-
-            if reader.get_fields():
-                writer.clone_reader_document_root(reader)
-
-            with open(output_pdf, "wb") as f:
-                writer.write(f)
-        except Exception as e:
-            print(f"❌ Error in finalize_pdf: {e}")
-            # Simply copy the file as a fallback
-            shutil.copy2(input_pdf, output_pdf)
-            print(f"✅ Used direct file copy as fallback for finalization")
-
-    def verify_pdf_filled(self, pdf_path: str) -> bool:
-        """Verifies that the PDF has been filled correctly or has annotations."""
-        try:
-            reader = PdfReader(pdf_path)
-            fields = reader.get_fields()
-
-            filled_fields = {}
-            if fields:
-                filled_fields = {k: v.get("/V") for k, v in fields.items() if v.get("/V")}
-                print(f"✅ Found {len(filled_fields)} filled form fields")
-
-            doc = fitz.open(pdf_path)
-            annotation_count = 0
-
-            for page in doc:
-                annotations = list(page.annots())
-                annotation_count += len(annotations)
-
-            doc.close()
+            annotation_count = sum(len(list(page.annots())) for page in doc)
             print(f"✅ Found {annotation_count} annotations in the PDF")
 
             return bool(filled_fields) or annotation_count > 0
@@ -626,6 +640,29 @@ class MultiAgentFormFiller:
             else:
                 items[new_key] = value
         return items
+def fill_pdf_to_bytes(pdf_path: PdfSource, matches: List[FieldMatch],
+                      pdf_fields: Dict[str, Dict[str, Any]]) -> Optional[bytes]:
+    """Fills and verifies one in-memory document and serializes it once. Runs in the "fill" worker stage.
+
+    A failed verification is only logged, as the file-based fill did; None
+    means the document couldn't be filled or serialized.
+    """
+    doc = open_pdf(pdf_path)
+    try:
+        print("Filling form fields and OCR-detected fields together with UUID-based matching...")
+        if not MultiAgentFormFiller.fill_pdf_immediately(doc, matches, pdf_fields):
+            print("⚠️ Some fields may not have been filled correctly.")
+
+        if not MultiAgentFormFiller.verify_pdf_filled(doc):
+            print("⚠️ Verification found no filled fields or annotations; returning the document anyway")
+        return document_bytes(doc)
+    except Exception as e:
+        print(f"❌ Error during filling: {e}")
+        return None
+    finally:
+        doc.close()
+
+
 async def main():
     form_filler = MultiAgentFormFiller()
     template_pdf = "D:\\demo\\Services\\Georgia_LLC.pdf"
@@ -1,16 +1,15 @@
 import asyncio
 import json
 import os
-import re
 import shutil
+from collections import deque
 from typing import Dict, Any, List, Optional
-from Common.constants import *
 import fitz
 import numpy as np
 import cv2
 import pytesseract
 from pypdf import PdfReader, PdfWriter
-from jsonschema import validate, ValidationError
+from jsonschema import validate
 from difflib import SequenceMatcher
 
 from pydantic_ai import Agent
@@ -19,14 +18,19 @@ from pydantic_ai.settings import ModelSettings
 from pydantic import BaseModel, field_validator
 from pydantic_ai.providers.google_gla import GoogleGLAProvider
 
+from Services.APIKeyPool import PooledAgent
+from Services.LLMCaller import LLMCaller, pick_consensus_winner
+
 # Set environment variables for determinism
 os.environ['PYTHONHASHSEED'] = '0'
 os.environ['OMP_NUM_THREADS'] = '1'
 np.random.seed(42)
 
-API_KEYS = {
-    "field_matcher": API_KEY_1,
-}
+# Self-consistency: concurrent samples per request, and how many must agree on a pair
+CONSENSUS_SAMPLES = int(os.environ.get("CONSENSUS_SAMPLES", 3))
+CONSENSUS_QUORUM = int(os.environ.get("CONSENSUS_QUORUM", CONSENSUS_SAMPLES // 2 + 1))
+# Earlier consensus results kept for drift checks on a long-lived instance
+RESULT_HISTORY_LIMIT = int(os.environ.get("RESULT_HISTORY_LIMIT", 10))
 
 FIELD_MATCHING_RULES = """
 ## STRICT MATCHING RULES
@@ -102,17 +106,19 @@ class MultiAgentFormFiller:
             seed=42
         )
 
-        self.agent = Agent(
+        self.agent = PooledAgent(lambda api_key: Agent(
             model=GeminiModel(
                 model_name="gemini-1.5-flash",
                 provider=GoogleGLAProvider(
-                    api_key=API_KEYS["field_matcher"]
+                    api_key=api_key
                 ),
                 settings=model_settings
             ),
             system_prompt=f"""PDF field mapping expert. Rules:\n{FIELD_MATCHING_RULES}"""
-        )
-        self.previous_results = []
+        ), name="gemini-1.5-flash")
+        self.model_settings = model_settings
+        self.llm = LLMCaller("field_matcher")
+        self.previous_results = deque(maxlen=RESULT_HISTORY_LIMIT)
 
     async def extract_pdf_fields(self, pdf_path: str) -> Dict[str, Dict[str, Any]]:
         doc = fitz.open(pdf_path)
@@ -171,21 +177,15 @@ class MultiAgentFormFiller:
         flat_json = self.flatten_json(json_data)
 
         prompt = self._build_prompt(flat_json, pdf_fields, ocr_text)
-        best_result = None
-
-        for attempt in range(max_retries):
-            try:
-                response = await self.agent.run(prompt)
-                result = self.parse_ai_response(response.data)
-                if result and self._is_more_consistent(result):
-                    best_result = result
-                    self.previous_results.append(result)
-            except Exception as e:
-                print(f"Attempt {attempt + 1} failed: {e}")
 
+        best_result = await self.match_with_consensus(prompt, pdf_fields, max_rounds=max_retries)
         if not best_result:
             return False
 
+        if not self._is_more_consistent(best_result):
+            print("⚠️ Consensus result differs from most earlier results for this instance")
+        self.previous_results.append(best_result)
+
         temp_pdf = f"{output_pdf}.temp"
         shutil.copy2(pdf_path, temp_pdf)
 
@@ -217,24 +217,97 @@ OCR Elements (for context):
 Respond ONLY with valid JSON matching this schema:
 {json.dumps(RESPONSE_SCHEMA, indent=2)}"""
 
-    def parse_ai_response(self, response_text: str) -> Optional[Dict]:
+    @staticmethod
+    def _validate_match(match: Dict, pdf_fields: Dict) -> FieldMatch:
+        validate(instance=match, schema=RESPONSE_SCHEMA["properties"]["matches"]["items"])
+        field_match = FieldMatch(**match)
+        if field_match.pdf_field not in pdf_fields:
+            raise ValueError(f"Unknown pdf_field '{field_match.pdf_field}'")
+        return field_match
+
+    async def match_with_consensus(self, prompt: str, pdf_fields: Dict, samples: int = CONSENSUS_SAMPLES,
+                                   quorum: int = CONSENSUS_QUORUM, max_rounds: int = 3) -> Optional[Dict]:
+        """Fires `samples` matching calls at once and votes on each (pdf_field, json_field) pair.
+
+        Each field goes to the pair with the most votes among those that
+        reached the quorum, summed confidence breaking ties. Once every field
+        proposed so far is settled (its leading pair has a quorum, or can no
+        longer reach one) the outstanding calls are cancelled. Fields without
+        a quorum are left blank.
+        """
+        quorum = max(1, min(quorum, samples))
+
+        async def sample(index: int) -> List[FieldMatch]:
+            # Distinct seeds, otherwise the samples would be identical
+            settings = ModelSettings(**{**self.model_settings, "seed": 42 + index})
+            result = await self.llm.run_validated(
+                self.agent, prompt, {"matches": lambda m: self._validate_match(m, pdf_fields)},
+                max_rounds=max_rounds, model_settings=settings
+            )
+            return result["matches"]
+
+        # pdf_field -> json_field -> [vote count, confidence sum, best match]
+        votes: Dict[str, Dict[str, List]] = {}
+        tasks = [asyncio.ensure_future(sample(i)) for i in range(samples)]
+        completed = 0
         try:
-            cleaned = re.sub(r'[\s\S]*?({[\s\S]*})[\s\S]*', r'\1', response_text)
-            data = json.loads(cleaned)
-            validate(instance=data, schema=RESPONSE_SCHEMA)
-            return {
-                "matches": [
-                    FieldMatch(**m) for m in data["matches"]
-                ]
-            }
-        except (json.JSONDecodeError, ValidationError) as e:
-            print(f"Invalid response: {e}")
-            return None
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    matches = await next_done
+                except Exception as e:
+                    print(f"Consensus sample failed: {e}")
+                    matches = []
+                completed += 1
+
+                seen = set()
+                for match in matches:
+                    pair = (match.pdf_field, match.json_field)
+                    if pair in seen:
+                        continue
+                    seen.add(pair)
+                    tally = votes.setdefault(match.pdf_field, {}).setdefault(match.json_field, [0, 0.0, match])
+                    tally[0] += 1
+                    tally[1] += match.confidence
+                    if match.confidence > tally[2].confidence:
+                        tally[2] = match
+
+                remaining = samples - completed
+                settled = all(
+                    max(t[0] for t in candidates.values()) >= quorum or
+                    max(t[0] for t in candidates.values()) + remaining < quorum
+                    for candidates in votes.values()
+                )
+                if votes and settled and completed >= quorum:
+                    if remaining:
+                        print(f"🗳️ Quorum reached after {completed}/{samples} samples")
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        winners = []
+        for pdf_field, candidates in votes.items():
+            winner = pick_consensus_winner(candidates, quorum)
+            if winner is None:
+                continue
+            json_field, (count, weight, best) = winner
+            winners.append(FieldMatch(
+                json_field=json_field,
+                pdf_field=pdf_field,
+                confidence=min(1.0, weight / completed),
+                suggested_value=best.suggested_value,
+                reasoning=best.reasoning
+            ))
+
+        print(f"🗳️ Consensus kept {len(winners)}/{len(votes)} fields from {completed} samples")
+        return {"matches": winners} if winners else None
 
     def _is_more_consistent(self, result: Dict) -> bool:
         if not self.previous_results:
             return True
         current = {(m.pdf_field, m.json_field) for m in result["matches"]}
+        if not current:
+            return False
         matches = sum(
             1 for prev in self.previous_results
             if len(current & {(m.pdf_field, m.json_field) for m in prev["matches"]}) / len(current) > 0.8
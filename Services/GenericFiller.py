@@ -2,10 +2,9 @@ import asyncio
 import json
 import os
 import re
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 
 import fitz
-from pypdf import PdfReader, PdfWriter
 from pypdf.generic import DictionaryObject, NameObject, BooleanObject, ArrayObject
 
 from pydantic_ai import Agent
@@ -17,11 +16,16 @@ from pydantic import BaseModel, field_validator
 
 
 from Common.constants import *
-
-API_KEYS = {
-    "field_matcher": API_KEY_3,
-}
-
+from Common.pdf_source import PdfSource, open_pdf, source_sha256
+from Services.APIKeyPool import PooledAgent
+from Services.LabelStore import FieldLabelStore
+from Services.LLMCaller import CircuitOpenError, LLMCaller
+from Services.LocalMatcher import LOCAL_MATCH_ENABLED, LocalFieldMatcher
+from Services.MappingCache import FieldMappingCache
+from Services.PromptBuilder import PromptBuilder
+from Services.TemplateRegistry import PreparedTemplate, TemplateMetadata
+from Services.WidgetFillEngine import apply_field_updates, document_bytes, filled_widget_values
+from Services.WorkerPool import run_in_worker
 
 class FieldMatch(BaseModel):
     json_field: str
@@ -37,18 +41,29 @@ class FieldMatch(BaseModel):
         return float(v)
 
 
-class MultiAgentFormFiller:
-    def __init__(self):
+def create_field_matcher_agent() -> PooledAgent:
+    """Field matching agent whose calls are spread across the API key pool."""
+    return PooledAgent(lambda api_key: Agent(
+        model=GeminiModel("gemini-1.5-flash", provider=GoogleGLAProvider(api_key=api_key)),
+        system_prompt="You are an expert at mapping PDF fields to JSON keys and filling them immediately.",
+        model_settings={
+            "temperature": 0.0,
 
-        self.agent = Agent(
-            model=GeminiModel("gemini-1.5-flash", provider=GoogleGLAProvider(api_key=API_KEYS["field_matcher"])),
-            system_prompt="You are an expert at mapping PDF fields to JSON keys and filling them immediately.",
-            model_settings={
-                "temperature": 0.0,
+        }
 
-            }
+    ), name="gemini-1.5-flash")
 
-        )
+
+class MultiAgentFormFiller:
+    def __init__(self, agent: Optional[PooledAgent] = None, label_store: Optional[FieldLabelStore] = None):
+        # Pooled agents are injected by the API; scripts fall back to a fresh one
+        self.agent = agent or create_field_matcher_agent()
+        self.llm = LLMCaller("field_matcher")
+        self.label_store = label_store
+        self.cache_hit = False
+        # Set when the agent was skipped because its circuit was open (local matches only)
+        self.degraded = False
+        self.output_bytes: Optional[bytes] = None
 
     # async def extract_pdf_fields(self, pdf_path: str) -> Dict[str, int]:
     #     """Extracts all fillable fields from a multi-page PDF."""
@@ -67,10 +82,10 @@ class MultiAgentFormFiller:
     #         print(f" - Field: '{field}' (Page {page + 1})")
     #
     #     return fields
-    async def extract_pdf_fields(self, pdf_path: str) -> Dict[str, int]:
-        """Extracts all fillable fields from a multi-page PDF."""
+    async def extract_pdf_fields(self, pdf_path: PdfSource) -> Dict[str, Dict[str, Any]]:
+        """Extracts all fillable fields from a multi-page PDF, with their page, type and readonly flag."""
         print("🔍 Extracting all fillable fields...")
-        doc = fitz.open(pdf_path)
+        doc = open_pdf(pdf_path)
         fields = {}
 
         for page_num, page in enumerate(doc, start=0):
@@ -78,7 +93,11 @@ class MultiAgentFormFiller:
                 if widget.field_name:
                     field_name = widget.field_name.strip()
                     sanitized_field_name = field_name # Remove special characters
-                    fields[sanitized_field_name] = page_num
+                    fields[sanitized_field_name] = {
+                        "page_num": page_num,
+                        "type": widget.field_type,
+                        "is_readonly": bool(widget.field_flags & 1)
+                    }
 
         if not fields:
             print("⚠️ No form fields found. Attempting text-based extraction...")
@@ -95,18 +114,77 @@ class MultiAgentFormFiller:
                     print("Field ext")
                     if field_name and len(field_name) > 1:
                         sanitized_field_name =field_name
-                        fields[sanitized_field_name] = page_num
+                        fields[sanitized_field_name] = {"page_num": page_num, "type": None, "is_readonly": False}
                         print(f"✅ Extracted field: {field_name} on page {page_num + 1}")
 
         print(f"✅ Extracted {len(fields)} fields across {len(doc)} pages.")
         doc.close()
         return fields
-    async def match_and_fill_fields(self, pdf_path: str, json_data: Dict[str, Any], output_pdf: str,
-                                    max_retries: int = 5):
+
+    async def prepare_template(self, pdf_path: PdfSource,
+                               template: Optional[TemplateMetadata] = None) -> PreparedTemplate:
+        """Collects the per-template inputs shared by every payload filled against it."""
+        if template is not None and template.widgets:
+            # Indexed templates already carry their widget list
+            pdf_fields = template.widget_fields()
+        else:
+            pdf_fields = await self.extract_pdf_fields(pdf_path)
+        template_hash = template.content_hash if template else source_sha256(pdf_path)
+        field_labels = self.label_store.labels_for(template_hash) if self.label_store else {}
+        return PreparedTemplate(source=pdf_path, pdf_fields=pdf_fields, template_hash=template_hash,
+                                page_count=template.page_count if template else None, field_labels=field_labels)
+
+    async def match_and_fill_fields(self, pdf_path: PdfSource, json_data: Dict[str, Any], output_pdf: Optional[str],
+                                    max_retries: int = 5,
+                                    mapping_cache: Optional[FieldMappingCache] = None,
+                                    template: Optional[TemplateMetadata] = None):
         """Matches fields using AI and
         fills them immediately across multiple pages."""
-        pdf_fields = await self.extract_pdf_fields(pdf_path)
+        self.output_bytes = None
+        prepared = await self.prepare_template(pdf_path, template)
+        pdf_fields = prepared.pdf_fields
         flat_json = self.flatten_json(json_data)
+
+        self.cache_hit = False
+        self.degraded = False
+        cache_key = None
+        if mapping_cache is not None:
+            cache_key = mapping_cache.build_key(prepared.template_hash, flat_json)
+            cached = mapping_cache.lookup(cache_key, flat_json)
+            if cached:
+                matches = [FieldMatch(**m) for m in cached if m["pdf_field"] in pdf_fields]
+                if matches:
+                    self.cache_hit = True
+                    return await self.fill_and_write(prepared, output_pdf, matches)
+
+        matches, self.degraded = await self.match_payload(prepared, flat_json, max_retries)
+
+        if not matches:
+            print("⚠️ No valid field matches were found after all attempts.")
+        elif mapping_cache is not None and not self.degraded:
+            # A local-only result would be served to later fills after the circuit recovers
+            mapping_cache.store(cache_key, matches, flat_json)
+
+        return await self.fill_and_write(prepared, output_pdf, matches)
+
+    async def match_payload(self, prepared: PreparedTemplate, flat_json: Dict[str, Any],
+                            max_retries: int = 5) -> Tuple[List[FieldMatch], bool]:
+        """Asks the agent to map one flattened payload onto the template's fields.
+
+        Fields the local matcher resolves confidently are not sent to the agent;
+        if it resolves all of them, the agent isn't called at all. Returns the
+        matches and whether they are degraded: local matches only, because the
+        agent's circuit was open.
+        """
+        local_matches = []
+        pdf_fields = prepared.pdf_fields
+        if LOCAL_MATCH_ENABLED:
+            local = LocalFieldMatcher().match(flat_json, pdf_fields, field_labels=prepared.field_labels)
+            local_matches = [FieldMatch(**m) for m in local.matches]
+            if not local.unresolved_fields:
+                return local_matches, False
+            # The payload stays whole: one value can legitimately fill several fields
+            pdf_fields = {name: pdf_fields[name] for name in local.unresolved_fields}
         state = ""
         # Print available JSON fields for debugging
         print("Available JSON fields:")
@@ -119,118 +197,92 @@ class MultiAgentFormFiller:
                 print(state)
         if state =='California':
             print("Running California")
-            prompt=PDF_FIELD_MATCHING_PROMPT_CALIFORNIA.format(
-                json_data=json.dumps(flat_json, indent=2),
-                pdf_fields=json.dumps(list(pdf_fields.keys()), indent=2)
-
-            )
+            template = PDF_FIELD_MATCHING_PROMPT_CALIFORNIA
         elif state == "Arizona":
             print("Running Arizona")
-            prompt = FEILD_ARIZONA.format(
-                json_data=json.dumps(flat_json, indent=2),
-                pdf_fields=json.dumps(list(pdf_fields.keys()), indent=2)
-
-            )
+            template = FEILD_ARIZONA
         elif state =="Maine" or state =="maine":
             print("Running Maine")
-            prompt = Fill_MAINE.format(
-                json_data=json.dumps(flat_json, indent=2),
-                pdf_fields=json.dumps(list(pdf_fields.keys()), indent=2)
-
-            )
-
-
+            template = Fill_MAINE
         else:
-            prompt = PDF_FIELD_MATCHING_PROMPT2.format(
-            json_data=json.dumps(flat_json, indent=2),
-            pdf_fields=json.dumps(list(pdf_fields.keys()), indent=2)
-        )
-
-        matches = []
-        for attempt in range(max_retries):
-            response = await self.agent.run(prompt)
-            matches = self.parse_ai_response(response.data)
-
-            if matches:
-                break
+            template = PDF_FIELD_MATCHING_PROMPT2
+        prompt = PromptBuilder().build(template, flat_json, pdf_fields, fields_as_names=True,
+                                       field_labels=prepared.field_labels)
 
-            print(f"Attempt {attempt + 1}/{max_retries} failed to get valid matches. Retrying...")
-
-        if not matches:
-            print("⚠️ No valid field matches were found after all attempts.")
-
-        self.fill_pdf_immediately(pdf_path, output_pdf, matches, pdf_fields)
-
-    def parse_ai_response(self, response_text: str) -> List[FieldMatch]:
-        """Parses AI response and extracts valid JSON matches, handling missing fields."""
-        response_text = re.sub(r"^```json", "", response_text).strip().rstrip("```")
+        known_fields = prepared.pdf_fields
+        degraded = False
         try:
-            data = json.loads(response_text)
-            matches = []
-
-            for match in data.get("matches", []):
-                match.setdefault("confidence", 1.0)
-                match.setdefault("reasoning", "No reasoning provided.")
-
-                try:
-                    validated_match = FieldMatch(**match)
-                    matches.append(validated_match)
-                except Exception as e:
-                    print(f"⚠️ Skipping malformed match: {match} | Error: {e}")
-
-            return matches
-        except json.JSONDecodeError:
-            print("❌ AI returned invalid JSON. Retrying...")
-            return []
-
-    def fill_pdf_immediately(self, template_pdf: str, output_pdf: str, matches: List[FieldMatch],
-                             pdf_fields: Dict[str, int]):
-        """Fills PDF form fields using PyMuPDF (fitz) for better compatibility."""
-
-        doc = fitz.open(template_pdf)
-
-
-        filled_fields = {}
-
-        for match in matches:
-            if match.pdf_field and match.suggested_value is not None:
-                page_num = pdf_fields.get(match.pdf_field, 0)
-                page = doc[page_num]
-
-                for widget in page.widgets():
-                    if widget.field_name == match.pdf_field:
-                        print(f"✍️ Filling: '{match.suggested_value}' → '{match.pdf_field}' (Page {page_num + 1})")
-                        try:
-                            # Update the field value
-                            widget.field_value = str(match.suggested_value)
-                            # Apply the changes to the widget
-                            widget.update()
-                            filled_fields[match.pdf_field] = match.suggested_value
-                        except Exception as e:
-                            print(f"⚠️ Error filling {match.pdf_field}: {e}")
-                        break
+            result = await self.llm.run_validated(
+                self.agent, prompt, {"matches": lambda m: self.validate_match(m, known_fields)},
+                max_rounds=max_retries
+            )
+            matches = result["matches"]
+        except CircuitOpenError as e:
+            print(f"⚠️ {e}; using local matches only")
+            matches, degraded = [], True
+
+        resolved = {m.pdf_field for m in local_matches}
+        return local_matches + [m for m in matches if m.pdf_field not in resolved], degraded
+
+    def lookup_cached_matches(self, mapping_cache: FieldMappingCache, prepared: PreparedTemplate,
+                              flat_json: Dict[str, Any]) -> List[FieldMatch]:
+        """Rebuilds matches for a payload from the mapping cache; empty on a miss."""
+        cache_key = mapping_cache.build_key(prepared.template_hash, flat_json)
+        cached = mapping_cache.lookup(cache_key, flat_json) or []
+        return [FieldMatch(**m) for m in cached if m["pdf_field"] in prepared.pdf_fields]
+
+    async def fill_matches(self, prepared: PreparedTemplate, matches: List[FieldMatch]) -> Optional[bytes]:
+        """Fills a fresh copy of the template in the "fill" worker stage and returns the PDF bytes."""
+        return await run_in_worker("fill", fill_pdf_to_bytes, prepared.source, matches)
+
+    async def fill_and_write(self, prepared: PreparedTemplate, output_pdf: Optional[str],
+                             matches: List[FieldMatch]) -> bool:
+        """Fills the template and writes the result once when an output path is given."""
+        self.output_bytes = await self.fill_matches(prepared, matches)
+        if self.output_bytes is None:
+            return False
 
-
-        doc.save(output_pdf)
-        doc.close()
+        if output_pdf:
+            with open(output_pdf, "wb") as f:
+                f.write(self.output_bytes)
+        return True
+
+    @staticmethod
+    def validate_match(match: Dict[str, Any], pdf_fields: Dict[str, Any]) -> FieldMatch:
+        """Builds a FieldMatch from one reply entry, rejecting fields the form doesn't have."""
+        match.setdefault("confidence", 1.0)
+        match.setdefault("reasoning", "No reasoning provided.")
+        validated_match = FieldMatch(**match)
+        if validated_match.pdf_field not in pdf_fields:
+            raise ValueError(f"pdf_field '{validated_match.pdf_field}' is not one of the form's fields")
+        return validated_match
+
+    @staticmethod
+    def fill_pdf_immediately(doc: fitz.Document, matches: List[FieldMatch]) -> Dict[str, Any]:
+        """Fills form fields in an open document using PyMuPDF (fitz) for better compatibility."""
+        # Later matches for the same field win, as they did when filled one by one
+        updates = {
+            match.pdf_field: match.suggested_value
+            for match in matches
+            if match.pdf_field and match.suggested_value is not None
+        }
+        result = apply_field_updates(doc, updates)
+        filled_fields = {name: updates[name] for name in result.applied}
 
         print(f"✅ Successfully filled {len(filled_fields)} fields: {list(filled_fields.keys())[:5]}...")
-
-        self.verify_pdf_filled(output_pdf)
         return filled_fields
 
-    def verify_pdf_filled(self, pdf_path: str) -> bool:
-        """Verifies that the PDF has been filled correctly."""
-        reader = PdfReader(pdf_path)
-        fields = reader.get_fields()
+    @staticmethod
+    def verify_pdf_filled(doc: fitz.Document) -> bool:
+        """Verifies from the in-memory widget state that the PDF has been filled correctly."""
+        fields = filled_widget_values(doc)
 
         if not fields:
-            print("⚠️ No fillable fields found. PDF may be flattened.")
+            print("⚠️ No filled fields found. PDF may be flattened.")
             return False
 
-        filled_fields = {k: v.get("/V") for k, v in fields.items() if v.get("/V")}
-        print(f"✅ Filled {len(filled_fields)} fields: {list(filled_fields.keys())[:5]}...")
-        return bool(filled_fields)
+        print(f"✅ Filled {len(fields)} fields: {list(fields.keys())[:5]}...")
+        return True
 
     def flatten_json(self, data: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
         """Flattens nested JSON objects into a flat dictionary."""
@@ -251,6 +303,17 @@ class MultiAgentFormFiller:
 
 
 
+def fill_pdf_to_bytes(pdf_path: PdfSource, matches: List[FieldMatch]) -> bytes:
+    """Fills one in-memory document and serializes it once. Runs in the "fill" worker stage."""
+    doc = open_pdf(pdf_path)
+    try:
+        MultiAgentFormFiller.fill_pdf_immediately(doc, matches)
+        MultiAgentFormFiller.verify_pdf_filled(doc)
+        return document_bytes(doc)
+    finally:
+        doc.close()
+
+
 async def main():
     form_filler = MultiAgentFormFiller()
     template_pdf = "D:\\demo\\Services\\Maine.pdf"
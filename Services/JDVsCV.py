@@ -2,13 +2,14 @@ import fitz
 import asyncio
 import os
 import json
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from pydantic_ai import Agent, RunContext
 from pydantic_ai.models.gemini import GeminiModel
 from pydantic_ai.result import RunResult
 from pydantic_ai.tools import ToolDefinition
 
 from Common.constants import API_KEY
+from Services.APIKeyPool import PooledAgent, get_key_pool
 
 
 async def extract_pdf_text_tool(ctx: RunContext, file_path: str) -> str:
@@ -35,11 +36,14 @@ async def fetch_website_content_tool(ctx: RunContext, url: str) -> str:
 
 
 class CVJDMatcher:
-    def __init__(self, api_key: str, model: str = "gemini-1.5-flash"):
+    def __init__(self, api_key: Optional[str] = None, model: str = "gemini-1.5-flash"):
         """
         Initializes the JD-CV Matcher using OpenAI API with pydantic_ai.
         """
-        self.llm = GeminiModel(model, api_key=api_key)
+        # Calls are spread across the shared API key pool; an explicit key joins it
+        self.key_pool = get_key_pool()
+        if api_key:
+            self.key_pool.add_key(api_key)
         self.system_prompt = """
         You are an expert recruiter AI analyzing resumes and job descriptions.
         Your task is to:
@@ -49,11 +53,11 @@ class CVJDMatcher:
         - Provide a match score (0-100%) and a comprehensive assessment.
         """
 
-        self.cv_jd_agent = Agent(
-            model=self.llm,
+        self.cv_jd_agent = PooledAgent(lambda key: Agent(
+            model=GeminiModel(model, api_key=key),
             system_prompt=self.system_prompt,
             retries=2,
-        )
+        ), self.key_pool)
 
     async def analyze_cv_and_jd(self, cv_text: str, jd_text: str) -> Dict[str, Any]:
 
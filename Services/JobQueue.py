@@ -0,0 +1,279 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, Any, List, Callable, Awaitable, Optional, Tuple
+
+import httpx
+
+DEFAULT_JOB_DB_PATH = os.path.join(os.path.dirname(__file__), "cache", "jobs.db")
+# Uploads for queued jobs live here until the job finishes
+DEFAULT_JOB_INPUT_DIR = os.path.join(os.path.dirname(__file__), "cache", "job_inputs")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 2.0))
+JOB_CALLBACK_ATTEMPTS = int(os.environ.get("JOB_CALLBACK_ATTEMPTS", 3))
+JOB_CALLBACK_TIMEOUT = float(os.environ.get("JOB_CALLBACK_TIMEOUT", 10.0))
+# Claims a job gets; one still processing at a restart after this many is failed instead of re-queued
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+
+JOB_COLUMNS = ("job_id", "dedup_key", "priority", "status", "payload", "callback_url", "result", "error",
+               "attempts", "created_at", "started_at", "finished_at", "callback_status")
+
+
+def remove_job_input(job: Dict[str, Any]) -> None:
+    """Deletes the uploaded input a job was queued with, once the job is finished."""
+    input_file = job["payload"].get("input_file")
+    if input_file and os.path.exists(input_file):
+        try:
+            os.remove(input_file)
+        except OSError as e:
+            print(f"⚠️ Could not remove job input {input_file}: {e}")
+
+
+class JobQueue:
+    """Persistent priority queue of form-fill jobs in SQLite.
+
+    Jobs are claimed highest priority first, oldest first within a priority.
+    A dedup key maps repeat submissions onto the existing job unless that
+    job failed. Jobs left "processing" by a crashed process go back to the
+    queue when it is opened again, unless they have already been claimed
+    max_attempts times: a job that keeps taking the process down is failed.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_JOB_DB_PATH, max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.db_path = db_path
+        self.max_attempts = max(1, max_attempts)
+        self._lock = threading.RLock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                dedup_key TEXT,
+                priority INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                callback_url TEXT,
+                result TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                callback_status TEXT
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, priority DESC, created_at)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_dedup ON jobs (dedup_key)")
+        abandoned = [self._row_to_job(row) for row in self._conn.execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE status = 'processing' AND attempts >= ?",
+            (self.max_attempts,)
+        ).fetchall()]
+        for job in abandoned:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE job_id = ?",
+                (f"Interrupted {job['attempts']} times; giving up", time.time(), job["job_id"])
+            )
+        recovered = self._conn.execute(
+            "UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'processing'"
+        ).rowcount
+        self._conn.commit()
+        for job in abandoned:
+            remove_job_input(job)
+        if abandoned:
+            print(f"🪦 Failed {len(abandoned)} jobs interrupted {self.max_attempts} times")
+        if recovered:
+            print(f"♻️ Re-queued {recovered} jobs interrupted by a restart")
+
+    @staticmethod
+    def _row_to_job(row: Optional[Tuple]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(zip(JOB_COLUMNS, row))
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def enqueue(self, payload: Dict[str, Any], priority: int = 0, dedup_key: Optional[str] = None,
+                callback_url: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        """Adds a job, or returns the live job with the same dedup key. The flag is True if it was added."""
+        with self._lock:
+            if dedup_key:
+                row = self._conn.execute(
+                    f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE dedup_key = ? AND status != 'failed' "
+                    "ORDER BY created_at DESC LIMIT 1",
+                    (dedup_key,)
+                ).fetchone()
+                if row is not None:
+                    return self._row_to_job(row), False
+
+            job_id = str(uuid.uuid4())
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, dedup_key, priority, status, payload, callback_url, created_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                (job_id, dedup_key, priority, json.dumps(payload), callback_url, time.time())
+            )
+            self._conn.commit()
+            return self.get(job_id), True
+
+    def claim_next(self) -> Optional[Dict[str, Any]]:
+        """Marks the next queued job as processing and returns it."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job_id FROM jobs WHERE status = 'queued' ORDER BY priority DESC, created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET status = 'processing', started_at = ?, attempts = attempts + 1 WHERE job_id = ?",
+                (time.time(), row[0])
+            )
+            self._conn.commit()
+            return self.get(row[0])
+
+    def complete(self, job_id: str, result: Dict[str, Any]) -> None:
+        self._finish(job_id, "completed", result=json.dumps(result))
+
+    def fail(self, job_id: str, error: str) -> None:
+        self._finish(job_id, "failed", error=error)
+
+    def _finish(self, job_id: str, status: str, result: Optional[str] = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE job_id = ?",
+                (status, result, error, time.time(), job_id)
+            )
+            self._conn.commit()
+
+    def set_callback_status(self, job_id: str, callback_status: str) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET callback_status = ? WHERE job_id = ?", (callback_status, job_id))
+            self._conn.commit()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return self._row_to_job(row)
+
+    def position(self, job_id: str) -> Optional[int]:
+        """How many queued jobs will be claimed before this one (None unless it is queued)."""
+        job = self.get(job_id)
+        if job is None or job["status"] != "queued":
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND "
+                "(priority > ? OR (priority = ? AND created_at < ?))",
+                (job["priority"], job["priority"], job["created_at"])
+            ).fetchone()
+        return row[0]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+async def post_callback(callback_url: str, body: Dict[str, Any],
+                        attempts: int = JOB_CALLBACK_ATTEMPTS) -> str:
+    """POSTs a job's outcome to its callback URL, retrying with backoff; returns the delivery status."""
+    async with httpx.AsyncClient(timeout=JOB_CALLBACK_TIMEOUT) as client:
+        for attempt in range(attempts):
+            try:
+                response = await client.post(callback_url, json=body)
+                if response.status_code < 500:
+                    return f"delivered ({response.status_code})"
+                error = f"HTTP {response.status_code}"
+            except httpx.HTTPError as e:
+                error = str(e) or type(e).__name__
+            print(f"⚠️ Callback to {callback_url} failed on attempt {attempt + 1}/{attempts}: {error}")
+            if attempt < attempts - 1:
+                await asyncio.sleep(2 ** attempt)
+    return f"failed ({error})"
+
+
+class JobWorkerPool:
+    """Asyncio workers that drain a JobQueue through a handler coroutine.
+
+    The handler receives the claimed job and returns its result dict; an
+    exception marks the job failed. The job's uploaded input is removed
+    only once its outcome is recorded. Queue calls run in threads, off the
+    event loop. Workers wake immediately on notify() and otherwise poll
+    every JOB_POLL_INTERVAL seconds.
+    """
+
+    def __init__(self, queue: JobQueue, handler: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+                 workers: int = JOB_WORKERS, poll_interval: float = JOB_POLL_INTERVAL):
+        self.queue = queue
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._active = 0
+
+    def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        print(f"✅ Started {self.workers} job workers")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def health(self) -> Dict[str, Any]:
+        return {"workers": len(self._tasks), "active": self._active, "jobs": self.queue.stats()}
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job = await asyncio.to_thread(self.queue.claim_next)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._active += 1
+            job_id = job["job_id"]
+            print(f"🛠️ Worker {index} processing job {job_id} (priority {job['priority']})")
+            try:
+                result = await self.handler(job)
+                await asyncio.to_thread(self.queue.complete, job_id, result)
+                body = {"job_id": job_id, "status": "completed", "result": result}
+            except asyncio.CancelledError:
+                # Left "processing" with its input, so the next start re-queues it
+                raise
+            except Exception as e:
+                print(f"❌ Job {job_id} failed: {e}")
+                await asyncio.to_thread(self.queue.fail, job_id, str(e))
+                body = {"job_id": job_id, "status": "failed", "error": str(e)}
+            finally:
+                self._active -= 1
+            await asyncio.to_thread(remove_job_input, job)
+
+            if job["callback_url"]:
+                callback_status = await post_callback(job["callback_url"], body)
+                await asyncio.to_thread(self.queue.set_callback_status, job_id, callback_status)
@@ -0,0 +1,321 @@
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import Dict, Any, List, Callable, Optional, Tuple
+
+# Transport retries per agent call (rate limits, timeouts, 5xx)
+LLM_MAX_ATTEMPTS = int(os.environ.get("LLM_MAX_ATTEMPTS", 4))
+LLM_BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", 1.0))
+LLM_BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", 30.0))
+# Consecutive failed calls that open the circuit, and how long it stays open
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("LLM_CIRCUIT_FAILURES", 5))
+CIRCUIT_RESET_SECONDS = float(os.environ.get("LLM_CIRCUIT_RESET_SECONDS", 60))
+
+_RATE_LIMIT_MARKERS = ("429", "resource_exhausted", "resource exhausted", "quota", "rate limit", "too many requests")
+_TRANSIENT_MARKERS = ("500", "502", "503", "504", "timeout", "timed out", "unavailable", "deadline",
+                      "connection", "overloaded")
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the model while its circuit is open."""
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    if getattr(error, "status_code", None) == 429:
+        return True
+    text = str(error).lower()
+    return any(marker in text for marker in _RATE_LIMIT_MARKERS)
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """Rate limits and transport hiccups are worth retrying; bad requests are not."""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)) or is_rate_limit_error(error):
+        return True
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status >= 500
+    text = str(error).lower()
+    return any(marker in text for marker in _TRANSIENT_MARKERS)
+
+
+def backoff_delay(attempt: int, base: float = LLM_BACKOFF_BASE, cap: float = LLM_BACKOFF_MAX) -> float:
+    """Exponential backoff with full jitter, so concurrent callers don't retry in lockstep."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """Stops calling a model after repeated failures, then lets one probe through after a cool-down.
+
+    While the probe is in flight every other caller is refused; a probe that
+    never reports back (e.g. a cancelled call) is given up after reset_seconds.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_started_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; when half-open, only the caller that takes the probe may."""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "open":
+                return False
+            now = time.monotonic()
+            if self.probe_started_at is not None and now - self.probe_started_at < self.reset_seconds:
+                return False
+            self.probe_started_at = now
+            return True
+
+    def check(self) -> None:
+        if not self.allow():
+            remaining = max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+            raise CircuitOpenError(f"Circuit for '{self.name}' is open; retry in {remaining:.0f}s")
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.opened_at is not None:
+                print(f"🔌 Circuit for '{self.name}' closed")
+            self.failures = 0
+            self.opened_at = None
+            self.probe_started_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            # A failed probe re-opens the circuit for another full cool-down
+            if self.failures >= self.failure_threshold or self.probe_started_at is not None:
+                if self.state != "open":
+                    print(f"🔌 Circuit for '{self.name}' opened after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+                self.probe_started_at = None
+
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """One breaker per name (e.g. "<model>:<key label>"), shared by every filler in the process."""
+    with _breakers_lock:
+        if name not in _BREAKERS:
+            _BREAKERS[name] = CircuitBreaker(name)
+        return _BREAKERS[name]
+
+
+def pick_consensus_winner(candidates: Dict[str, List[Any]], quorum: int) -> Optional[Tuple[str, List[Any]]]:
+    """The candidate with the most votes among those that reached quorum; summed confidence breaks ties.
+
+    candidates maps each proposed value to its tally, [vote count, confidence
+    sum, ...]. Returns (value, tally), or None when nothing reached quorum.
+    """
+    eligible = [(value, tally) for value, tally in candidates.items() if tally[0] >= quorum]
+    if not eligible:
+        return None
+    return max(eligible, key=lambda item: (item[1][0], item[1][1]))
+
+
+def strip_trailing_commas(text: str) -> str:
+    """Drops commas directly before a closing bracket, leaving string contents alone."""
+    out: List[str] = []
+    in_string = escaped = False
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == ",":
+            rest = text[i + 1:].lstrip()
+            if rest[:1] in ("}", "]"):
+                continue
+        out.append(char)
+    return "".join(out)
+
+
+def repair_json(text: str) -> Optional[Any]:
+    """Parses a model reply as JSON, salvaging what it can from fenced, chatty or truncated output.
+
+    Valid JSON is returned as is. Otherwise code fences and text around the
+    outermost object are stripped, trailing commas removed, and a reply cut
+    off mid-way is closed after its last complete value so the entries
+    before the cut survive.
+    """
+    try:
+        return json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        pass
+    text = re.sub(r"```(?:json)?", "", text).strip()
+    start = min([i for i in (text.find("{"), text.find("[")) if i >= 0], default=-1)
+    if start < 0:
+        return None
+    text = text[start:]
+
+    def attempt(candidate: str) -> Optional[Any]:
+        try:
+            return json.loads(strip_trailing_commas(candidate))
+        except json.JSONDecodeError:
+            return None
+
+    end = max(text.rfind("}"), text.rfind("]"))
+    parsed = attempt(text[:end + 1]) if end >= 0 else None
+    if parsed is not None:
+        return parsed
+
+    # Truncated: cut after the last complete nested value and close what's still open
+    stack: List[str] = []
+    in_string = escaped = False
+    safe_end, safe_stack = -1, []
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]":
+            if not stack:
+                break
+            stack.pop()
+            if stack:
+                safe_end, safe_stack = i + 1, list(stack)
+    if safe_end < 0:
+        return None
+    return attempt(text[:safe_end].rstrip().rstrip(",") + "".join(reversed(safe_stack)))
+
+
+class LLMCaller:
+    """Shared agent call layer for the fillers.
+
+    run() retries rate limits and transient errors with jittered exponential
+    backoff behind a circuit breaker. Pooled agents keep one breaker per
+    model and API key, so a failing key doesn't stop traffic on the others;
+    any other agent gets the caller's own breaker. run_validated() parses the
+    reply with repair_json, validates every entry, and when some entries fail
+    it asks the model to correct just those, in the same conversation,
+    instead of resending the whole prompt.
+    """
+
+    def __init__(self, name: str, max_attempts: int = LLM_MAX_ATTEMPTS):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.breaker = get_circuit_breaker(name)
+
+    async def run(self, agent, prompt: str, message_history: Optional[List[Any]] = None, **run_kwargs):
+        """One agent call with transport retries; returns the agent's result object.
+
+        Extra keyword arguments (e.g. model_settings) are passed through to agent.run.
+        """
+        breaker = None if getattr(agent, "per_key_circuits", False) else self.breaker
+        for attempt in range(self.max_attempts):
+            if breaker:
+                breaker.check()
+            try:
+                if message_history:
+                    response = await agent.run(prompt, message_history=message_history, **run_kwargs)
+                else:
+                    response = await agent.run(prompt, **run_kwargs)
+                if breaker:
+                    breaker.record_success()
+                return response
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                if breaker:
+                    breaker.record_failure()
+                if not is_retryable_error(e) or attempt == self.max_attempts - 1:
+                    raise
+                delay = backoff_delay(attempt + (1 if is_rate_limit_error(e) else 0))
+                print(f"⏳ {self.name} call failed ({e}); retry {attempt + 1}/{self.max_attempts - 1} "
+                      f"in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def run_validated(self, agent, prompt: str,
+                            validators: Dict[str, Callable[[Dict[str, Any]], Any]],
+                            max_rounds: int = 3, **run_kwargs) -> Dict[str, List[Any]]:
+        """Asks for a JSON object of entry lists and returns the validated entries per key.
+
+        validators maps each top-level key (e.g. "matches") to a function that
+        builds the entry or raises. Entries that validate are kept across
+        rounds; follow-up rounds only ask about the ones that didn't.
+        """
+        accepted: Dict[str, List[Any]] = {key: [] for key in validators}
+        message_history = None
+        request = prompt
+
+        for round_num in range(max_rounds):
+            response = await self.run(agent, request, message_history, **run_kwargs)
+            data = repair_json(response.data)
+            history = getattr(response, "all_messages", None)
+            message_history = history() if callable(history) else None
+
+            if not isinstance(data, dict):
+                print(f"⚠️ Round {round_num + 1}/{max_rounds}: reply was not valid JSON")
+                request = self._followup(prompt, message_history,
+                                         "Your reply was not valid JSON. Reply again with only the JSON object.")
+                continue
+
+            failed: Dict[str, List[Tuple[Any, str]]] = {}
+            for key, validate in validators.items():
+                for entry in data.get(key) or []:
+                    try:
+                        accepted[key].append(validate(dict(entry)))
+                    except Exception as e:
+                        failed.setdefault(key, []).append((entry, str(e)))
+
+            if failed:
+                count = sum(len(entries) for entries in failed.values())
+                print(f"⚠️ Round {round_num + 1}/{max_rounds}: {count} entries failed validation, re-asking for those")
+                correction = {key: [{"entry": entry, "error": error} for entry, error in entries]
+                              for key, entries in failed.items()}
+                request = self._followup(
+                    prompt, message_history,
+                    "These entries from your reply failed validation:\n"
+                    f"{json.dumps(correction, default=str)}\n"
+                    "Reply with only a JSON object containing corrected versions of these entries, "
+                    "under the same keys. Omit any entry you cannot correct."
+                )
+                continue
+
+            if any(accepted.values()):
+                break
+            print(f"⚠️ Round {round_num + 1}/{max_rounds}: no entries returned")
+            request = self._followup(prompt, message_history,
+                                     "Your reply contained no entries. Map the fields again and reply "
+                                     "with only the JSON object.")
+
+        return accepted
+
+    @staticmethod
+    def _followup(prompt: str, message_history: Optional[List[Any]], instruction: str) -> str:
+        # Without a conversation to continue, the instruction has to carry the original prompt
+        return instruction if message_history else f"{prompt}\n\n{instruction}"
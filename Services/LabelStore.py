@@ -0,0 +1,160 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional
+
+from Common.pdf_source import source_sha256
+
+DEFAULT_LABEL_DB_PATH = os.path.join(os.path.dirname(__file__), "cache", "field_labels.db")
+# Bump when the extraction prompt or image encoding changes; older label sets are then ignored
+LABEL_EXTRACTOR_VERSION = "gemini-vision-1"
+# Label sets kept per template (older versions are pruned on store)
+LABEL_VERSIONS_KEPT = int(os.environ.get("LABEL_VERSIONS_KEPT", 3))
+# Run label extraction in the background the first time a stored template is filled
+LABEL_EXTRACT_ON_FIRST_SIGHT = os.environ.get("LABEL_EXTRACT_ON_FIRST_SIGHT", "1") == "1"
+
+
+@dataclass
+class LabelSet:
+    """One extraction run's widget labels (and vision-detected fields) for a template."""
+    template_hash: str
+    version: int
+    labels: Dict[str, str]
+    ai_fields: Dict[str, Any] = field(default_factory=dict)
+    source: str = ""
+    extractor_version: str = LABEL_EXTRACTOR_VERSION
+    created_at: float = 0.0
+
+
+class FieldLabelStore:
+    """Persistent, versioned field -> label pairs keyed by template content hash.
+
+    Each store() adds a new version; readers always get the newest version
+    produced by the current LABEL_EXTRACTOR_VERSION, so re-extracting with a
+    better prompt never mixes old and new labels.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_LABEL_DB_PATH, versions_kept: int = LABEL_VERSIONS_KEPT):
+        self.db_path = db_path
+        self.versions_kept = versions_kept
+        self._lock = threading.Lock()
+        # Latest label set per template hash; misses aren't remembered so offline runs show up at once
+        self._memo: Dict[str, LabelSet] = {}
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS field_labels (
+                template_hash TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                extractor_version TEXT NOT NULL,
+                labels TEXT NOT NULL,
+                ai_fields TEXT NOT NULL,
+                source TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (template_hash, version)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def latest(self, template_hash: str) -> Optional[LabelSet]:
+        """Newest label set from the current extractor version, or None."""
+        with self._lock:
+            if template_hash in self._memo:
+                return self._memo[template_hash]
+            row = self._conn.execute(
+                "SELECT version, labels, ai_fields, source, created_at FROM field_labels "
+                "WHERE template_hash = ? AND extractor_version = ? ORDER BY version DESC LIMIT 1",
+                (template_hash, LABEL_EXTRACTOR_VERSION)
+            ).fetchone()
+            if row is None:
+                return None
+            version, labels, ai_fields, source, created_at = row
+            label_set = LabelSet(template_hash, version, json.loads(labels), json.loads(ai_fields),
+                                 source, LABEL_EXTRACTOR_VERSION, created_at)
+            self._memo[template_hash] = label_set
+            return label_set
+
+    def labels_for(self, template_hash: str) -> Dict[str, str]:
+        """Field name -> label for a template; empty when it hasn't been extracted yet."""
+        label_set = self.latest(template_hash)
+        return dict(label_set.labels) if label_set else {}
+
+    def has(self, template_hash: str) -> bool:
+        return self.latest(template_hash) is not None
+
+    def store(self, template_hash: str, labels: Dict[str, str], ai_fields: Optional[Dict[str, Any]] = None,
+              source: str = "") -> int:
+        """Saves a new version of a template's labels and returns its version number."""
+        labels = {str(k): str(v).strip() for k, v in labels.items() if str(v).strip()}
+        with self._lock:
+            (latest_version,) = self._conn.execute(
+                "SELECT COALESCE(MAX(version), 0) FROM field_labels WHERE template_hash = ?", (template_hash,)
+            ).fetchone()
+            version = latest_version + 1
+            self._conn.execute(
+                "INSERT INTO field_labels (template_hash, version, extractor_version, labels, ai_fields, source, "
+                "created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (template_hash, version, LABEL_EXTRACTOR_VERSION, json.dumps(labels),
+                 json.dumps(ai_fields or {}), source, time.time())
+            )
+            self._conn.execute(
+                "DELETE FROM field_labels WHERE template_hash = ? AND version <= ?",
+                (template_hash, version - self.versions_kept)
+            )
+            self._conn.commit()
+            self._memo.pop(template_hash, None)
+
+        print(f"🏷️ Stored {len(labels)} field labels for template {template_hash[:12]} (v{version})")
+        return version
+
+    def versions(self, template_hash: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT version, extractor_version, source, created_at, labels FROM field_labels "
+                "WHERE template_hash = ? ORDER BY version DESC",
+                (template_hash,)
+            ).fetchall()
+        return [{"version": v, "extractor_version": ev, "source": s, "created_at": c, "labels": len(json.loads(l))}
+                for v, ev, s, c, l in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            templates, versions = self._conn.execute(
+                "SELECT COUNT(DISTINCT template_hash), COUNT(*) FROM field_labels"
+            ).fetchone()
+        return {"templates": templates, "versions": versions, "extractor_version": LABEL_EXTRACTOR_VERSION}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+async def extract_template_labels(pdf_path: str, store: FieldLabelStore, template_hash: Optional[str] = None,
+                                  include_ai_fields: bool = False, source: str = "") -> int:
+    """Runs the vision label extraction for a template on disk and stores the result.
+
+    Widget labels are always extracted; include_ai_fields also runs the
+    whole-page field detection (as extract_all_methods does), which flat
+    forms need but fillable ones don't.
+    """
+    # Imported lazily: the extractor pulls in the Gemini vision client
+    from main import GeminiPDFLabelExtractor
+
+    extractor = GeminiPDFLabelExtractor()
+    template_hash = template_hash or source_sha256(pdf_path)
+    if include_ai_fields:
+        labels, ai_fields = await asyncio.gather(
+            extractor.extract_labels_from_pymupdf_fields_async(pdf_path),
+            extractor.extract_field_labels_async(pdf_path)
+        )
+    else:
+        labels, ai_fields = await extractor.extract_labels_from_pymupdf_fields_async(pdf_path), {}
+    return store.store(template_hash, labels, ai_fields, source or ("offline" if include_ai_fields else "first_sight"))
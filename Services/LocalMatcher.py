@@ -0,0 +1,204 @@
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+# Pairs scoring at least this much, and clearly ahead of the runner-up, skip the LLM
+LOCAL_MATCH_THRESHOLD = float(os.environ.get("LOCAL_MATCH_THRESHOLD", 0.82))
+LOCAL_MATCH_MARGIN = float(os.environ.get("LOCAL_MATCH_MARGIN", 0.12))
+LOCAL_MATCH_ENABLED = os.environ.get("LOCAL_MATCH_ENABLED", "1") == "1"
+
+# Path segments that carry no meaning on their own
+NOISE_TOKENS = {
+    "data", "orderdetails", "strapiorderformjson", "payload", "formation", "details",
+    "info", "field", "fields", "text", "txt", "value", "cd", "the", "of", "and", "for", "1st",
+}
+
+# Canonical token for each abbreviation or synonym seen in payloads and form field names
+SYNONYMS = {
+    "addr": "address", "add": "address", "street": "address", "st": "address", "line1": "address",
+    "line": "address", "zip": "zipcode", "zipcode": "zipcode", "postal": "zipcode", "postcode": "zipcode",
+    "nm": "name", "fname": "first", "firstname": "first", "lname": "last", "lastname": "last",
+    "org": "organizer", "organiser": "organizer", "incorporator": "organizer",
+    "ra": "agent", "registered": "agent", "agent": "agent",
+    "llc": "company", "corp": "company", "corporation": "company", "company": "company", "business": "company",
+    "tel": "phone", "telephone": "phone", "ph": "phone", "mobile": "phone",
+    "mail": "email", "emailaddress": "email",
+    "sig": "signature", "sign": "signature", "signed": "signature",
+    "dt": "date", "yr": "year", "no": "number", "num": "number", "nbr": "number", "#": "number",
+    "cty": "city", "town": "city", "state": "state", "province": "state",
+}
+
+_CAMEL_SPLIT = re.compile(r"(?<=[a-z0-9])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])")
+_NON_ALNUM = re.compile(r"[^a-z0-9#]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Splits camelCase, snake_case, dotted paths and list indices into canonical tokens."""
+    text = _CAMEL_SPLIT.sub(" ", str(text))
+    tokens = []
+    for token in _NON_ALNUM.split(text.lower()):
+        if not token or token.isdigit() or token in NOISE_TOKENS:
+            continue
+        tokens.append(SYNONYMS.get(token, token))
+    return tokens
+
+
+def json_key_text(json_key: str, segments: int = 2) -> str:
+    """The last few path segments of a flattened key; earlier ones are mostly containers."""
+    parts = [p for p in re.split(r"\.|\[\d+\]", json_key) if p]
+    return " ".join(parts[-segments:])
+
+
+def char_ngram_vectors(texts: List[str], n: int = 3) -> np.ndarray:
+    """L2-normalised TF-IDF vectors of character n-grams, one row per text."""
+    grams_per_text = []
+    vocabulary: Dict[str, int] = {}
+    for text in texts:
+        padded = f" {' '.join(tokenize(text))} "
+        grams = [padded[i:i + n] for i in range(max(len(padded) - n + 1, 0))]
+        grams_per_text.append(grams)
+        for gram in grams:
+            vocabulary.setdefault(gram, len(vocabulary))
+
+    counts = np.zeros((len(texts), max(len(vocabulary), 1)), dtype=np.float32)
+    for row, grams in enumerate(grams_per_text):
+        for gram in grams:
+            counts[row, vocabulary[gram]] += 1
+
+    document_frequency = (counts > 0).sum(axis=0)
+    idf = np.log((1 + len(texts)) / (1 + document_frequency)) + 1
+    vectors = counts * idf
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def token_overlap_matrix(left: List[List[str]], right: List[List[str]]) -> np.ndarray:
+    """Share of each left token set covered by each right one, |A ∩ B| / |A|.
+
+    Unlike the overlap coefficient, a short field name can't score 1.0
+    against every key that merely contains its one meaningful token.
+    """
+    vocabulary = {token: i for i, token in enumerate(sorted({t for tokens in left + right for t in tokens}))}
+    if not vocabulary:
+        return np.zeros((len(left), len(right)), dtype=np.float32)
+
+    def one_hot(token_lists: List[List[str]]) -> np.ndarray:
+        matrix = np.zeros((len(token_lists), len(vocabulary)), dtype=np.float32)
+        for row, tokens in enumerate(token_lists):
+            for token in tokens:
+                matrix[row, vocabulary[token]] = 1
+        return matrix
+
+    a, b = one_hot(left), one_hot(right)
+    shared = a @ b.T
+    key_sizes = a.sum(axis=1, keepdims=True)
+    return shared / np.where(key_sizes == 0, 1, key_sizes)
+
+
+@dataclass
+class LocalMatchResult:
+    matches: List[Dict[str, Any]] = field(default_factory=list)
+    unresolved_fields: List[str] = field(default_factory=list)
+    unresolved_keys: List[str] = field(default_factory=list)
+
+
+class LocalFieldMatcher:
+    """Deterministic JSON key -> PDF field matcher that runs before the agent.
+
+    Scores every (payload key, form field) pair on normalised token overlap
+    (with a synonym table) and character-trigram TF-IDF cosine, using the
+    field name plus any nearby label text from field context. A pair is
+    accepted only when it clears the threshold and beats the runner-up for
+    both its key and its field by a margin; everything else is left for the
+    model. Fields whose label reduces to a single token (e.g. "Name") are
+    too ambiguous to resolve locally and always go to the model.
+    """
+
+    def __init__(self, threshold: float = LOCAL_MATCH_THRESHOLD, margin: float = LOCAL_MATCH_MARGIN):
+        self.threshold = threshold
+        self.margin = margin
+
+    @staticmethod
+    def _fillable_keys(flat_json: Dict[str, Any]) -> List[str]:
+        # Booleans (checkboxes) and empty values need the model's judgement
+        return [k for k, v in flat_json.items()
+                if v is not None and not isinstance(v, bool) and str(v).strip() != ""]
+
+    @staticmethod
+    def _field_labels(pdf_fields: Dict[str, Any],
+                      field_context: Optional[List[Dict[str, Any]]],
+                      field_labels: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        # Stored vision labels name the field the way the form does; nearby OCR text adds to them
+        labels = {name: f"{name} {(field_labels or {}).get(name, '')}".strip() for name in pdf_fields}
+        for context in field_context or []:
+            name = context.get("field_name")
+            if name in labels:
+                nearby = " ".join(t.get("text", "") for t in context.get("nearby_text", [])[:2])
+                labels[name] = f"{labels[name]} {nearby}".strip()
+        return labels
+
+    @staticmethod
+    def _is_text_field(info: Any) -> bool:
+        # Both fillers pass widget info with a type (7 = text); None marks a label from a flat form's text
+        if isinstance(info, dict):
+            return info.get("type") in (None, 7) and not info.get("is_readonly", False)
+        return True
+
+    def match(self, flat_json: Dict[str, Any], pdf_fields: Dict[str, Any],
+              field_context: Optional[List[Dict[str, Any]]] = None,
+              field_labels: Optional[Dict[str, str]] = None) -> LocalMatchResult:
+        keys = self._fillable_keys(flat_json)
+        labels = self._field_labels(pdf_fields, field_context, field_labels)
+        field_names = [name for name, info in pdf_fields.items()
+                       if self._is_text_field(info) and len(set(tokenize(labels[name]))) > 1]
+        result = LocalMatchResult()
+        if not keys or not field_names:
+            result.unresolved_fields = list(pdf_fields)
+            result.unresolved_keys = list(flat_json)
+            return result
+
+        key_texts = [json_key_text(k) for k in keys]
+        field_texts = [labels[name] for name in field_names]
+
+        vectors = char_ngram_vectors(key_texts + field_texts)
+        char_scores = vectors[:len(keys)] @ vectors[len(keys):].T
+        token_scores = token_overlap_matrix([tokenize(t) for t in key_texts],
+                                            [tokenize(t) for t in field_texts])
+        scores = 0.5 * char_scores + 0.5 * token_scores
+
+        matched_fields = set()
+        matched_keys = set()
+        for row, col in self._confident_pairs(scores):
+            key, name = keys[row], field_names[col]
+            matched_keys.add(key)
+            matched_fields.add(name)
+            result.matches.append({
+                "json_field": key,
+                "pdf_field": name,
+                "confidence": round(float(scores[row, col]), 3),
+                "suggested_value": flat_json[key],
+                "reasoning": "Matched locally on field name and label similarity."
+            })
+
+        result.unresolved_fields = [name for name in pdf_fields if name not in matched_fields]
+        result.unresolved_keys = [key for key in flat_json if key not in matched_keys]
+        print(f"🧮 Local matcher resolved {len(result.matches)} fields; "
+              f"{len(result.unresolved_fields)} left for the model")
+        return result
+
+    def _confident_pairs(self, scores: np.ndarray) -> List[Tuple[int, int]]:
+        """Mutual best pairs above threshold whose lead over the runner-up exceeds the margin."""
+        pairs = []
+        for row in range(scores.shape[0]):
+            col = int(scores[row].argmax())
+            best = scores[row, col]
+            if best < self.threshold or int(scores[:, col].argmax()) != row:
+                continue
+            row_runner_up = np.partition(scores[row], -2)[-2] if scores.shape[1] > 1 else 0.0
+            col_runner_up = np.partition(scores[:, col], -2)[-2] if scores.shape[0] > 1 else 0.0
+            if best - max(row_runner_up, col_runner_up) >= self.margin:
+                pairs.append((row, col))
+        return pairs
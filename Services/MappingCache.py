@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, List, Optional
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(__file__), "cache", "field_mappings.db")
+DEFAULT_MAX_ENTRIES = 500
+# Part of every key; bumped when what an entry holds changes (2: complete mappings only)
+MAPPING_CACHE_VERSION = 2
+
+
+class FieldMappingCache:
+    """On-disk LRU cache of JSON key path -> PDF field mappings.
+
+    Entries are keyed by the template's content hash plus a signature of the
+    flattened payload's key set, so repeat fills of a known template with a
+    payload of the same shape can skip the LLM entirely. Only the mapping is
+    stored; values are always read from the current payload, so only results
+    whose every value is a payload path are cached.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS field_mappings (
+                cache_key TEXT PRIMARY KEY,
+                template_hash TEXT NOT NULL,
+                key_signature TEXT NOT NULL,
+                mappings TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_field_mappings_last_used ON field_mappings (last_used_at)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def key_signature(flat_json: Dict[str, Any]) -> str:
+        """Signature of the flattened payload's key set (order independent)."""
+        joined = "\n".join([f"v{MAPPING_CACHE_VERSION}"] + sorted(flat_json.keys()))
+        return hashlib.sha256(joined.encode("utf-8")).hexdigest()
+
+    def build_key(self, template_hash: str, flat_json: Dict[str, Any]) -> str:
+        return f"{template_hash}:{self.key_signature(flat_json)}"
+
+    def lookup(self, cache_key: str, flat_json: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """Returns field matches rebuilt from the cached mapping, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT mappings FROM field_mappings WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE field_mappings SET last_used_at = ?, hits = hits + 1 WHERE cache_key = ?",
+                (time.time(), cache_key)
+            )
+            self._conn.commit()
+
+        matches = []
+        for mapping in json.loads(row[0]):
+            json_field = mapping["json_field"]
+            if json_field not in flat_json:
+                continue
+            matches.append({
+                "json_field": json_field,
+                "pdf_field": mapping["pdf_field"],
+                "confidence": mapping.get("confidence", 1.0),
+                "suggested_value": flat_json[json_field],
+                "reasoning": "Served from field mapping cache."
+            })
+
+        print(f"⚡ Mapping cache hit: {len(matches)} field mappings reused")
+        return matches
+
+    def store(self, cache_key: str, matches: List[Any], flat_json: Dict[str, Any]) -> int:
+        """Caches the mapping behind a set of LLM matches, only if every match can be replayed.
+
+        A match whose suggested value was transformed by the model (or isn't
+        read from a payload path) can't be rebuilt from another payload. A
+        hit on a partial mapping would fill fewer fields than a miss, so such
+        a result isn't cached at all.
+        """
+        mappings = []
+        for match in matches:
+            json_field = match.json_field
+            if (not match.pdf_field or json_field not in flat_json or
+                    str(flat_json[json_field]) != str(match.suggested_value)):
+                print(f"💾 Mapping not cached: '{match.pdf_field}' isn't read straight from the payload")
+                return 0
+            mappings.append({
+                "json_field": json_field,
+                "pdf_field": match.pdf_field,
+                "confidence": match.confidence
+            })
+
+        if not mappings:
+            return 0
+
+        template_hash, key_signature = cache_key.split(":", 1)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO field_mappings
+                    (cache_key, template_hash, key_signature, mappings, created_at, last_used_at, hits)
+                VALUES (?, ?, ?, ?, ?, ?, 0)
+                """,
+                (cache_key, template_hash, key_signature, json.dumps(mappings), now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+        print(f"💾 Cached {len(mappings)} field mappings")
+        return len(mappings)
+
+    def invalidate_template(self, template_hash: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM field_mappings WHERE template_hash = ?", (template_hash,))
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """Drops the least recently used entries beyond max_entries. Caller holds the lock."""
+        self._conn.execute(
+            """
+            DELETE FROM field_mappings WHERE cache_key IN (
+                SELECT cache_key FROM field_mappings
+                ORDER BY last_used_at DESC
+                LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.max_entries,)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, hits = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM field_mappings"
+            ).fetchone()
+        return {"entries": entries, "hits": hits, "max_entries": self.max_entries}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
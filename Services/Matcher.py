@@ -7,6 +7,7 @@ from pydantic_ai import Agent
 from pydantic_ai.models.gemini import GeminiModel
 from pydantic_ai.result import RunResult
 from Common.constants import *
+from Services.APIKeyPool import PooledAgent, get_key_pool
 
 class AnalysisResult(BaseModel):
     match_score: int = Field(..., ge=0, le=100)
@@ -122,18 +123,21 @@ class ExtractorService:
         return defaults[extraction_type]
 
 class AutonomousCVJDMatcher:
-    def __init__(self, api_key: str, model: str = "gemini-1.5-flash", max_retries: int = 3):
-        self.llm = GeminiModel(model, api_key=api_key)
+    def __init__(self, api_key: Optional[str] = None, model: str = "gemini-1.5-flash", max_retries: int = 3):
+        # Calls are spread across the shared API key pool; an explicit key joins it
+        self.key_pool = get_key_pool()
+        if api_key:
+            self.key_pool.add_key(api_key)
         self.system_prompt = """You are an expert CV analyzer with deep knowledge of industry requirements,
         technical skills, and career progression. Provide detailed, nuanced analysis of candidate fit,
         considering both explicit and implicit qualifications. Focus on practical relevance and potential
         for success in the role."""
 
-        self.cv_jd_agent = Agent(
-            model=self.llm,
+        self.cv_jd_agent = PooledAgent(lambda key: Agent(
+            model=GeminiModel(model, api_key=key),
             system_prompt=self.system_prompt,
             retries=3,
-        )
+        ), self.key_pool)
         self.extractor_service = ExtractorService(self.cv_jd_agent, max_retries)
 
     async def analyze_overall_match(self, cv_text: str, jd_text: str,
@@ -12,6 +12,7 @@ from pydantic_ai.result import RunResult
 
 from Factory.DocumentFactory import ExtractorFactory
 from Common.constants import *
+from Services.APIKeyPool import PooledAgent, get_key_pool
 
 class MatchResult(BaseModel):
     match_score: int
@@ -69,14 +70,17 @@ def cv_analysis_tool(func):
     return wrapper
 
 class AutonomousCVJDMatcher:
-    def __init__(self, api_key: str, model: str = "gemini-1.5-flash"):
-        self.llm = GeminiModel(model, api_key=api_key)
+    def __init__(self, api_key: Optional[str] = None, model: str = "gemini-1.5-flash"):
+        # Calls are spread across the shared API key pool; an explicit key joins it
+        self.key_pool = get_key_pool()
+        if api_key:
+            self.key_pool.add_key(api_key)
         self.system_prompt = SYSTEM_PROMPT_MATCHER
-        self.cv_jd_agent = Agent(
-            model=self.llm,
+        self.cv_jd_agent = PooledAgent(lambda key: Agent(
+            model=GeminiModel(model, api_key=key),
             system_prompt=self.system_prompt,
             retries=3,
-        )
+        ), self.key_pool)
         self.memory = []
         self.task_queue = deque()
         self.analysis_history: List[Dict[str, Any]] = []
@@ -7,6 +7,7 @@ from pydantic_ai import Agent
 from pydantic_ai.models.gemini import GeminiModel
 from pydantic_ai.result import RunResult
 from Common.constants import *
+from Services.APIKeyPool import PooledAgent, get_key_pool
 from Factory.DocumentFactory import ExtractorFactory
 
 
@@ -58,10 +59,17 @@ def cv_analysis_tool(func):
 
 
 class AutonomousCVJDMatcher:
-    def __init__(self, api_key: str, model: str = "gemini-1.5-flash", max_retries: int = 3):
-        self.llm = GeminiModel(model, api_key=api_key)
+    def __init__(self, api_key: Optional[str] = None, model: str = "gemini-1.5-flash", max_retries: int = 3):
+        # Calls are spread across the shared API key pool; an explicit key joins it
+        self.key_pool = get_key_pool()
+        if api_key:
+            self.key_pool.add_key(api_key)
         self.system_prompt = SYSTEM_PROMPT_MATCHER
-        self.cv_jd_agent = Agent(model=self.llm, system_prompt=self.system_prompt, retries=max_retries)
+        self.cv_jd_agent = PooledAgent(
+            lambda key: Agent(model=GeminiModel(model, api_key=key), system_prompt=self.system_prompt,
+                              retries=max_retries),
+            self.key_pool
+        )
 
     @cv_analysis_tool
     async def analyze_overall_match(self, cv_text: str, jd_text: str) -> Dict[str, Any]:
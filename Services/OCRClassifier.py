@@ -0,0 +1,132 @@
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional
+
+# Pages sampled for the text layer and image checks (first, last and evenly spaced in between)
+OCR_SAMPLE_PAGES = int(os.environ.get("OCR_SAMPLE_PAGES", 3))
+# A page with fewer extractable characters than this has no usable text layer
+TEXT_LAYER_MIN_CHARS = int(os.environ.get("TEXT_LAYER_MIN_CHARS", 40))
+# Share of the page covered by images above which a page without text is a scan
+IMAGE_PAGE_COVERAGE = float(os.environ.get("IMAGE_PAGE_COVERAGE", 0.6))
+# Widgets covering less of the document's area than this are too sparse to fill the form with
+MIN_WIDGET_COVERAGE = float(os.environ.get("MIN_WIDGET_COVERAGE", 0.002))
+OCR_DECISION_CACHE_SIZE = int(os.environ.get("OCR_DECISION_CACHE_SIZE", 1024))
+
+
+@dataclass
+class OCRDecision:
+    """Whether a form takes the OCR path, with the signals and reasons behind it."""
+    needs_ocr: bool
+    reasons: List[str]
+    signals: Dict[str, Any] = field(default_factory=dict)
+
+
+def sample_page_numbers(page_count: int, samples: int = OCR_SAMPLE_PAGES) -> List[int]:
+    if page_count <= samples:
+        return list(range(page_count))
+    if samples <= 1:
+        return [0]
+    step = (page_count - 1) / (samples - 1)
+    return sorted({round(i * step) for i in range(samples)})
+
+
+def _image_coverage(page) -> float:
+    page_area = abs(page.rect) or 1.0
+    covered = 0.0
+    for info in page.get_image_info():
+        x0, y0, x1, y1 = info["bbox"]
+        # Clip to the page; scans are often placed slightly past its edges
+        w = min(x1, page.rect.x1) - max(x0, page.rect.x0)
+        h = min(y1, page.rect.y1) - max(y0, page.rect.y0)
+        if w > 0 and h > 0:
+            covered += w * h
+    return min(1.0, covered / page_area)
+
+
+def classify_document(doc, widgets: List[Dict[str, Any]]) -> OCRDecision:
+    """Decides the OCR path for an open document from its widgets and a few sampled pages.
+
+    Fillable forms take the widget path even when every field is empty;
+    OCR is only chosen when there is nothing usable to fill: no widgets,
+    a sprinkling of widgets over scanned pages, or widgets so sparse they
+    cover almost none of the document.
+    """
+    page_count = len(doc)
+    page_area = sum(abs(page.rect) for page in doc) or 1.0
+    widget_area = sum(abs((w["rect"][2] - w["rect"][0]) * (w["rect"][3] - w["rect"][1])) for w in widgets)
+    widget_coverage = widget_area / page_area
+    widget_pages = {w["page_num"] for w in widgets}
+
+    sampled = sample_page_numbers(page_count)
+    text_pages, image_only_pages = 0, 0
+    for page_num in sampled:
+        page = doc[page_num]
+        has_text = len(page.get_text("text").strip()) >= TEXT_LAYER_MIN_CHARS
+        text_pages += has_text
+        if not has_text and _image_coverage(page) >= IMAGE_PAGE_COVERAGE:
+            image_only_pages += 1
+
+    signals = {
+        "page_count": page_count,
+        "widgets": len(widgets),
+        "widget_pages": len(widget_pages),
+        "widget_coverage": round(widget_coverage, 4),
+        "sampled_pages": sampled,
+        "text_layer_pages": text_pages,
+        "image_only_pages": image_only_pages
+    }
+    scanned = image_only_pages > 0 and image_only_pages * 2 >= len(sampled)
+
+    if not widgets:
+        if scanned:
+            return OCRDecision(True, ["no form widgets", "sampled pages are scanned images"], signals)
+        return OCRDecision(True, ["no form widgets; text has to be placed from the page layout"], signals)
+
+    reasons = [f"{len(widgets)} widgets on {len(widget_pages)}/{page_count} pages "
+               f"covering {widget_coverage:.2%} of the page area"]
+    if scanned and len(widget_pages) * 2 < page_count:
+        reasons.append(f"{image_only_pages}/{len(sampled)} sampled pages are image-only and most pages have no widgets")
+        return OCRDecision(True, reasons, signals)
+    if widget_coverage < MIN_WIDGET_COVERAGE:
+        reasons.append(f"widget coverage is below {MIN_WIDGET_COVERAGE:.2%}")
+        return OCRDecision(True, reasons, signals)
+
+    reasons.append("fillable form; widgets are filled directly")
+    return OCRDecision(False, reasons, signals)
+
+
+class OCRDecisionCache:
+    """In-process LRU of decisions keyed by template content hash."""
+
+    def __init__(self, max_entries: int = OCR_DECISION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._decisions: "OrderedDict[str, OCRDecision]" = OrderedDict()
+
+    def get(self, content_hash: str) -> Optional[OCRDecision]:
+        with self._lock:
+            decision = self._decisions.get(content_hash)
+            if decision is not None:
+                self._decisions.move_to_end(content_hash)
+            return decision
+
+    def set(self, content_hash: str, decision: OCRDecision) -> None:
+        with self._lock:
+            self._decisions[content_hash] = decision
+            self._decisions.move_to_end(content_hash)
+            while len(self._decisions) > self.max_entries:
+                self._decisions.popitem(last=False)
+
+
+_decision_cache = OCRDecisionCache()
+
+
+def classify_cached(content_hash: str, doc, widgets: List[Dict[str, Any]]) -> OCRDecision:
+    """classify_document, reusing the decision for a template seen before."""
+    decision = _decision_cache.get(content_hash)
+    if decision is None:
+        decision = classify_document(doc, widgets)
+        _decision_cache.set(content_hash, decision)
+    return decision
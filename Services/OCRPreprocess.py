@@ -0,0 +1,237 @@
+import os
+import time
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
+from typing import Dict, Any, List, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from Services.PageRenderCache import load_page_image
+
+# Pages rendered above this resolution are downscaled before OCR
+OCR_TARGET_DPI = int(os.environ.get("OCR_TARGET_DPI", 150))
+# Share of ink blobs that are 1-2 pixel specks above which a page is noisy enough to denoise
+DENOISE_SPECKLE_RATIO = float(os.environ.get("DENOISE_SPECKLE_RATIO", 0.1))
+# Area kept around the widgets (PDF points) when a page is cropped for OCR
+ROI_MARGIN_POINTS = float(os.environ.get("OCR_ROI_MARGIN_POINTS", 200))
+
+Rect = Tuple[float, float, float, float]
+
+
+@dataclass
+class PreprocessedPage:
+    """A page image on its way through a pipeline, with the transform back to the rendered page.
+
+    ``origin`` is the crop's top-left corner and ``scale`` the size of one
+    pixel, both in pixels of the image as rendered at ``source_dpi``.
+    """
+    image: np.ndarray
+    source_dpi: float
+    scale: float = 1.0
+    origin: Tuple[float, float] = (0.0, 0.0)
+    rois: Tuple[Rect, ...] = ()
+    ink: int = 0
+    timings: Dict[str, float] = field(default_factory=dict)
+    skipped: List[str] = field(default_factory=list)
+
+    def to_source(self, x: float, y: float) -> Tuple[float, float]:
+        return self.origin[0] + x * self.scale, self.origin[1] + y * self.scale
+
+    def map_lines(self, lines: List) -> List:
+        """PaddleOCR lines with their boxes moved back into rendered-page pixels."""
+        if self.scale == 1.0 and self.origin == (0.0, 0.0):
+            return lines
+        return [[[list(self.to_source(x, y)) for x, y in bbox], result] for bbox, result in lines]
+
+
+class PreprocessStage:
+    """One step of a pipeline; returns a new page and may record itself as skipped."""
+    name = "stage"
+
+    @property
+    def signature(self) -> str:
+        return self.name
+
+    def __call__(self, page: PreprocessedPage) -> PreprocessedPage:
+        raise NotImplementedError
+
+
+class CropToROI(PreprocessStage):
+    """Crops to the widgets' bounding box plus a margin; pages without widgets are left whole."""
+    name = "roi"
+
+    def __init__(self, margin_points: float = ROI_MARGIN_POINTS):
+        self.margin_points = margin_points
+
+    @property
+    def signature(self) -> str:
+        return f"roi_{self.margin_points:g}"
+
+    def __call__(self, page: PreprocessedPage) -> PreprocessedPage:
+        if not page.rois:
+            page.skipped.append(self.name)
+            return page
+        rois = np.array(page.rois, dtype=np.float32)
+        # PDF points -> rendered pixels -> pixels of the current image
+        to_pixels = page.source_dpi / 72.0
+        x0 = (rois[:, 0].min() - self.margin_points) * to_pixels
+        y0 = (rois[:, 1].min() - self.margin_points) * to_pixels
+        x1 = (rois[:, 2].max() + self.margin_points) * to_pixels
+        y1 = (rois[:, 3].max() + self.margin_points) * to_pixels
+        h, w = page.image.shape[:2]
+        left = int(max(0, (x0 - page.origin[0]) / page.scale))
+        top = int(max(0, (y0 - page.origin[1]) / page.scale))
+        right = int(min(w, np.ceil((x1 - page.origin[0]) / page.scale)))
+        bottom = int(min(h, np.ceil((y1 - page.origin[1]) / page.scale)))
+        if right <= left or bottom <= top or (left, top, right, bottom) == (0, 0, w, h):
+            page.skipped.append(self.name)
+            return page
+        return replace(page, image=page.image[top:bottom, left:right],
+                       origin=page.to_source(left, top))
+
+
+class Downscale(PreprocessStage):
+    """Resizes pages rendered above target_dpi; OCR accuracy plateaus well below 300 DPI."""
+    name = "downscale"
+
+    def __init__(self, target_dpi: int = OCR_TARGET_DPI):
+        self.target_dpi = target_dpi
+
+    @property
+    def signature(self) -> str:
+        return f"downscale_{self.target_dpi}"
+
+    def __call__(self, page: PreprocessedPage) -> PreprocessedPage:
+        current_dpi = page.source_dpi / page.scale
+        if current_dpi <= self.target_dpi:
+            page.skipped.append(self.name)
+            return page
+        factor = self.target_dpi / current_dpi
+        h, w = page.image.shape[:2]
+        size = (max(1, round(w * factor)), max(1, round(h * factor)))
+        image = cv2.resize(page.image, size, interpolation=cv2.INTER_AREA)
+        return replace(page, image=image, scale=page.scale * w / size[0])
+
+
+class Grayscale(PreprocessStage):
+    name = "gray"
+
+    def __call__(self, page: PreprocessedPage) -> PreprocessedPage:
+        if page.image.ndim == 2:
+            page.skipped.append(self.name)
+            return page
+        return replace(page, image=cv2.cvtColor(page.image, cv2.COLOR_RGB2GRAY))
+
+
+class Threshold(PreprocessStage):
+    """Adaptive Gaussian (11, 2) or fixed-150 binarization; invert gives white text on black."""
+    name = "threshold"
+
+    def __init__(self, variant: str = "adaptive", invert: bool = False):
+        self.variant = variant
+        self.invert = invert
+
+    @property
+    def signature(self) -> str:
+        params = "adaptive_gaussian_11_2" if self.variant == "adaptive" else "fixed_150"
+        return f"{params}{'_inv' if self.invert else ''}"
+
+    def __call__(self, page: PreprocessedPage) -> PreprocessedPage:
+        mode = cv2.THRESH_BINARY_INV if self.invert else cv2.THRESH_BINARY
+        if self.variant == "adaptive":
+            image = cv2.adaptiveThreshold(page.image, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, mode, 11, 2)
+        else:
+            _, image = cv2.threshold(page.image, 150, 255, mode)
+        return replace(page, image=image, ink=255 if self.invert else 0)
+
+
+def speckle_ratio(binary: np.ndarray, ink: int) -> float:
+    """Share of connected ink blobs that are only 1-2 pixels, i.e. scan noise rather than glyphs."""
+    mask = (binary == ink).astype(np.uint8)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    if count <= 1:
+        return 0.0
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    return float(np.count_nonzero(areas <= 2)) / len(areas)
+
+
+class Denoise(PreprocessStage):
+    """Non-local means on binarized pages, skipped when the page is already clean.
+
+    Rendered (non-scanned) pages have almost no isolated specks, so the
+    expensive filter only runs on pages that look like noisy scans.
+    """
+    name = "denoise"
+
+    def __init__(self, max_speckle_ratio: float = DENOISE_SPECKLE_RATIO):
+        self.max_speckle_ratio = max_speckle_ratio
+
+    @property
+    def signature(self) -> str:
+        return f"nl_means_10_7_21_above_{self.max_speckle_ratio:g}"
+
+    def __call__(self, page: PreprocessedPage) -> PreprocessedPage:
+        if speckle_ratio(page.image, page.ink) <= self.max_speckle_ratio:
+            page.skipped.append(self.name)
+            return page
+        return replace(page, image=cv2.fastNlMeansDenoising(page.image, None, 10, 7, 21))
+
+
+class PreprocessPipeline:
+    """Ordered preprocessing stages, each timed per page.
+
+    The signature names every stage and its parameters, so it can go into
+    OCR cache keys. A pipeline can continue from another's output, which
+    lets several threshold variants share one crop/downscale/grayscale pass.
+    """
+
+    def __init__(self, stages: Sequence[PreprocessStage], name: str = "ocr"):
+        self.stages = list(stages)
+        self.name = name
+
+    @property
+    def signature(self) -> str:
+        return "+".join(stage.signature for stage in self.stages)
+
+    def run(self, image: np.ndarray, dpi: float, rois: Sequence[Rect] = ()) -> PreprocessedPage:
+        return self.apply(PreprocessedPage(image=image, source_dpi=dpi, rois=tuple(tuple(r) for r in rois)))
+
+    def apply(self, page: PreprocessedPage) -> PreprocessedPage:
+        # Stages replace rather than mutate images, but timings and skips are per run
+        page = replace(page, timings=dict(page.timings), skipped=list(page.skipped))
+        for stage in self.stages:
+            start = time.perf_counter()
+            page = stage(page)
+            page.timings[stage.name] = page.timings.get(stage.name, 0.0) + time.perf_counter() - start
+        timings = ", ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in page.timings.items())
+        skipped = f" (skipped: {', '.join(page.skipped)})" if page.skipped else ""
+        print(f"🧹 {self.name} preprocessing: {timings}{skipped}")
+        return page
+
+
+def widget_rois(pdf_fields: Dict[str, Dict[str, Any]]) -> Dict[int, Tuple[Rect, ...]]:
+    """Widget rects per page, in the fillers' pdf_fields shape, as crop regions."""
+    rois: Dict[int, List[Rect]] = {}
+    for info in pdf_fields.values():
+        rois.setdefault(info["page_num"], []).append(tuple(info["rect"]))
+    return {page_num: tuple(rects) for page_num, rects in rois.items()}
+
+
+BASE_PIPELINE = PreprocessPipeline([CropToROI(), Downscale(), Grayscale()], name="base")
+
+
+@lru_cache(maxsize=32)
+def base_page(image_path: str, dpi: float, rois: Tuple[Rect, ...] = ()) -> PreprocessedPage:
+    """Cropped, downscaled grayscale page, computed once per rendered page and shared by every variant."""
+    return BASE_PIPELINE.run(load_page_image(image_path), dpi, rois)
+
+
+def preprocess_page(image_path: str, dpi: float, finish: PreprocessPipeline,
+                    rois: Tuple[Rect, ...] = ()) -> PreprocessedPage:
+    """Runs the shared base stages (cached) and then the caller's finishing stages."""
+    return finish.apply(base_page(image_path, dpi, rois))
+
+
+def pipeline_signature(finish: PreprocessPipeline) -> str:
+    return f"{BASE_PIPELINE.signature}+{finish.signature}"
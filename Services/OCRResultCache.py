@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from importlib import metadata
+from typing import Dict, Any, List, Optional
+
+DEFAULT_OCR_CACHE_PATH = os.path.join(os.path.dirname(__file__), "cache", "ocr_results.db")
+# Bump when the shape of the cached OCR elements changes
+OCR_CACHE_SCHEMA_VERSION = 1
+
+
+def ocr_engine_version() -> str:
+    """Version string of the installed OCR stack; cached results from any other version are stale."""
+    parts = []
+    for package in ("paddleocr", "paddlepaddle", "opencv-python"):
+        try:
+            parts.append(f"{package}={metadata.version(package)}")
+        except metadata.PackageNotFoundError:
+            parts.append(f"{package}=none")
+    parts.append(f"schema={OCR_CACHE_SCHEMA_VERSION}")
+    return ";".join(parts)
+
+
+def params_signature(params: Dict[str, Any]) -> str:
+    """Stable signature of the preprocessing parameters used for a page."""
+    encoded = json.dumps(params, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()[:16]
+
+
+def _json_default(value: Any) -> Any:
+    # PaddleOCR can hand back numpy scalars and arrays for boxes and scores
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class OCRResultCache:
+    """On-disk store of per-page OCR output.
+
+    Entries are keyed by the PDF's SHA-256, page number, render DPI and a
+    signature of the preprocessing parameters, so blank templates are OCRed
+    once and served from disk afterwards. Every entry records the OCR engine
+    version it was produced with; entries from other versions are dropped
+    when the cache is opened.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_OCR_CACHE_PATH, engine_version: Optional[str] = None):
+        self.db_path = db_path
+        self.engine_version = engine_version or ocr_engine_version()
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ocr_results (
+                pdf_hash TEXT NOT NULL,
+                page_num INTEGER NOT NULL,
+                dpi INTEGER NOT NULL,
+                params_sig TEXT NOT NULL,
+                engine_version TEXT NOT NULL,
+                params TEXT NOT NULL,
+                results TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (pdf_hash, page_num, dpi, params_sig)
+            )
+            """
+        )
+        stale = self._conn.execute(
+            "DELETE FROM ocr_results WHERE engine_version != ?", (self.engine_version,)
+        ).rowcount
+        self._conn.commit()
+        if stale:
+            print(f"🧹 Dropped {stale} OCR cache entries from a different OCR engine version")
+
+    def lookup_pages(self, pdf_hash: str, page_nums: List[int], dpi: int,
+                     params: Dict[str, Any]) -> Dict[int, List[Dict[str, Any]]]:
+        """Returns {page_num: results} for the pages that are cached."""
+        if not page_nums:
+            return {}
+        sig = params_signature(params)
+        placeholders = ",".join("?" * len(page_nums))
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT page_num, results FROM ocr_results
+                WHERE pdf_hash = ? AND dpi = ? AND params_sig = ? AND engine_version = ?
+                  AND page_num IN ({placeholders})
+                """,
+                (pdf_hash, dpi, sig, self.engine_version, *page_nums)
+            ).fetchall()
+            if rows:
+                self._conn.execute(
+                    f"""
+                    UPDATE ocr_results SET hits = hits + 1
+                    WHERE pdf_hash = ? AND dpi = ? AND params_sig = ? AND page_num IN ({placeholders})
+                    """,
+                    (pdf_hash, dpi, sig, *page_nums)
+                )
+                self._conn.commit()
+
+        cached = {page_num: json.loads(results) for page_num, results in rows}
+        if cached:
+            print(f"⚡ OCR cache hit for {len(cached)}/{len(page_nums)} pages")
+        return cached
+
+    def store_page(self, pdf_hash: str, page_num: int, dpi: int, params: Dict[str, Any],
+                   results: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO ocr_results
+                    (pdf_hash, page_num, dpi, params_sig, engine_version, params, results, created_at, hits)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)
+                """,
+                (pdf_hash, page_num, dpi, params_signature(params), self.engine_version,
+                 json.dumps(params, sort_keys=True), json.dumps(results, default=_json_default), time.time())
+            )
+            self._conn.commit()
+
+    def invalidate_pdf(self, pdf_hash: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM ocr_results WHERE pdf_hash = ?", (pdf_hash,))
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pages, pdfs, hits = self._conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT pdf_hash), COALESCE(SUM(hits), 0) FROM ocr_results"
+            ).fetchone()
+        return {"pages": pages, "pdfs": pdfs, "hits": hits, "engine_version": self.engine_version}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,190 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Set
+
+# Fuzzy matches must score above this (same cut-off, on the same ratio, as the SequenceMatcher scan)
+FUZZY_MIN_SCORE = 0.7
+# Shared-word share above which an element counts as a word match
+WORD_MIN_RATIO = 0.5
+# Fuzzy candidates scored per lookup, taken in order of shared trigrams
+MAX_FUZZY_CANDIDATES = 64
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(str(text).lower().split())
+
+
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class MatchRatio:
+    """difflib-style ratio, 2 * LCS / (len(a) + len(b)), from one query to many candidates.
+
+    The longest common subsequence comes from the bit-parallel algorithm
+    (Allison-Dix/Hyyrö): the query's character bitmasks are built once, so
+    each candidate costs a few integer operations per character instead of
+    a DP table. SequenceMatcher.ratio() counts matching blocks rather than
+    the LCS, so it is never higher and agrees with it on typical OCR labels.
+    """
+
+    def __init__(self, query: str):
+        self.query = query
+        self.length = len(query)
+        self.mask = (1 << self.length) - 1
+        self.peq: Dict[str, int] = defaultdict(int)
+        for i, char in enumerate(query):
+            self.peq[char] |= 1 << i
+
+    def lcs(self, text: str) -> int:
+        mask, peq = self.mask, self.peq
+        v = mask
+        for char in text:
+            u = v & peq.get(char, 0)
+            v = ((v + u) | (v - u)) & mask
+        return self.length - bin(v).count("1")
+
+    def ratio(self, text: str, min_score: float = 0.0) -> float:
+        """The ratio to text; 0 when the lengths alone keep it at or below min_score."""
+        total = self.length + len(text)
+        if not total:
+            return 1.0
+        if 2 * min(self.length, len(text)) / total <= min_score:
+            return 0.0
+        return 2 * self.lcs(text) / total
+
+
+@dataclass
+class TextMatch:
+    """A lookup hit: the element's position, how it matched and its score (1.0 for exact/substring)."""
+    position: Dict[str, float]
+    text: str
+    kind: str
+    score: float
+    element_id: int
+
+
+class OCRTextIndex:
+    """Per-page index over OCR elements for repeated label lookups.
+
+    Built once per document: normalized text for exact hits, word postings
+    for word-overlap matches and trigram postings that narrow substring and
+    fuzzy candidates, so a lookup touches a few elements instead of every
+    line on the page. Match order follows find_text_position: exact, then
+    substring (first element in OCR order), then the best fuzzy/word score.
+    """
+
+    def __init__(self, ocr_elements: List[Dict[str, Any]]):
+        self.elements: List[Dict[str, Any]] = []
+        self.texts: List[str] = []
+        self.words: List[Set[str]] = []
+        self.trigram_counts: List[int] = []
+        self._exact: Dict[int, Dict[str, int]] = defaultdict(dict)
+        self._by_word: Dict[int, Dict[str, List[int]]] = defaultdict(lambda: defaultdict(list))
+        self._by_trigram: Dict[int, Dict[str, List[int]]] = defaultdict(lambda: defaultdict(list))
+        self._page_ids: Dict[int, List[int]] = defaultdict(list)
+
+        for element in ocr_elements:
+            text = normalize_text(element.get("text", ""))
+            if not text:
+                continue
+            element_id = len(self.elements)
+            page_num = element["page_num"]
+            self.elements.append(element)
+            self.texts.append(text)
+            self.words.append(set(text.split()))
+            self._page_ids[page_num].append(element_id)
+            self._exact[page_num].setdefault(text, element_id)
+            for word in self.words[-1]:
+                self._by_word[page_num][word].append(element_id)
+            grams = trigrams(text)
+            self.trigram_counts.append(len(grams))
+            for gram in grams:
+                self._by_trigram[page_num][gram].append(element_id)
+
+    def __len__(self) -> int:
+        return len(self.elements)
+
+    def _match(self, element_id: int, kind: str, score: float) -> TextMatch:
+        return TextMatch(self.elements[element_id]["position"], self.texts[element_id], kind, score, element_id)
+
+    def _substring_ids(self, query: str, page_num: int) -> List[int]:
+        grams = trigrams(query)
+        # Padding trigrams only match at word edges, which a substring needn't respect
+        inner = [gram for gram in grams if " " not in gram]
+        postings = self._by_trigram[page_num]
+        if not inner:
+            candidates = self._page_ids[page_num]
+        else:
+            lists = sorted((postings.get(gram, []) for gram in inner), key=len)
+            if not lists[0]:
+                return []
+            candidates = set(lists[0]).intersection(*lists[1:])
+        return sorted(element_id for element_id in candidates if query in self.texts[element_id])
+
+    def _fuzzy_candidates(self, query: str, query_words: Set[str], page_num: int) -> List[int]:
+        query_grams = trigrams(query)
+        shared: Dict[int, int] = defaultdict(int)
+        postings = self._by_trigram[page_num]
+        for gram in query_grams:
+            for element_id in postings.get(gram, ()):
+                shared[element_id] += 1
+
+        # The ratio is 1 - indels / total length, and one insertion or deletion breaks at most
+        # three trigrams, so the shared count bounds the best ratio an element can reach
+        candidates = []
+        for element_id, count in shared.items():
+            total = len(query) + len(self.texts[element_id])
+            min_indels = -(-(max(len(query_grams), self.trigram_counts[element_id]) - count) // 3)
+            if 1.0 - min_indels / total > FUZZY_MIN_SCORE:
+                candidates.append(element_id)
+        candidates.sort(key=lambda element_id: (-shared[element_id], element_id))
+        candidates = candidates[:MAX_FUZZY_CANDIDATES]
+
+        # Elements sharing enough whole words are scored however few trigrams they share
+        min_words = max(WORD_MIN_RATIO, FUZZY_MIN_SCORE) * len(query_words)
+        word_hits: Dict[int, int] = defaultdict(int)
+        for word in query_words:
+            for element_id in self._by_word[page_num].get(word, ()):
+                word_hits[element_id] += 1
+        candidates.extend(element_id for element_id, hits in word_hits.items() if hits > min_words)
+        return sorted(set(candidates))
+
+    def lookup(self, text: str, page_num: int, k: int = 1) -> List[TextMatch]:
+        """Top-k matches for text on a page, best first; empty when nothing clears FUZZY_MIN_SCORE."""
+        query = normalize_text(text or "")
+        if not query or page_num not in self._page_ids:
+            return []
+
+        exact_id = self._exact[page_num].get(query)
+        substring_ids = self._substring_ids(query, page_num)
+        matches = [self._match(exact_id, "exact", 1.0)] if exact_id is not None else []
+        matches.extend(self._match(element_id, "substring", 1.0)
+                       for element_id in substring_ids if element_id != exact_id)
+        if len(matches) >= k:
+            return matches[:k]
+
+        seen = {match.element_id for match in matches}
+        scorer = MatchRatio(query)
+        query_words = set(query.split())
+        scored = []
+        for element_id in self._fuzzy_candidates(query, query_words, page_num):
+            if element_id in seen:
+                continue
+            score, kind = scorer.ratio(self.texts[element_id], FUZZY_MIN_SCORE), "fuzzy"
+            common_words = query_words & self.words[element_id]
+            if common_words:
+                word_ratio = len(common_words) / len(query_words)
+                if word_ratio > WORD_MIN_RATIO and word_ratio > score:
+                    score, kind = word_ratio, "words"
+            if score > FUZZY_MIN_SCORE:
+                scored.append((-score, element_id, kind))
+
+        scored.sort()
+        matches.extend(self._match(element_id, kind, -neg_score) for neg_score, element_id, kind in scored)
+        return matches[:k]
+
+    def find_position(self, text: str, page_num: int) -> Optional[Dict[str, float]]:
+        matches = self.lookup(text, page_num, k=1)
+        return matches[0].position if matches else None
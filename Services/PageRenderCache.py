@@ -0,0 +1,70 @@
+import os
+from functools import lru_cache
+
+import numpy as np
+
+from Common.pdf_source import PdfSource, open_pdf
+
+PAGE_CACHE_DIR = os.path.join(os.path.dirname(__file__), "cache", "pages")
+PAGE_CACHE_MAX_FILES = int(os.environ.get("PAGE_CACHE_MAX_FILES", 2000))
+
+
+def page_cache_path(template_hash: str, page_num: int, dpi: int) -> str:
+    return os.path.join(PAGE_CACHE_DIR, f"{template_hash}_{page_num}_{dpi}.npy")
+
+
+def render_page(pdf_path: PdfSource, page_num: int, dpi: int) -> np.ndarray:
+    """Renders one page to an RGB uint8 array."""
+    doc = open_pdf(pdf_path)
+    try:
+        pix = doc[page_num].get_pixmap(dpi=dpi, alpha=False)
+        img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.h, pix.w, pix.n)
+        if pix.n == 4:
+            img = img[:, :, :3]
+        return np.ascontiguousarray(img)
+    finally:
+        doc.close()
+
+
+def render_page_cached(pdf_path: PdfSource, template_hash: str, page_num: int, dpi: int) -> str:
+    """Renders a page once per (template hash, page, dpi) and returns the cached array's path.
+
+    Runs in the "render" worker stage; OCR workers load the array from disk
+    instead of re-rendering the page.
+    """
+    path = page_cache_path(template_hash, page_num, dpi)
+    if os.path.exists(path):
+        os.utime(path)
+        return path
+
+    os.makedirs(PAGE_CACHE_DIR, exist_ok=True)
+    img = render_page(pdf_path, page_num, dpi)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        np.save(f, img)
+    os.replace(temp_path, path)
+
+    prune_page_cache()
+    return path
+
+
+@lru_cache(maxsize=32)
+def load_page_image(path: str) -> np.ndarray:
+    return np.load(path)
+
+
+def prune_page_cache(max_files: int = PAGE_CACHE_MAX_FILES) -> None:
+    """Removes the oldest cached pages once the cache holds more than max_files."""
+    try:
+        entries = [e for e in os.scandir(PAGE_CACHE_DIR) if e.name.endswith(".npy")]
+    except FileNotFoundError:
+        return
+    if len(entries) <= max_files:
+        return
+
+    entries.sort(key=lambda e: e.stat().st_mtime)
+    for entry in entries[:len(entries) - max_files]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
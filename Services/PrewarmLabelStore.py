@@ -0,0 +1,51 @@
+"""Extracts vision field labels for every template under state_templates/.
+
+Usage:
+    python -m Services.PrewarmLabelStore [--template-dir DIR] [--force]
+
+Run it after adding templates or bumping LABEL_EXTRACTOR_VERSION so label
+extraction stays out of the request path for known templates. Templates
+that already have labels from the current extractor are skipped unless
+--force is given.
+"""
+import argparse
+import asyncio
+import time
+
+from Common.pdf_source import source_sha256
+from Services.LabelStore import FieldLabelStore, extract_template_labels
+from Services.PrewarmOCRCache import DEFAULT_TEMPLATE_DIR, find_templates
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Extract and store vision field labels for state templates.")
+    parser.add_argument("--template-dir", default=DEFAULT_TEMPLATE_DIR)
+    parser.add_argument("--force", action="store_true", help="Re-extract templates that already have labels")
+    args = parser.parse_args()
+
+    pdf_paths = find_templates(args.template_dir)
+    if not pdf_paths:
+        print(f"⚠️ No templates found in {args.template_dir}")
+        return
+
+    store = FieldLabelStore()
+    print(f"🏷️ Extracting field labels for {len(pdf_paths)} templates")
+
+    for pdf_path in pdf_paths:
+        start = time.time()
+        template_hash = source_sha256(pdf_path)
+        if not args.force and store.has(template_hash):
+            print(f"⏭️ {pdf_path} already labelled")
+            continue
+        try:
+            version = asyncio.run(extract_template_labels(pdf_path, store, template_hash, include_ai_fields=True))
+            print(f"✅ {pdf_path} labelled (v{version}) in {time.time() - start:.2f}s")
+        except Exception as e:
+            print(f"❌ Failed to label {pdf_path}: {e}")
+
+    print(f"📊 Label store: {store.stats()}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Pre-populates the OCR result cache for every template under state_templates/.
+
+Usage:
+    python -m Services.PrewarmOCRCache [--template-dir DIR] [--pipelines genfiler gen]
+
+Run it after adding templates or upgrading PaddleOCR so OCR stays out of the
+request path for known templates.
+"""
+import argparse
+import os
+import time
+from typing import List
+
+from Services.OCRResultCache import OCRResultCache
+
+DEFAULT_TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "state_templates")
+PIPELINES = ("genfiler", "gen")
+
+
+def find_templates(template_dir: str) -> List[str]:
+    pdf_paths = []
+    for root, _, files in os.walk(template_dir):
+        pdf_paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(".pdf"))
+    return sorted(pdf_paths)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Pre-populate the OCR result cache for state templates.")
+    parser.add_argument("--template-dir", default=DEFAULT_TEMPLATE_DIR)
+    parser.add_argument("--pipelines", nargs="+", choices=PIPELINES, default=list(PIPELINES))
+    args = parser.parse_args()
+
+    pdf_paths = find_templates(args.template_dir)
+    if not pdf_paths:
+        print(f"⚠️ No templates found in {args.template_dir}")
+        return
+
+    ocr_cache = OCRResultCache()
+    print(f"🔍 Warming OCR cache for {len(pdf_paths)} templates ({ocr_cache.engine_version})")
+
+    genfiler_reader = gen_processor = None
+    if "genfiler" in args.pipelines:
+        from Services.GenFiler import create_ocr_reader, extract_ocr_elements
+        from Services.OCRPreprocess import widget_rois
+        from Services.TemplateRegistry import read_template_metadata
+        genfiler_reader = create_ocr_reader()
+    if "gen" in args.pipelines:
+        from Services.GEN import AdvancedOCRProcessor
+        gen_processor = AdvancedOCRProcessor(ocr_cache=ocr_cache)
+
+    for pdf_path in pdf_paths:
+        start = time.time()
+        try:
+            if genfiler_reader is not None:
+                # Crop to the widgets exactly as the request path does, so the cached pages match
+                template = read_template_metadata(pdf_path)
+                extract_ocr_elements(pdf_path, genfiler_reader, template.content_hash, ocr_cache,
+                                     widget_rois(template.widget_fields()))
+            if gen_processor is not None:
+                gen_processor.extract_pdf_text(pdf_path)
+            print(f"✅ {os.path.basename(pdf_path)} cached in {time.time() - start:.2f}s")
+        except Exception as e:
+            print(f"❌ Failed to OCR {pdf_path}: {e}")
+
+    print(f"📊 OCR cache: {ocr_cache.stats()}")
+    ocr_cache.close()
+
+
+if __name__ == "__main__":
+    main()
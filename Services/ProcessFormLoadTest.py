@@ -0,0 +1,66 @@
+import asyncio
+import json
+import time
+from typing import Dict, Any, List
+
+import httpx
+
+API_URL = "https://localhost:8005/api/process-form"
+FORM_DATA_PATH = "D:\\demo\\Services\\form_data.json"
+UPLOAD_PDF_PATH = None  # set to a PDF path to exercise the upload/OCR path
+CONCURRENCY = 8
+TOTAL_REQUESTS = 64
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def send_request(client: httpx.AsyncClient, form_data: Dict[str, Any], pdf_bytes: bytes = None) -> float:
+    files = None
+    if pdf_bytes:
+        files = {"pdf_file": ("upload.pdf", pdf_bytes, "application/pdf")}
+
+    start = time.perf_counter()
+    response = await client.post(
+        API_URL,
+        data={"form_data": json.dumps(form_data), "return_json": "true"},
+        files=files
+    )
+    elapsed = time.perf_counter() - start
+
+    if response.status_code != 200:
+        print(f"⚠️ Request failed with {response.status_code}: {response.text[:200]}")
+    return elapsed
+
+
+async def main():
+    """Measures /api/process-form latency under concurrent load (run before and after a change)."""
+    with open(FORM_DATA_PATH, "r", encoding="utf-8") as f:
+        form_data = json.load(f)
+
+    pdf_bytes = None
+    if UPLOAD_PDF_PATH:
+        with open(UPLOAD_PDF_PATH, "rb") as f:
+            pdf_bytes = f.read()
+
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def bounded(client):
+        async with semaphore:
+            return await send_request(client, form_data, pdf_bytes)
+
+    async with httpx.AsyncClient(verify=False, timeout=300) as client:
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(bounded(client) for _ in range(TOTAL_REQUESTS)))
+        wall_time = time.perf_counter() - start
+
+    print(f"Requests: {TOTAL_REQUESTS}, concurrency: {CONCURRENCY}, wall time: {wall_time:.2f}s")
+    print(f"p50={percentile(latencies, 50):.3f}s p95={percentile(latencies, 95):.3f}s "
+          f"p99={percentile(latencies, 99):.3f}s max={max(latencies):.3f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
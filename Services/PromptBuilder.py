@@ -0,0 +1,196 @@
+import json
+import os
+import re
+from typing import Dict, Any, List, Optional
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken is optional; fall back to a character-based estimate
+    _ENCODING = None
+
+# Upper bound on prompt size; OCR context is trimmed first to stay under it
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", 24000))
+# OCR elements farther than this (PDF points) from every unresolved field are dropped
+OCR_NEAR_DISTANCE = float(os.environ.get("PROMPT_OCR_NEAR_DISTANCE", 150))
+# Also logs the size of the uncompacted prompt; costs a second full tokenization, so off by default
+PROMPT_BASELINE_STATS = os.environ.get("PROMPT_BASELINE_STATS", "0") == "1"
+# Payload keys that never help the model map fields
+IRRELEVANT_KEY_PATTERN = re.compile(
+    r"(^|\.)(_?id|documentId|__v|createdAt|updatedAt|publishedAt|createdBy|updatedBy|locale|"
+    r"localizations|hash|mime|ext|formats)(\[\d+\])?$",
+    re.IGNORECASE
+)
+
+
+def count_tokens(text: str) -> int:
+    """Token count via tiktoken when installed, otherwise roughly four characters per token."""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return (len(text) + 3) // 4
+
+
+def _json_default(value: Any) -> Any:
+    # NumPy scalars and arrays from OCR and widget rects
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def compact_json(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=_json_default)
+
+
+def prune_payload(flat_json: Dict[str, Any]) -> Dict[str, Any]:
+    """Drops null/empty values and bookkeeping keys (ids, timestamps, media metadata)."""
+    return {
+        key: value for key, value in flat_json.items()
+        if value is not None and value != "" and value != [] and value != {}
+        and not IRRELEVANT_KEY_PATTERN.search(key)
+    }
+
+
+def quantize_field_info(info: Any) -> Any:
+    """Rounds widget rects to whole points and drops empty values from a field info dict."""
+    if not isinstance(info, dict):
+        return info
+    compact = {}
+    for key, value in info.items():
+        if key == "rect":
+            value = [round(float(v)) for v in value]
+        if value is None or value == "" or key == "flags":
+            continue
+        compact[key] = value
+    return compact
+
+
+def quantize_ocr_element(element: Dict[str, Any]) -> Dict[str, Any]:
+    position = element["position"]
+    return {
+        "page_num": element["page_num"],
+        "text": element["text"],
+        "confidence": round(float(element["confidence"]), 2),
+        "position": {k: round(float(position[k])) for k in ("x1", "y1", "x2", "y2")}
+    }
+
+
+def ocr_elements_near_fields(ocr_elements: List[Dict[str, Any]], pdf_fields: Dict[str, Any],
+                             max_distance: float = OCR_NEAR_DISTANCE) -> List[Dict[str, Any]]:
+    """OCR elements within max_distance of any of the given widgets, nearest first.
+
+    Elements on pages without any of the widgets (flat pages, OCR-only
+    labels) can't be ranked by distance; they are kept in OCR order after the
+    near ones, so budget trimming drops them first.
+    """
+    rects_by_page: Dict[int, List[List[float]]] = {}
+    for info in pdf_fields.values():
+        if isinstance(info, dict) and "rect" in info:
+            rects_by_page.setdefault(info["page_num"], []).append(info["rect"])
+    if not rects_by_page:
+        return list(ocr_elements)
+
+    scored, unranked = [], []
+    for element in ocr_elements:
+        rects = rects_by_page.get(element["page_num"])
+        if not rects:
+            unranked.append(element)
+            continue
+        p = element["position"]
+        distance = min(
+            max(r[0] - p["x2"], p["x1"] - r[2], 0) + max(r[1] - p["y2"], p["y1"] - r[3], 0)
+            for r in rects
+        )
+        if distance <= max_distance:
+            scored.append((distance, element))
+    scored.sort(key=lambda item: item[0])
+    return [element for _, element in scored] + unranked
+
+
+class PromptBuilder:
+    """Formats the FIELD_MATCHING_PROMPT_* templates compactly and within a token budget.
+
+    The payload is pruned, widget info and OCR coordinates are quantized,
+    only OCR elements near the fields still to be matched are kept, and
+    everything is serialized without whitespace. If the prompt is still over
+    budget, the farthest OCR elements are dropped first, then field context.
+    """
+
+    def __init__(self, token_budget: int = PROMPT_TOKEN_BUDGET):
+        self.token_budget = token_budget
+
+    def build(self, template: str, flat_json: Dict[str, Any], pdf_fields: Dict[str, Any],
+              ocr_elements: Optional[List[Dict[str, Any]]] = None,
+              field_context: Optional[List[Dict[str, Any]]] = None,
+              fields_as_names: bool = False,
+              field_labels: Optional[Dict[str, str]] = None) -> str:
+        """Formats a prompt template.
+
+        fields_as_names sends only the field names (the GenericFiller
+        prompts); otherwise fields go out as [{"uuid": name, "info": {...}}].
+        Stored labels are attached to their fields: a labelled name becomes
+        {"name": ..., "label": ...}, and info dicts get a "label" entry.
+        """
+        field_labels = field_labels or {}
+        if fields_as_names:
+            fields_payload = [{"name": k, "label": field_labels[k]} if k in field_labels else k
+                              for k in pdf_fields]
+        else:
+            fields_payload = []
+            for name, info in pdf_fields.items():
+                info = quantize_field_info(info)
+                if name in field_labels and isinstance(info, dict):
+                    info = {**info, "label": field_labels[name]}
+                fields_payload.append({"uuid": name, "info": info})
+
+        names = set(pdf_fields)
+        context = [c for c in field_context or [] if c.get("field_name") in names]
+        ocr = [quantize_ocr_element(e) for e in ocr_elements_near_fields(ocr_elements or [], pdf_fields)]
+        payload = prune_payload(flat_json)
+
+        def render(ocr_subset: List[Dict[str, Any]], context_subset: List[Dict[str, Any]]) -> str:
+            # Templates that don't reference ocr_elements/field_context simply ignore them
+            return template.format(
+                json_data=compact_json(payload),
+                pdf_fields=compact_json(fields_payload),
+                ocr_elements=compact_json(ocr_subset if ocr_elements is not None else None),
+                field_context=compact_json(context_subset if field_context is not None else None)
+            )
+
+        prompt = render(ocr, context)
+        tokens = count_tokens(prompt)
+        while tokens > self.token_budget and ocr:
+            ocr = ocr[:len(ocr) * 3 // 4]
+            prompt = render(ocr, context)
+            tokens = count_tokens(prompt)
+        if tokens > self.token_budget and context:
+            context = [{**c, "nearby_text": c.get("nearby_text", [])[:1]} for c in context]
+            prompt = render(ocr, context)
+            tokens = count_tokens(prompt)
+        if tokens > self.token_budget:
+            print(f"⚠️ Prompt is {tokens} tokens, over the {self.token_budget} budget after trimming")
+
+        savings = ""
+        if PROMPT_BASELINE_STATS:
+            baseline = self._baseline_tokens(template, flat_json, pdf_fields, ocr_elements, field_context,
+                                             fields_as_names)
+            savings = f" (uncompacted {baseline}, saved {baseline - tokens})"
+        print(f"✂️ Prompt: {tokens} tokens{savings}; "
+              f"{len(payload)}/{len(flat_json)} payload keys, {len(ocr)}/{len(ocr_elements or [])} OCR elements")
+        return prompt
+
+    @staticmethod
+    def _baseline_tokens(template: str, flat_json: Dict[str, Any], pdf_fields: Dict[str, Any],
+                         ocr_elements: Optional[List[Dict[str, Any]]],
+                         field_context: Optional[List[Dict[str, Any]]], fields_as_names: bool) -> int:
+        """Size of the same prompt formatted the old way (indent=2, nothing dropped)."""
+        def dumps(value: Any) -> str:
+            return json.dumps(value, indent=2, default=_json_default)
+
+        fields_payload = list(pdf_fields.keys()) if fields_as_names else \
+            [{"uuid": k, "info": v} for k, v in pdf_fields.items()]
+        return count_tokens(template.format(
+            json_data=dumps(flat_json),
+            pdf_fields=dumps(fields_payload),
+            ocr_elements=dumps(ocr_elements),
+            field_context=dumps(field_context)
+        ))
@@ -0,0 +1,229 @@
+import asyncio
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple
+
+from Common.pdf_source import PdfSource, open_pdf, source_sha256
+from Services.OCRClassifier import classify_cached
+
+DEFAULT_REFRESH_INTERVAL = 30  # seconds between change checks
+
+
+@dataclass
+class TemplateMetadata:
+    """Precomputed metadata for a single state form template."""
+    path: str
+    state: str
+    filename: str
+    content_hash: str
+    page_count: int
+    widgets: List[Dict[str, Any]]
+    needs_ocr: bool
+    mtime: float
+    size: int
+    page_sizes: List[Tuple[float, float]] = field(default_factory=list)
+    ocr_reasons: List[str] = field(default_factory=list)
+
+    def widget_fields(self) -> Dict[str, Dict[str, Any]]:
+        """Widgets keyed by field name, in the shape returned by the fillers' extract_pdf_fields."""
+        return {
+            w["name"]: {
+                "page_num": w["page_num"],
+                "type": w["type"],
+                "rect": list(w["rect"]),
+                "flags": w["flags"],
+                "is_readonly": w["is_readonly"],
+                "current_value": w["value"]
+            } for w in self.widgets
+        }
+
+    def analysis_fields(self) -> List[Dict[str, Any]]:
+        """Widgets in the shape returned by PDFProcessingService.analyze_form_fields."""
+        return [{"name": w["name"], "type": w["type"], "value": w["value"]} for w in self.widgets]
+
+
+@dataclass
+class PreparedTemplate:
+    """Per-template state computed once and shared by every payload filled against it.
+
+    OCR output and field context are filled in lazily by the OCR filler, under
+    context_lock, so concurrent payloads in a batch trigger them only once.
+    field_labels holds the precomputed vision labels from the label store.
+    """
+    source: PdfSource
+    pdf_fields: Dict[str, Any]
+    template_hash: str
+    page_count: Optional[int] = None
+    field_labels: Dict[str, str] = field(default_factory=dict)
+    ocr_text_elements: Optional[List[Dict[str, Any]]] = None
+    field_context: Optional[List[Dict[str, Any]]] = None
+    context_lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
+
+
+def read_template_metadata(pdf_path: PdfSource, state: str = "") -> TemplateMetadata:
+    """Opens a template once and records everything the request path needs.
+
+    In-memory uploads get an empty path and no mtime; their content hash
+    still keys every downstream cache.
+    """
+    in_memory = isinstance(pdf_path, (bytes, bytearray))
+    mtime, size = (0.0, len(pdf_path)) if in_memory else (os.stat(pdf_path).st_mtime, os.stat(pdf_path).st_size)
+    widgets = []
+    page_sizes = []
+    content_hash = source_sha256(pdf_path)
+
+    doc = open_pdf(pdf_path)
+    try:
+        page_count = len(doc)
+        for page_num, page in enumerate(doc):
+            page_sizes.append((page.rect.width, page.rect.height))
+            for widget in page.widgets():
+                if not widget.field_name:
+                    continue
+                rect = widget.rect
+                widgets.append({
+                    "name": widget.field_name.strip(),
+                    "page_num": page_num,
+                    "type": widget.field_type,
+                    "rect": (rect.x0, rect.y0, rect.x1, rect.y1),
+                    "flags": widget.field_flags,
+                    "is_readonly": bool(widget.field_flags & 1),
+                    "value": widget.field_value
+                })
+        decision = classify_cached(content_hash, doc, widgets)
+    finally:
+        doc.close()
+
+    return TemplateMetadata(
+        path="" if in_memory else pdf_path,
+        state=state,
+        filename="" if in_memory else os.path.basename(pdf_path),
+        content_hash=content_hash,
+        page_count=page_count,
+        widgets=widgets,
+        needs_ocr=decision.needs_ocr,
+        mtime=mtime,
+        size=size,
+        page_sizes=page_sizes,
+        ocr_reasons=decision.reasons
+    )
+
+
+class TemplateRegistry:
+    """In-memory index of state form templates keyed by (state, entity_type).
+
+    The template directory is laid out as ``<TEMPLATE_DIR>/<STATE>/<form>.pdf``.
+    Metadata is built once and only re-read for files whose mtime or size
+    changed; change checks are throttled to ``refresh_interval`` seconds and
+    run on a background thread, so a lookup never re-reads PDFs itself.
+    """
+
+    def __init__(self, template_dir: str, refresh_interval: float = DEFAULT_REFRESH_INTERVAL):
+        self.template_dir = template_dir
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        # Serializes rebuilds; lookups only take _lock for the final swap
+        self._build_lock = threading.Lock()
+        self._refresh_thread: Optional[threading.Thread] = None
+        self._templates: Dict[str, Dict[str, TemplateMetadata]] = {}
+        self._by_key: Dict[Tuple[str, str], TemplateMetadata] = {}
+        self._by_hash: Dict[str, TemplateMetadata] = {}
+        self._last_check = 0.0
+
+    def build(self) -> None:
+        """Scans the template directory and (re)indexes any new or changed template.
+
+        The scan runs without holding the lookup lock, so get() keeps serving
+        the previous index until the new one is swapped in.
+        """
+        with self._build_lock:
+            with self._lock:
+                current = self._templates
+
+            templates = {}
+            if os.path.isdir(self.template_dir):
+                for state_entry in os.scandir(self.template_dir):
+                    if not state_entry.is_dir():
+                        continue
+                    state = state_entry.name.upper()
+                    previous = current.get(state, {})
+                    state_templates = {}
+
+                    for entry in sorted(os.scandir(state_entry.path), key=lambda e: e.name):
+                        if not entry.is_file() or not entry.name.lower().endswith(".pdf"):
+                            continue
+                        stat = entry.stat()
+                        cached = previous.get(entry.name)
+                        if cached and cached.mtime == stat.st_mtime and cached.size == stat.st_size:
+                            state_templates[entry.name] = cached
+                            continue
+                        try:
+                            state_templates[entry.name] = read_template_metadata(entry.path, state)
+                        except Exception as e:
+                            print(f"⚠️ Failed to index template {entry.path}: {e}")
+
+                    templates[state] = state_templates
+
+            by_hash = {
+                meta.content_hash: meta
+                for state_templates in templates.values()
+                for meta in state_templates.values()
+            }
+            with self._lock:
+                self._templates = templates
+                self._by_key = {}
+                self._by_hash = by_hash
+                self._last_check = time.monotonic()
+
+        print(f"✅ Indexed {len(by_hash)} templates across {len(templates)} states")
+
+    def refresh_if_changed(self) -> None:
+        """Starts a background rebuild once refresh_interval has passed; lookups never wait for it."""
+        with self._lock:
+            if time.monotonic() - self._last_check < self.refresh_interval:
+                return
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return
+            # Throttled from here even if the rebuild fails
+            self._last_check = time.monotonic()
+            self._refresh_thread = threading.Thread(target=self._refresh, name="template-refresh", daemon=True)
+            self._refresh_thread.start()
+
+    def _refresh(self) -> None:
+        try:
+            self.build()
+        except Exception as e:
+            print(f"⚠️ Template index refresh failed: {e}")
+
+    def get(self, entity_type: str, state: str) -> TemplateMetadata:
+        """Returns the template for an entity type in a state, raising FileNotFoundError if absent."""
+        self.refresh_if_changed()
+
+        entity_type = entity_type.lower().strip()
+        state = state.upper().strip()
+        key = (state, entity_type)
+
+        with self._lock:
+            if key in self._by_key:
+                return self._by_key[key]
+
+            state_templates = self._templates.get(state)
+            if state_templates is None:
+                raise FileNotFoundError(f"No forms available for state: {state}")
+
+            matching = [meta for name, meta in state_templates.items() if entity_type in name.lower()]
+            if not matching:
+                raise FileNotFoundError(f"No form template found for {entity_type} in {state}")
+
+            self._by_key[key] = matching[0]
+            return matching[0]
+
+    def get_by_hash(self, content_hash: str) -> Optional[TemplateMetadata]:
+        with self._lock:
+            return self._by_hash.get(content_hash)
+
+    def all_templates(self) -> List[TemplateMetadata]:
+        with self._lock:
+            return list(self._by_hash.values())
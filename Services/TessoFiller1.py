@@ -1,33 +1,29 @@
 import asyncio
 import json
 import os
-import re
-import shutil
-import io
-from typing import Dict, Any, List, Tuple
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Tuple, Optional
 
 import fitz
 import numpy as np
 import cv2
-from PIL import Image
-import google.generativeai as genai
-from pypdf import PdfReader, PdfWriter
 from pypdf.generic import DictionaryObject, NameObject, BooleanObject, ArrayObject
-from difflib import SequenceMatcher
 
 from pydantic_ai import Agent
 from pydantic_ai.models.gemini import GeminiModel
 from pydantic import BaseModel, field_validator
 
 from Common.constants import *
+from Services.APIKeyPool import PooledAgent, generate_content_pooled
+from Services.LLMCaller import LLMCaller
+from Services.OCRTextIndex import OCRTextIndex
+from Services.TextPlacement import PageTextPlacer
+from Services.VisionImageEncoder import VisionImageOptions, encode_page_image
+from Services.WidgetFillEngine import apply_field_updates, filled_widget_values
 
-API_KEYS = {
-    "field_matcher": API_KEY_3,
-    "vision": API_KEY_3,  # Add vision API key (can be the same as field_matcher)
-}
-
-# Configure Gemini API
-genai.configure(api_key=API_KEYS["vision"])
+# Pages matched at once, and how long one page (vision OCR plus matching) may take
+PAGE_CONCURRENCY = int(os.environ.get("PAGE_CONCURRENCY", 3))
+PAGE_TIMEOUT_SECONDS = float(os.environ.get("PAGE_TIMEOUT_SECONDS", 120))
 
 
 class NumpyEncoder(json.JSONEncoder):
@@ -75,12 +71,27 @@ class OCRFieldMatch(BaseModel):
         return float(v)
 
 
+@dataclass
+class PageMatchResult:
+    """Matches for one page, applied to the shared document after every page has finished."""
+    page_num: int
+    page_fields: Dict[str, Dict[str, Any]]
+    page_ocr: List[Dict[str, Any]] = field(default_factory=list)
+    matches: List[FieldMatch] = field(default_factory=list)
+    ocr_matches: List[OCRFieldMatch] = field(default_factory=list)
+
+
 class PageByPageFormFiller:
-    def __init__(self):
-        self.agent = Agent(
-            model=GeminiModel("gemini-1.5-flash", api_key=API_KEYS["field_matcher"]),
+    def __init__(self, page_concurrency: int = PAGE_CONCURRENCY, page_timeout: float = PAGE_TIMEOUT_SECONDS):
+        self.page_concurrency = max(1, page_concurrency)
+        self.page_timeout = page_timeout
+        # Matching and vision calls both draw from the shared API key pool
+        self.agent = PooledAgent(lambda api_key: Agent(
+            model=GeminiModel("gemini-1.5-flash", api_key=api_key),
             system_prompt="You are an expert at mapping PDF fields to JSON keys and filling them immediately."
-        )
+        ), name="gemini-1.5-flash")
+
+        self.llm = LLMCaller("field_matcher")
 
         self.matched_fields = {}
 
@@ -107,14 +118,19 @@ class PageByPageFormFiller:
                 }
 
         print(f"✅ Extracted {len(fields)} fields from page {page_num + 1}")
-        for field, info in fields.items():
+        for field_name, info in fields.items():
             readonly_status = "READ-ONLY" if info["is_readonly"] else "EDITABLE"
-            print(f" - Field: '{field}' [{readonly_status}]")
+            print(f" - Field: '{field_name}' [{readonly_status}]")
 
         return fields
 
-    async def extract_ocr_for_page(self, doc: fitz.Document, page_num: int, dpi=300) -> List[Dict[str, Any]]:
-        """Extract OCR text for a single page using Gemini Vision."""
+    async def extract_ocr_for_page(self, doc: fitz.Document, page_num: int,
+                                   dpi: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Extract OCR text for a single page using Gemini Vision.
+
+        The page is encoded once by the shared vision encoder; without a dpi
+        the resolution is picked from the page's text size.
+        """
         print(f"🔍 Extracting text using Gemini Vision for page {page_num + 1}...")
 
         page = doc[page_num]
@@ -122,17 +138,14 @@ class PageByPageFormFiller:
 
         try:
             # Get page image
-            pix = page.get_pixmap(matrix=fitz.Matrix(dpi / 72, dpi / 72))
-            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-            img_byte_arr = io.BytesIO()
-            img.save(img_byte_arr, format='PNG')
-            img_byte_arr = img_byte_arr.getvalue()
-
-            # Process with Gemini Vision
-            model = genai.GenerativeModel('gemini-1.5-flash')
-            response = model.generate_content([
-                "Extract all the text from this image, maintaining the structure and layout information. Also identify form fields and their positions. Return the following JSON structure: {\"extracted_text\": \"full text\", \"form_fields\": [{\"label\": \"field label\", \"position\": {\"x1\": float, \"y1\": float, \"x2\": float, \"y2\": float}}]}",
-                Image.open(io.BytesIO(img_byte_arr))
+            # Rendered on the loop thread: other pages of the same document are being read concurrently
+            image = encode_page_image(page, VisionImageOptions(dpi=dpi))
+
+            # Process with Gemini Vision; the async client keeps the event loop free while other pages are in flight
+            response = await generate_content_pooled('gemini-1.5-flash', [
+                "Extract all the text from this image, maintaining the structure and layout information. Also identify form fields and their positions. Return the following JSON structure: {\"extracted_text\": \"full text\", \"form_fields\": [{\"label\": \"field label\", \"position\": {\"x1\": float, \"y1\": float, \"x2\": float, \"y2\": float}}]}"
+                f" Positions are pixel coordinates in this {image.width}x{image.height} image, origin at the top left.",
+                image.blob()
             ])
 
             extracted_text = response.text.strip()
@@ -157,21 +170,18 @@ class PageByPageFormFiller:
                         }
                     })
 
-                # Add form fields
-                for field in form_fields:
-                    label = field.get("label", "")
-                    position = field.get("position", {})
+                # Add form fields; boxes come back in image pixels, whose scale follows the page's DPI
+                for form_field in form_fields:
+                    label = form_field.get("label", "")
+                    position = form_field.get("position", {})
                     if label:
+                        x1, y1 = image.to_page_points(float(position.get("x1", 0)), float(position.get("y1", 0)))
+                        x2, y2 = image.to_page_points(float(position.get("x2", 100)), float(position.get("y2", 20)))
                         ocr_results.append({
                             "text": label,
                             "page_num": page_num,
                             "confidence": 0.95,
-                            "position": {
-                                "x1": float(position.get("x1", 0)),
-                                "y1": float(position.get("y1", 0)),
-                                "x2": float(position.get("x2", 100)),
-                                "y2": float(position.get("y2", 20))
-                            }
+                            "position": {"x1": x1, "y1": y1, "x2": x2, "y2": y2}
                         })
             except json.JSONDecodeError:
                 # If not JSON, treat as plain text
@@ -209,16 +219,20 @@ class PageByPageFormFiller:
 
         return ocr_results
 
-    async def process_page(self, doc: fitz.Document, page_num: int, flat_json: Dict[str, Any], output_pdf: str,
-                           max_retries: int = 3) -> bool:
-        """Process a single page: extract fields, extract OCR data, match fields with JSON, and fill fields."""
+    async def process_page(self, doc: fitz.Document, page_num: int, flat_json: Dict[str, Any],
+                           max_retries: int = 3) -> Optional[PageMatchResult]:
+        """Process a single page: extract fields, extract OCR data and match fields with JSON.
+
+        Nothing is written here; the caller applies every page's matches to
+        one document and saves it once.
+        """
         print(f"\n=== Processing Page {page_num + 1} ===")
 
         # Extract fields for this page
         page_fields = await self.extract_pdf_fields_for_page(doc, page_num)
         if not page_fields:
             print(f"No form fields found on page {page_num + 1}, skipping...")
-            return True
+            return None
 
         # Extract OCR data for this page
         page_ocr = await self.extract_ocr_for_page(doc, page_num)
@@ -234,93 +248,93 @@ class PageByPageFormFiller:
             field_context=json.dumps(field_context, indent=2, cls=NumpyEncoder)
         )
 
-        # Match fields with JSON using AI
-        matches, ocr_matches = [], []
-        for attempt in range(max_retries):
-            response = await self.agent.run(prompt)
-            result = self.parse_ai_response(response.data)
-
-            if result:
-                matches = result.get("field_matches", [])
-                ocr_matches = result.get("ocr_matches", [])
-                if matches or ocr_matches:
-                    break
-
-            print(
-                f"Attempt {attempt + 1}/{max_retries} failed to get valid matches for page {page_num + 1}. Retrying...")
+        # Match fields with JSON using AI; failed entries are re-asked on their own
+        result = await self.llm.run_validated(
+            self.agent, prompt,
+            {"matches": lambda m: self.validate_match(m, page_fields), "ocr_matches": self.validate_ocr_match},
+            max_rounds=max_retries
+        )
+        matches, ocr_matches = result["matches"], result["ocr_matches"]
 
         if not matches and not ocr_matches:
             print(f"⚠️ No valid field matches were found for page {page_num + 1} after all attempts.")
-            return True  # Continue with next page
+            return None  # Continue with next page
+
+        return PageMatchResult(page_num=page_num, page_fields=page_fields, page_ocr=page_ocr,
+                               matches=matches, ocr_matches=ocr_matches)
+
+    async def process_page_bounded(self, semaphore: asyncio.Semaphore, doc: fitz.Document, page_num: int,
+                                   flat_json: Dict[str, Any], max_retries: int) -> Optional[PageMatchResult]:
+        """Runs process_page under the concurrency limit and the per-page timeout."""
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(self.process_page(doc, page_num, flat_json, max_retries),
+                                              timeout=self.page_timeout)
+            except asyncio.TimeoutError:
+                print(f"⏱️ Page {page_num + 1} timed out after {self.page_timeout:.0f}s, skipping")
+            except Exception as e:
+                print(f"⚠️ Failed to process page {page_num + 1}: {e}")
+            return None
 
-        # Fill form fields
+    def apply_page_result(self, doc: fitz.Document, page_result: PageMatchResult) -> int:
+        """Fills one page's widget and OCR matches into the shared document; returns how many OCR values were placed."""
+        page_num = page_result.page_num
         print(f"Filling form fields for page {page_num + 1}...")
-        combined_matches = matches + [
+        combined_matches = page_result.matches + [
             FieldMatch(
                 json_field=m.json_field,
                 pdf_field=m.pdf_field,
                 confidence=m.confidence,
                 suggested_value=m.suggested_value,
                 reasoning=m.reasoning
-            ) for m in ocr_matches
+            ) for m in page_result.ocr_matches
         ]
 
-        success = self.fill_pdf_immediately(output_pdf, combined_matches, page_fields)
+        success = self.fill_pdf_immediately(doc, combined_matches, page_result.page_fields)
         if not success:
             print(f"⚠️ Some fields may not have been filled correctly on page {page_num + 1}.")
 
         # Fill OCR-detected fields if needed
-        if ocr_matches:
-            ocr_success = self.fill_ocr_fields(output_pdf, ocr_matches, page_ocr)
-            if not ocr_success:
+        placed_values = 0
+        if page_result.ocr_matches:
+            placed_values = self.fill_ocr_fields(doc, page_result.ocr_matches, page_result.page_ocr)
+            if not placed_values:
                 print(f"⚠️ Some OCR fields may not have been filled correctly on page {page_num + 1}.")
-
-        return True
+        return placed_values
 
     async def match_and_fill_fields(self, pdf_path: str, json_data: Dict[str, Any], output_pdf: str,
                                     max_retries: int = 3):
-        """Matches fields using AI and fills them immediately page by page."""
+        """Matches fields using AI page by page, with pages in flight concurrently, and fills them.
 
-        backup_pdf = f"{pdf_path}.backup"
-        shutil.copy2(pdf_path, backup_pdf)
-        print(f"Created backup of original PDF: {backup_pdf}")
+        Up to page_concurrency pages are matched at once, each bounded by
+        page_timeout. The template is only read; all fills go into one open
+        document that is written to output_pdf once at the end.
+        """
 
         # Flatten JSON for easier matching
         flat_json = self.flatten_json(json_data)
 
-        # Copy to temp output path first
-        temp_output = f"{output_pdf}.temp"
-        shutil.copy2(pdf_path, temp_output)
-
         try:
             # Open document
             doc = fitz.open(pdf_path)
-            page_count = len(doc)
-
-            # Process each page sequentially
-            for page_num in range(page_count):
-                success = await self.process_page(doc, page_num, flat_json, temp_output, max_retries)
-                if not success:
-                    print(f"⚠️ Failed to process page {page_num + 1}")
-
-            doc.close()
-
-            # Finalize the PDF
             try:
-                self.finalize_pdf(temp_output, output_pdf)
-                print(f"✅ Finalized PDF saved to: {output_pdf}")
-                return self.verify_pdf_filled(output_pdf)
-            except Exception as e:
-                print(f"❌ Error during finalization: {e}")
-                print("Trying alternative finalization method...")
-
-                try:
-                    shutil.copy2(temp_output, output_pdf)
-                    print(f"✅ Alternative save successful: {output_pdf}")
-                    return self.verify_pdf_filled(output_pdf)
-                except Exception as e2:
-                    print(f"❌ Alternative save also failed: {e2}")
-                    return False
+                page_count = len(doc)
+                semaphore = asyncio.Semaphore(self.page_concurrency)
+                page_results = await asyncio.gather(*(
+                    self.process_page_bounded(semaphore, doc, page_num, flat_json, max_retries)
+                    for page_num in range(page_count)
+                ))
+
+                placed_values = 0
+                for page_result in page_results:
+                    if page_result is not None:
+                        placed_values += self.apply_page_result(doc, page_result)
+
+                doc.save(output_pdf, deflate=True, clean=True)
+                print(f"✅ Filled PDF saved to: {output_pdf}")
+                return self.verify_pdf_filled(doc, placed_values)
+            finally:
+                doc.close()
 
         except Exception as e:
             print(f"❌ Error during filling: {e}")
@@ -413,67 +427,31 @@ class PageByPageFormFiller:
 
         return label_map
 
-    def parse_ai_response(self, response_text: str) -> Dict[str, List]:
-        """Parses AI response and extracts valid JSON matches for both form fields and OCR text."""
-        json_patterns = [
-            r'```json\s*([\s\S]*?)\s*```',
-            r'```\s*([\s\S]*?)\s*```',
-            r'(\{[\s\S]*\})'
-        ]
-
-        for pattern in json_patterns:
-            json_match = re.search(pattern, response_text)
-            if json_match:
-                response_text = json_match.group(1)
-                break
-
-        response_text = response_text.strip()
-
-        try:
-            data = json.loads(response_text)
-            result = {
-                "field_matches": [],
-                "ocr_matches": []
-            }
-
-            for match in data.get("matches", []):
-                match.setdefault("confidence", 1.0)
-                match.setdefault("reasoning", "No reasoning provided.")
-
-                try:
-                    validated_match = FieldMatch(**match)
-                    result["field_matches"].append(validated_match)
-                except Exception as e:
-                    print(f"⚠️ Skipping malformed field match: {match} | Error: {e}")
-
-            for match in data.get("ocr_matches", []):
-                match.setdefault("confidence", 1.0)
-                match.setdefault("reasoning", "No reasoning provided.")
-                match.setdefault("page_num", 0)
-                match.setdefault("x1", 100)
-                match.setdefault("y1", 100)
-                match.setdefault("x2", 300)
-                match.setdefault("y2", 120)
-
-                try:
-                    validated_match = OCRFieldMatch(**match)
-                    result["ocr_matches"].append(validated_match)
-                except Exception as e:
-                    print(f"⚠️ Skipping malformed OCR match: {match} | Error: {e}")
-
-            return result
-        except json.JSONDecodeError as e:
-            print(f"❌ AI returned invalid JSON: {e}")
-            print(f"Failed text: {response_text[:100]}...")
-            return {}
-
-    def fill_pdf_immediately(self, output_pdf: str, matches: List[FieldMatch],
+    @staticmethod
+    def validate_match(match: Dict[str, Any], pdf_fields: Dict[str, Any]) -> FieldMatch:
+        """Builds a FieldMatch from one reply entry, rejecting fields the page doesn't have."""
+        match.setdefault("confidence", 1.0)
+        match.setdefault("reasoning", "No reasoning provided.")
+        validated_match = FieldMatch(**match)
+        if validated_match.pdf_field not in pdf_fields:
+            raise ValueError(f"pdf_field '{validated_match.pdf_field}' is not one of this page's fields")
+        return validated_match
+
+    @staticmethod
+    def validate_ocr_match(match: Dict[str, Any]) -> OCRFieldMatch:
+        match.setdefault("confidence", 1.0)
+        match.setdefault("reasoning", "No reasoning provided.")
+        match.setdefault("page_num", 0)
+        match.setdefault("x1", 100)
+        match.setdefault("y1", 100)
+        match.setdefault("x2", 300)
+        match.setdefault("y2", 120)
+        return OCRFieldMatch(**match)
+
+    def fill_pdf_immediately(self, doc: fitz.Document, matches: List[FieldMatch],
                              pdf_fields: Dict[str, Dict[str, Any]]) -> bool:
-        """Fills PDF form fields using PyMuPDF (fitz) with improved handling of readonly fields."""
-        doc = fitz.open(output_pdf)
-        filled_fields = []
-
-        updates = []
+        """Fills PDF form fields in an open document, skipping readonly fields left for OCR placement."""
+        updates = {}
         for match in matches:
             if match.pdf_field and match.suggested_value is not None:
                 field_info = pdf_fields.get(match.pdf_field)
@@ -486,220 +464,87 @@ class PageByPageFormFiller:
                     print(f"⚠️ Skipping readonly field '{match.pdf_field}' - will handle via OCR")
                     continue
 
-                page_num = field_info["page_num"]
-                updates.append((page_num, match.pdf_field, match.suggested_value))
-
-        for page_num, field_name, value in updates:
-            page = doc[page_num]
-            for widget in page.widgets():
-                if widget.field_name == field_name:
-                    print(f"✍️ Filling: '{value}' → '{field_name}' (Page {page_num + 1})")
-                    try:
-                        widget.field_value = str(value)
-                        widget.update()
-                        filled_fields.append(field_name)
-                    except Exception as e:
-                        print(f"⚠️ Error filling {field_name}: {e}")
-                    break
+                updates[match.pdf_field] = match.suggested_value
 
-        try:
-            # Remove garbage and incremental parameters to fix the error
-            doc.save(output_pdf, deflate=True, clean=True)
-            print(f"✅ Saved PDF with {len(filled_fields)} filled fields")
-            doc.close()
-            return len(filled_fields) > 0
-        except Exception as e:
-            print(f"❌ Error saving PDF: {e}")
+        filled_fields = apply_field_updates(doc, updates).applied
+        print(f"✅ Filled {len(filled_fields)} fields")
+        return len(filled_fields) > 0
 
-            try:
-                temp_path = f"{output_pdf}.tmp"
-                doc.save(temp_path, deflate=True, clean=True)
-                doc.close()
-                shutil.move(temp_path, output_pdf)
-                print(f"✅ Saved PDF using alternative method")
-                return len(filled_fields) > 0
-            except Exception as e2:
-                print(f"❌ Alternative save also failed: {e2}")
-                doc.close()
-                return False
+    def fill_ocr_fields(self, doc: fitz.Document, ocr_matches: List[OCRFieldMatch],
+                        ocr_elements: List[Dict[str, Any]]) -> int:
+        """Writes values for readonly/OCR fields into an open document and returns how many were placed.
 
-    def fill_ocr_fields(self, pdf_path: str, ocr_matches: List[OCRFieldMatch],
-                        ocr_elements: List[Dict[str, Any]]) -> bool:
-        """Fills OCR-detected areas with text for readonly fields."""
-        doc = fitz.open(pdf_path)
-        annotations_added = 0
+        Each value goes into the nearest blank underline or box right of or
+        below its OCR label (or into the model's box when the label isn't
+        found), sized to fit, and every page's values are written in one batch
+        as page text rather than annotations.
+        """
+        # Indexed once; every match below looks its label up in it
+        text_index = OCRTextIndex(ocr_elements)
+        placers: Dict[int, PageTextPlacer] = {}
 
         for match in ocr_matches:
-            if match.suggested_value is not None:
-                try:
-                    page = doc[match.page_num]
-
-                    position = None
-                    if match.ocr_text:
-                        position = self.find_text_position(match.ocr_text, ocr_elements, match.page_num)
-
-                    if position:
-                        x1, y1, x2, y2 = position["x1"], position["y1"], position["x2"], position["y2"]
-
-                        x1 = x2 + 10
-                        x2 = x1 + 150
-
-                        y2 = y1 + (y2 - y1)
-                    else:
-                        x1, y1, x2, y2 = match.x1, match.y1, match.x2, match.y2
-
-                    rect = fitz.Rect(x1, y1, x2, y2)
-
-                    print(
-                        f"✍️ Filling OCR field: '{match.suggested_value}' → near '{match.ocr_text}' (Page {match.page_num + 1})")
-
-                    annotation_added = False
-
-                    try:
-                        annot = page.add_freetext_annot(
-                            rect=rect,
-                            text=str(match.suggested_value),
-                            fontsize=10,
-                            fill_color=(0.95, 0.95, 0.95),
-                            text_color=(0, 0, 0)
-                        )
-                        annotations_added += 1
-                        annotation_added = True
-                    except Exception as e1:
-                        print(f"⚠️ Free text annotation failed: {e1}")
-
-                    if not annotation_added:
-                        try:
-                            page.draw_rect(rect, color=(0.95, 0.95, 0.95), fill=(0.95, 0.95, 0.95))
-
-                            page.insert_text(
-                                point=(x1 + 2, y1 + 10),
-                                text=str(match.suggested_value),
-                                fontsize=10
-                            )
-                            annotations_added += 1
-                            annotation_added = True
-                        except Exception as e2:
-                            print(f"⚠️ Text insertion failed: {e2}")
-
-                    if not annotation_added:
-                        try:
-                            annot = page.add_text_annot(
-                                point=(x1, y1),
-                                text=str(match.suggested_value)
-                            )
-                            annotations_added += 1
-                        except Exception as e3:
-                            print(f"⚠️ All text methods failed: {e3}")
-                except Exception as e:
-                    print(f"⚠️ Error processing OCR match: {e}")
-
-        if annotations_added > 0:
+            if match.suggested_value is None:
+                continue
             try:
-                # Remove incremental parameter to fix the error
-                doc.save(pdf_path, deflate=True, clean=True)
-                print(f"✅ Added {annotations_added} OCR text fields")
-                doc.close()
-                return True
+                placer = placers.get(match.page_num)
+                if placer is None:
+                    placer = placers[match.page_num] = PageTextPlacer(doc[match.page_num])
+
+                position = None
+                if match.ocr_text:
+                    position = self.find_text_position(match.ocr_text, ocr_elements, match.page_num,
+                                                       text_index)
+
+                value = str(match.suggested_value)
+                if position:
+                    label = fitz.Rect(position["x1"], position["y1"], position["x2"], position["y2"])
+                    placement = placer.place_near_label(label, value)
+                else:
+                    placement = placer.place_in_rect(fitz.Rect(match.x1, match.y1, match.x2, match.y2), value)
+
+                print(f"✍️ Filling OCR field: '{placement.text}' → {placement.kind} near '{match.ocr_text}' "
+                      f"at {placement.fontsize}pt (Page {match.page_num + 1})")
             except Exception as e:
-                print(f"❌ Error saving PDF with OCR annotations: {e}")
-                try:
-                    temp_path = f"{pdf_path}.temp"
-                    doc.save(temp_path)
-                    doc.close()
-                    shutil.move(temp_path, pdf_path)
-                    print(f"✅ Saved OCR annotations using alternative method")
-                    return True
-                except Exception as e2:
-                    print(f"❌ Alternative save method also failed: {e2}")
-                    doc.close()
-                    return False
-        else:
-            doc.close()
-            return False
-
-    def find_text_position(self, text: str, ocr_elements: List[Dict[str, Any]], page_num: int) -> Dict[str, float]:
-        """Find the position of a text element in the OCR results with improved fuzzy matching."""
-        if not text or not ocr_elements:
-            return None
-
-        search_text = text.strip().lower()
-
-        for element in ocr_elements:
-            if element["page_num"] == page_num and element["text"].strip().lower() == search_text:
-                return element["position"]
+                print(f"⚠️ Error processing OCR match: {e}")
 
-        for element in ocr_elements:
-            if element["page_num"] == page_num and search_text in element["text"].strip().lower():
-                return element["position"]
-
-        best_match = None
-        best_ratio = 0.7
-
-        for element in ocr_elements:
-            if element["page_num"] == page_num:
-                element_text = element["text"].strip().lower()
-
-                ratio = SequenceMatcher(None, search_text, element_text).ratio()
-
-                if ratio > best_ratio:
-                    best_ratio = ratio
-                    best_match = element["position"]
-
-                words_in_search = set(search_text.split())
-                words_in_element = set(element_text.split())
-                common_words = words_in_search.intersection(words_in_element)
-
-                if common_words:
-                    word_ratio = len(common_words) / max(len(words_in_search), 1)
-                    if word_ratio > 0.5 and word_ratio > best_ratio:
-                        best_ratio = word_ratio
-                        best_match = element["position"]
+        placed_values = 0
+        for page_num, placer in placers.items():
+            try:
+                placed_values += placer.flush()
+            except Exception as e:
+                print(f"⚠️ Text insertion failed on page {page_num + 1}: {e}")
 
-        return best_match
+        if placed_values > 0:
+            print(f"✅ Placed {placed_values} OCR field values")
+        return placed_values
 
-    def finalize_pdf(self, input_pdf: str, output_pdf: str) -> None:
-        """Finalizes the PDF using PyPDF to avoid incremental save issues."""
-        try:
-            reader = PdfReader(input_pdf)
-            writer = PdfWriter()
+    def find_text_position(self, text: str, ocr_elements: List[Dict[str, Any]], page_num: int,
+                           text_index: Optional[OCRTextIndex] = None) -> Dict[str, float]:
+        """Find the position of a text element in the OCR results: exact, then substring, then fuzzy.
 
-            for page in reader.pages:
-                writer.add_page(page)
+        Pass the document's text_index when looking up several labels; one is built here otherwise.
+        """
+        if not text or not ocr_elements:
+            return None
 
-            if reader.get_fields():
-                writer.clone_reader_document_root(reader)
+        text_index = text_index or OCRTextIndex(ocr_elements)
+        return text_index.find_position(text, page_num)
 
-            with open(output_pdf, "wb") as f:
-                writer.write(f)
-        except Exception as e:
-            print(f"❌ Error in finalize_pdf: {e}")
-            # Simply copy the file as a fallback
-            shutil.copy2(input_pdf, output_pdf)
-            print(f"✅ Used direct file copy as fallback for finalization")
+    def verify_pdf_filled(self, doc: fitz.Document, placed_values: int = 0) -> bool:
+        """Verifies that the PDF has filled widgets, annotations or OCR values placed as page text.
 
-    def verify_pdf_filled(self, pdf_path: str) -> bool:
-        """Verifies that the PDF has been filled correctly or has annotations."""
+        Placed values are written into the page content, where they can't be
+        told apart from the form's own text, so fill_ocr_fields' count is passed in.
+        """
         try:
-            reader = PdfReader(pdf_path)
-            fields = reader.get_fields()
-
-            filled_fields = {}
-            if fields:
-                filled_fields = {k: v.get("/V") for k, v in fields.items() if v.get("/V")}
-                print(f"✅ Found {len(filled_fields)} filled form fields")
-
-            doc = fitz.open(pdf_path)
-            annotation_count = 0
-
-            for page in doc:
-                annotations = list(page.annots())
-                annotation_count += len(annotations)
+            filled_fields = filled_widget_values(doc)
+            print(f"✅ Found {len(filled_fields)} filled form fields")
 
-            doc.close()
-            print(f"✅ Found {annotation_count} annotations in the PDF")
+            annotation_count = sum(len(list(page.annots())) for page in doc)
+            print(f"✅ Found {annotation_count} annotations and {placed_values} placed OCR values in the PDF")
 
-            return bool(filled_fields) or annotation_count > 0
+            return bool(filled_fields) or annotation_count > 0 or placed_values > 0
 
         except Exception as e:
             print(f"❌ Error verifying PDF: {e}")
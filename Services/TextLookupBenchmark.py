@@ -0,0 +1,159 @@
+"""Compares the indexed OCR text lookup with the linear SequenceMatcher scan it replaced.
+
+Usage:
+    python -m Services.TextLookupBenchmark [--templates 3] [--queries 500] [--seed 7]
+
+OCR elements are taken from the text layer of the templates in
+Services/*.pdf (one element per line, as the vision OCR returns them).
+Queries are lines taken verbatim, truncated, or with OCR/typing noise
+(adjacent transpositions, substitutions, dropped and doubled characters),
+the way labels come back from the matcher. The report shows
+per-lookup latency, how often both implementations return the same
+position and how often each finds the line the query was made from.
+"""
+import argparse
+import glob
+import os
+import random
+import statistics
+import time
+from difflib import SequenceMatcher
+from typing import Dict, Any, List, Optional, Tuple
+
+import fitz
+
+from Services.OCRTextIndex import OCRTextIndex
+
+SERVICES_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def scan_find_text_position(text: str, ocr_elements: List[Dict[str, Any]],
+                            page_num: int) -> Optional[Dict[str, float]]:
+    """The previous find_text_position: exact, substring and SequenceMatcher scans over every element."""
+    if not text or not ocr_elements:
+        return None
+
+    search_text = text.strip().lower()
+
+    for element in ocr_elements:
+        if element["page_num"] == page_num and element["text"].strip().lower() == search_text:
+            return element["position"]
+
+    for element in ocr_elements:
+        if element["page_num"] == page_num and search_text in element["text"].strip().lower():
+            return element["position"]
+
+    best_match = None
+    best_ratio = 0.7
+    for element in ocr_elements:
+        if element["page_num"] == page_num:
+            element_text = element["text"].strip().lower()
+            ratio = SequenceMatcher(None, search_text, element_text).ratio()
+            if ratio > best_ratio:
+                best_ratio = ratio
+                best_match = element["position"]
+
+            words_in_search = set(search_text.split())
+            common_words = words_in_search.intersection(element_text.split())
+            if common_words:
+                word_ratio = len(common_words) / max(len(words_in_search), 1)
+                if word_ratio > 0.5 and word_ratio > best_ratio:
+                    best_ratio = word_ratio
+                    best_match = element["position"]
+
+    return best_match
+
+
+def text_layer_elements(pdf_path: str) -> List[Dict[str, Any]]:
+    elements = []
+    with fitz.open(pdf_path) as doc:
+        for page_num, page in enumerate(doc):
+            for block in page.get_text("dict")["blocks"]:
+                for line in block.get("lines", []):
+                    text = " ".join(span["text"] for span in line["spans"]).strip()
+                    if len(text) < 3:
+                        continue
+                    x1, y1, x2, y2 = line["bbox"]
+                    elements.append({"text": text, "page_num": page_num, "confidence": 1.0,
+                                     "position": {"x1": x1, "y1": y1, "x2": x2, "y2": y2}})
+    return elements
+
+
+def add_typos(text: str, rng: random.Random) -> str:
+    """About one typo per 12 characters: transpositions, substitutions, dropped and doubled characters."""
+    chars = list(text)
+    for _ in range(max(1, len(chars) // 12)):
+        i = rng.randrange(len(chars))
+        roll = rng.random()
+        if roll < 0.4 and i + 1 < len(chars):
+            chars[i], chars[i + 1] = chars[i + 1], chars[i]
+        elif roll < 0.6:
+            chars[i] = rng.choice("abcdefghijklmnopqrstuvwxyz ")
+        elif roll < 0.8 and len(chars) > 1:
+            del chars[i]
+        else:
+            chars.insert(i, chars[i])
+    return "".join(chars)
+
+
+def make_query(element: Dict[str, Any], rng: random.Random) -> str:
+    text = element["text"]
+    roll = rng.random()
+    if roll < 0.15:
+        return text
+    if roll < 0.3 and len(text) > 8:
+        return text[rng.randrange(3):len(text) - rng.randrange(1, 4)]
+    return add_typos(text, rng)
+
+
+def time_lookups(lookup, queries: List[Tuple[str, int, Dict[str, Any]]]) -> Tuple[List, List[float]]:
+    positions, seconds = [], []
+    for text, page_num, _ in queries:
+        start = time.perf_counter()
+        positions.append(lookup(text, page_num))
+        seconds.append(time.perf_counter() - start)
+    return positions, seconds
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark indexed OCR text lookup against the linear scan.")
+    parser.add_argument("--templates", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    pdf_paths = sorted(glob.glob(os.path.join(SERVICES_DIR, "*.pdf")))
+    ranked = sorted(pdf_paths, key=lambda path: len(text_layer_elements(path)), reverse=True)[:args.templates]
+
+    print(f"{'template':<32} {'lines':>6} {'build ms':>9} {'index ms':>9} {'p95':>7} "
+          f"{'scan ms':>9} {'p95':>7} {'agree':>6} {'hit idx':>8} {'hit scan':>8}")
+    for pdf_path in ranked:
+        elements = text_layer_elements(pdf_path)
+        if not elements:
+            continue
+        queries = []
+        for _ in range(args.queries):
+            element = rng.choice(elements)
+            queries.append((make_query(element, rng), element["page_num"], element["position"]))
+
+        start = time.perf_counter()
+        text_index = OCRTextIndex(elements)
+        build_seconds = time.perf_counter() - start
+
+        indexed, indexed_seconds = time_lookups(text_index.find_position, queries)
+        scanned, scan_seconds = time_lookups(
+            lambda text, page_num: scan_find_text_position(text, elements, page_num), queries)
+
+        agree = sum(a == b for a, b in zip(indexed, scanned)) / len(queries)
+        hit_index = sum(found == expected for found, (_, _, expected) in zip(indexed, queries)) / len(queries)
+        hit_scan = sum(found == expected for found, (_, _, expected) in zip(scanned, queries)) / len(queries)
+        p95 = lambda values: statistics.quantiles(values, n=20)[-1] * 1000
+        print(f"{os.path.basename(pdf_path)[:32]:<32} {len(elements):>6} {build_seconds * 1000:>9.2f} "
+              f"{statistics.mean(indexed_seconds) * 1000:>9.3f} {p95(indexed_seconds):>7.3f} "
+              f"{statistics.mean(scan_seconds) * 1000:>9.3f} {p95(scan_seconds):>7.3f} "
+              f"{agree:>6.0%} {hit_index:>8.0%} {hit_scan:>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import os
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import fitz
+
+PLACEMENT_FONT = "helv"
+PLACEMENT_MAX_FONT_SIZE = float(os.environ.get("PLACEMENT_MAX_FONT_SIZE", 10))
+PLACEMENT_MIN_FONT_SIZE = float(os.environ.get("PLACEMENT_MIN_FONT_SIZE", 6))
+PLACEMENT_TEXT_COLOR = (0, 0, 0)
+# Blank regions narrower than this (points) can't hold a value; also filters out checkboxes
+MIN_REGION_WIDTH = 24.0
+# Drawn rectangles taller than this are section frames rather than entry boxes
+MAX_BOX_HEIGHT = 40.0
+# Height of the writing area above an underline
+UNDERLINE_TEXT_HEIGHT = 12.0
+# Regions below a label are only considered within this gap, and cost more than ones to its right
+MAX_BELOW_GAP = 36.0
+BELOW_DISTANCE_WEIGHT = 1.5
+# Gap between a label and its value, and padding inside a region
+LABEL_GAP = 4.0
+REGION_PADDING = 2.0
+# Width used when no blank region is found near a label
+FALLBACK_WIDTH = 150.0
+
+_UNDERSCORES_RE = re.compile(r"_{3,}")
+
+
+@dataclass
+class BlankRegion:
+    """Empty space meant for a value: above a drawn or typed underline, or inside a drawn box."""
+    rect: fitz.Rect
+    kind: str
+    used: bool = False
+
+
+@dataclass
+class Placement:
+    text: str
+    rect: fitz.Rect
+    fontsize: float
+    origin: Tuple[float, float]
+    kind: str
+
+
+def fit_font_size(text: str, width: float, height: float, max_size: float = PLACEMENT_MAX_FONT_SIZE,
+                  min_size: float = PLACEMENT_MIN_FONT_SIZE) -> Tuple[str, float]:
+    """Largest font size (in 0.5pt steps) at which text fits the box; text is cut if even min_size overflows."""
+    unit_width = fitz.get_text_length(text, fontname=PLACEMENT_FONT, fontsize=1)
+    size = min(max_size, height * 0.8)
+    if unit_width > 0:
+        size = min(size, width / unit_width)
+    size = max(min_size, int(size * 2) / 2)
+    while text and fitz.get_text_length(text, fontname=PLACEMENT_FONT, fontsize=size) > width:
+        text = text[:-1]
+    return text, size
+
+
+def _overlaps_vertically(a: fitz.Rect, b: fitz.Rect) -> bool:
+    return min(a.y1, b.y1) - max(a.y0, b.y0) > 0
+
+
+def _trim_around_text(rect: fitz.Rect, words: List[fitz.Rect]) -> Optional[fitz.Rect]:
+    """Shrinks a region past printed words sitting in it; None if what's left is too narrow."""
+    rect = fitz.Rect(rect)
+    for word in words:
+        if not _overlaps_vertically(word, rect) or word.x1 <= rect.x0 or word.x0 >= rect.x1:
+            continue
+        if (word.x0 + word.x1) / 2 < (rect.x0 + rect.x1) / 2:
+            rect.x0 = max(rect.x0, word.x1 + REGION_PADDING)
+        else:
+            rect.x1 = min(rect.x1, word.x0 - REGION_PADDING)
+    return rect if rect.width >= MIN_REGION_WIDTH else None
+
+
+def detect_blank_regions(page: fitz.Page, words: Optional[List[Tuple]] = None) -> List[BlankRegion]:
+    """Blank underlines and boxes on a page, from its vector drawings and its text layer.
+
+    Horizontal strokes (and hairline rectangles, which many generators use
+    for rules) become underline regions; small rectangles become boxes; runs
+    of typed underscores become underlines too. Regions are trimmed past any
+    printed text already inside them.
+    """
+    words = page.get_text("words") if words is None else words
+    text_rects = [fitz.Rect(w[:4]) for w in words if not _UNDERSCORES_RE.fullmatch(w[4])]
+    candidates: List[Tuple[fitz.Rect, str]] = []
+
+    for path in page.get_drawings():
+        for item in path["items"]:
+            if item[0] == "l":
+                start, end = item[1], item[2]
+                if abs(start.y - end.y) <= 1.5 and abs(end.x - start.x) >= MIN_REGION_WIDTH:
+                    x0, x1 = sorted((start.x, end.x))
+                    y = max(start.y, end.y)
+                    candidates.append((fitz.Rect(x0, y - UNDERLINE_TEXT_HEIGHT, x1, y), "underline"))
+            elif item[0] == "re":
+                rect = fitz.Rect(item[1])
+                if rect.width < MIN_REGION_WIDTH:
+                    continue
+                if rect.height <= 1.5:
+                    candidates.append((fitz.Rect(rect.x0, rect.y1 - UNDERLINE_TEXT_HEIGHT, rect.x1, rect.y1),
+                                       "underline"))
+                elif rect.height <= MAX_BOX_HEIGHT and rect.width < page.rect.width * 0.9:
+                    candidates.append((rect + (REGION_PADDING, REGION_PADDING, -REGION_PADDING, -REGION_PADDING),
+                                       "box"))
+
+    for x0, y0, x1, y1, text, *_ in words:
+        run = _UNDERSCORES_RE.search(text)
+        if not run:
+            continue
+        # Words like "Name:______" carry the label too; keep the underscores' share of the width
+        char_width = (x1 - x0) / len(text)
+        candidates.append((fitz.Rect(x0 + run.start() * char_width, y1 - UNDERLINE_TEXT_HEIGHT,
+                                     x0 + run.end() * char_width, y1), "underline"))
+
+    regions: List[BlankRegion] = []
+    # Boxes first, so the top and bottom strokes of a drawn box don't also count as underlines
+    for rect, kind in sorted(candidates, key=lambda c: (c[1] != "box", c[0].y0, c[0].x0)):
+        rect = _trim_around_text(rect, text_rects)
+        if rect is None:
+            continue
+        if any(abs(rect & region.rect) > 0.5 * abs(rect) for region in regions):
+            continue
+        regions.append(BlankRegion(rect, kind))
+    return regions
+
+
+class PageTextPlacer:
+    """Places values on one page without an LLM: next to their labels, in blank regions, never overlapping.
+
+    Placements are collected and written with one TextWriter in flush(), so
+    a page gets a single content stream addition however many values it has.
+    """
+
+    def __init__(self, page: fitz.Page):
+        self.page = page
+        words = page.get_text("words")
+        self.regions = detect_blank_regions(page, words)
+        self.occupied: List[fitz.Rect] = [fitz.Rect(w[:4]) for w in words if not _UNDERSCORES_RE.fullmatch(w[4])]
+        self.placements: List[Placement] = []
+
+    def _region_cost(self, region: BlankRegion, label: fitz.Rect) -> Optional[Tuple[float, fitz.Rect]]:
+        rect = region.rect
+        label_band = fitz.Rect(label.x0, label.y0 - LABEL_GAP, label.x1, label.y1 + LABEL_GAP)
+        # Right of the label on the same line; an underline running under the label is clipped past it
+        start = max(rect.x0, label.x1 + LABEL_GAP)
+        if _overlaps_vertically(rect, label_band) and rect.x1 - start >= MIN_REGION_WIDTH:
+            clipped = fitz.Rect(start, rect.y0, rect.x1, rect.y1)
+            vertical_offset = abs((rect.y0 + rect.y1) / 2 - (label.y0 + label.y1) / 2)
+            return max(0.0, rect.x0 - label.x1) + vertical_offset, clipped
+        # Below the label, overlapping it horizontally
+        gap = rect.y0 - label.y1
+        if -LABEL_GAP <= gap <= MAX_BELOW_GAP and rect.x0 < label.x1 and rect.x1 > label.x0:
+            return max(0.0, gap) * BELOW_DISTANCE_WEIGHT + abs(rect.x0 - label.x0), rect
+        return None
+
+    def _free_width(self, rect: fitz.Rect) -> fitz.Rect:
+        """Cuts a fallback rect short of the first text or earlier value to its right."""
+        rect = fitz.Rect(rect.x0, rect.y0, min(rect.x1, self.page.rect.x1 - REGION_PADDING), rect.y1)
+        for other in self.occupied:
+            if _overlaps_vertically(other, rect) and other.x1 > rect.x0 and other.x0 < rect.x1:
+                if other.x0 <= rect.x0:
+                    return fitz.Rect(rect.x0, rect.y0, rect.x0, rect.y1)
+                rect.x1 = other.x0 - REGION_PADDING
+        return rect
+
+    def _add(self, text: str, rect: fitz.Rect, kind: str) -> Placement:
+        text, fontsize = fit_font_size(text, rect.width - 2 * REGION_PADDING, rect.height)
+        if kind == "box":
+            baseline = rect.y0 + (rect.height + fontsize * 0.7) / 2
+        else:
+            baseline = rect.y1 - REGION_PADDING
+        placement = Placement(text, rect, fontsize, (rect.x0 + REGION_PADDING, baseline), kind)
+        self.placements.append(placement)
+        self.occupied.append(fitz.Rect(rect.x0, baseline - fontsize, rect.x0 + REGION_PADDING +
+                                       fitz.get_text_length(text, fontname=PLACEMENT_FONT, fontsize=fontsize),
+                                       baseline + fontsize * 0.25))
+        return placement
+
+    def place_near_label(self, label: fitz.Rect, text: str) -> Placement:
+        """Puts text in the nearest unused blank region right of or below the label, else right after it."""
+        best = None
+        for region in self.regions:
+            if region.used:
+                continue
+            scored = self._region_cost(region, label)
+            if scored and (best is None or scored[0] < best[0]):
+                best = (scored[0], scored[1], region)
+        if best:
+            best[2].used = True
+            return self._add(text, best[1], best[2].kind)
+
+        height = max(label.height, UNDERLINE_TEXT_HEIGHT)
+        right = self._free_width(fitz.Rect(label.x1 + LABEL_GAP, label.y1 - height,
+                                           label.x1 + LABEL_GAP + FALLBACK_WIDTH, label.y1))
+        if right.width >= MIN_REGION_WIDTH:
+            return self._add(text, right, "label")
+        below = self._free_width(fitz.Rect(label.x0, label.y1 + LABEL_GAP,
+                                           label.x0 + FALLBACK_WIDTH, label.y1 + LABEL_GAP + height))
+        return self._add(text, below if below.width >= MIN_REGION_WIDTH else right, "label")
+
+    def place_in_rect(self, rect: fitz.Rect, text: str) -> Placement:
+        """Puts text in the given area, snapped to the unused blank region overlapping it most."""
+        best, best_area = None, 0.0
+        for region in self.regions:
+            area = abs(region.rect & rect)
+            if not region.used and area > best_area:
+                best, best_area = region, area
+        if best is not None:
+            best.used = True
+            return self._add(text, best.rect, best.kind)
+        return self._add(text, fitz.Rect(rect), "given")
+
+    def flush(self) -> int:
+        """Writes every pending placement to the page in one batch and returns how many were written."""
+        if not self.placements:
+            return 0
+        writer = fitz.TextWriter(self.page.rect)
+        font = fitz.Font(PLACEMENT_FONT)
+        for placement in self.placements:
+            writer.append(placement.origin, placement.text, font=font, fontsize=placement.fontsize)
+        writer.write_text(self.page, color=PLACEMENT_TEXT_COLOR)
+        written = len(self.placements)
+        self.placements = []
+        return written
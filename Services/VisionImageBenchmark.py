@@ -0,0 +1,111 @@
+"""Compares vision image encodings by payload size, encode time and label accuracy.
+
+Usage:
+    python -m Services.VisionImageBenchmark [--templates 3] [--accuracy]
+
+Picks the templates in Services/*.pdf with the most widgets and encodes
+every page with each configuration. With --accuracy it also asks Gemini for
+the widgets' labels under each configuration and scores them against the
+labels returned for the previous payload (colour PNG at 1.5x), so a
+smaller encoding only wins if the model still reads the form the same way.
+"""
+import argparse
+import glob
+import os
+import re
+import statistics
+import time
+from dataclasses import replace
+from difflib import SequenceMatcher
+from typing import Dict, List, Tuple
+
+import fitz
+
+from Services.VisionImageEncoder import VisionImageOptions, encode_page
+
+SERVICES_DIR = os.path.dirname(os.path.abspath(__file__))
+# Labels this similar to the reference count as the same reading
+LABEL_MATCH_RATIO = 0.8
+
+BASELINE = "png_rgb_108dpi"
+CONFIGURATIONS: Dict[str, VisionImageOptions] = {
+    BASELINE: VisionImageOptions(image_format="png", grayscale=False, dpi=108, max_bytes=None),
+    "png_gray_adaptive": VisionImageOptions(image_format="png", grayscale=True, max_bytes=None),
+    "jpeg_gray_adaptive_q80": VisionImageOptions(image_format="jpeg", grayscale=True, quality=80),
+    "jpeg_gray_adaptive_q60": VisionImageOptions(image_format="jpeg", grayscale=True, quality=60),
+    "webp_gray_adaptive_q80": VisionImageOptions(image_format="webp", grayscale=True, quality=80),
+    "jpeg_rgb_adaptive_q80": VisionImageOptions(image_format="jpeg", grayscale=False, quality=80),
+}
+
+
+def count_widgets(pdf_path: str) -> int:
+    with fitz.open(pdf_path) as doc:
+        return sum(1 for page in doc for _ in page.widgets())
+
+
+def measure_payload(pdf_path: str, options: VisionImageOptions) -> Tuple[int, float, List[float]]:
+    """Total bytes and encode seconds for every page, plus the DPI each page was rendered at."""
+    total_bytes, dpis = 0, []
+    start = time.perf_counter()
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            for image in encode_page(page, options):
+                total_bytes += len(image.data)
+                dpis.append(image.dpi)
+    return total_bytes, time.perf_counter() - start, dpis
+
+
+def normalize_label(label: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", str(label).lower()).strip()
+
+
+def label_agreement(labels: Dict[str, str], reference: Dict[str, str]) -> float:
+    if not reference:
+        return 0.0
+    agreed = sum(
+        1 for name, expected in reference.items()
+        if SequenceMatcher(None, normalize_label(labels.get(name, "")), normalize_label(expected)).ratio()
+        >= LABEL_MATCH_RATIO
+    )
+    return agreed / len(reference)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark vision image encodings.")
+    parser.add_argument("--templates", type=int, default=3)
+    parser.add_argument("--accuracy", action="store_true", help="Also compare Gemini label extraction")
+    args = parser.parse_args()
+
+    pdf_paths = glob.glob(os.path.join(SERVICES_DIR, "*.pdf"))
+    ranked = sorted(pdf_paths, key=count_widgets, reverse=True)[:args.templates]
+
+    extractor = None
+    if args.accuracy:
+        # Imported lazily: only the accuracy run needs the Gemini client and API keys
+        from main import GeminiPDFLabelExtractor
+        extractor = GeminiPDFLabelExtractor()
+
+    print(f"{'template':<32} {'configuration':<24} {'KB':>8} {'vs base':>8} {'encode ms':>10} "
+          f"{'dpi':>9} {'labels':>7}")
+    for pdf_path in ranked:
+        baseline_bytes = None
+        reference: Dict[str, str] = {}
+        for name, options in CONFIGURATIONS.items():
+            total_bytes, seconds, dpis = measure_payload(pdf_path, options)
+            baseline_bytes = baseline_bytes or total_bytes
+
+            accuracy = ""
+            if extractor is not None:
+                extractor.image_options = replace(options)
+                labels = extractor.extract_labels_from_pymupdf_fields(pdf_path)
+                if name == BASELINE:
+                    reference = labels
+                accuracy = f"{label_agreement(labels, reference):.0%}"
+
+            print(f"{os.path.basename(pdf_path)[:32]:<32} {name:<24} {total_bytes / 1024:>8.1f} "
+                  f"{total_bytes / baseline_bytes:>7.0%} {seconds * 1000:>10.1f} "
+                  f"{statistics.median(dpis) if dpis else 0:>9.0f} {accuracy:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import io
+import os
+from dataclasses import dataclass, replace
+from typing import Dict, Any, List, Optional, Tuple
+
+import fitz
+from PIL import Image
+
+# png, jpeg or webp; lossy formats are encoded once straight from the pixmap samples
+VISION_IMAGE_FORMAT = os.environ.get("VISION_IMAGE_FORMAT", "jpeg").lower()
+VISION_IMAGE_QUALITY = int(os.environ.get("VISION_IMAGE_QUALITY", 80))
+VISION_GRAYSCALE = os.environ.get("VISION_GRAYSCALE", "1") == "1"
+# Lossy images above this many bytes are re-encoded at lower quality, down to VISION_MIN_QUALITY
+VISION_MAX_IMAGE_BYTES = int(os.environ.get("VISION_MAX_IMAGE_BYTES", 400 * 1024))
+VISION_MIN_QUALITY = 40
+# Adaptive DPI: the page's small print should come out at least VISION_MIN_TEXT_PX tall
+VISION_MIN_DPI = float(os.environ.get("VISION_MIN_DPI", 72))
+VISION_MAX_DPI = float(os.environ.get("VISION_MAX_DPI", 200))
+VISION_DEFAULT_DPI = float(os.environ.get("VISION_DEFAULT_DPI", 150))
+VISION_MIN_TEXT_PX = float(os.environ.get("VISION_MIN_TEXT_PX", 16))
+# Tiling splits tall renders into overlapping horizontal bands
+VISION_TILE_MAX_PX = int(os.environ.get("VISION_TILE_MAX_PX", 2048))
+VISION_TILE_OVERLAP_POINTS = 24.0
+
+MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+@dataclass
+class VisionImageOptions:
+    """How a page is rendered and encoded for a vision call.
+
+    ``dpi`` fixes the resolution; left as None it is chosen per page from the
+    size of its text. Tiling is off by default because most prompts ask for
+    coordinates relative to the whole page.
+    """
+    image_format: str = VISION_IMAGE_FORMAT
+    quality: int = VISION_IMAGE_QUALITY
+    grayscale: bool = VISION_GRAYSCALE
+    dpi: Optional[float] = None
+    max_bytes: Optional[int] = VISION_MAX_IMAGE_BYTES
+    tile: bool = False
+    tile_max_px: int = VISION_TILE_MAX_PX
+
+
+@dataclass
+class EncodedImage:
+    """One encoded page (or tile) with what is needed to map its pixels back to page points."""
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    dpi: float
+    # Top-left of the tile in page points; (0, 0) for a whole page
+    offset: Tuple[float, float] = (0.0, 0.0)
+
+    def blob(self) -> Dict[str, Any]:
+        """Inline image part for generate_content; the SDK sends the bytes as-is."""
+        return {"mime_type": self.mime_type, "data": self.data}
+
+    def to_page_points(self, x: float, y: float) -> Tuple[float, float]:
+        scale = 72.0 / self.dpi
+        return self.offset[0] + x * scale, self.offset[1] + y * scale
+
+
+def choose_dpi(page: fitz.Page, min_dpi: float = VISION_MIN_DPI, max_dpi: float = VISION_MAX_DPI,
+               min_text_px: float = VISION_MIN_TEXT_PX) -> float:
+    """Lowest DPI at which the page's small print stays legible.
+
+    Uses the 10th-percentile font size of the text layer. Pages without
+    one (scans) get VISION_DEFAULT_DPI.
+    """
+    sizes = sorted(
+        span["size"]
+        for block in page.get_text("dict", flags=0)["blocks"]
+        for line in block.get("lines", [])
+        for span in line["spans"]
+        if span["text"].strip() and span["size"] > 0
+    )
+    if not sizes:
+        return min(max_dpi, max(min_dpi, VISION_DEFAULT_DPI))
+    small_print = sizes[len(sizes) // 10]
+    return round(min(max_dpi, max(min_dpi, min_text_px * 72.0 / small_print)))
+
+
+def _encode_pixmap(pix: fitz.Pixmap, options: VisionImageOptions) -> bytes:
+    if options.image_format == "png":
+        return pix.tobytes("png")
+
+    mode = "L" if pix.n == 1 else "RGB"
+    # Wraps the pixmap's samples without copying or decoding anything
+    img = Image.frombuffer(mode, (pix.width, pix.height), pix.samples, "raw", mode, 0, 1)
+    pil_format = "JPEG" if options.image_format == "jpeg" else "WEBP"
+    quality = options.quality
+    while True:
+        buffer = io.BytesIO()
+        img.save(buffer, format=pil_format, quality=quality, optimize=pil_format == "JPEG")
+        data = buffer.getvalue()
+        if options.max_bytes is None or len(data) <= options.max_bytes or quality <= VISION_MIN_QUALITY:
+            return data
+        quality = max(VISION_MIN_QUALITY, quality - 10)
+
+
+def _tile_clips(page: fitz.Page, dpi: float, tile_max_px: int) -> List[fitz.Rect]:
+    rect = page.rect
+    band = tile_max_px * 72.0 / dpi
+    if rect.height <= band:
+        return [rect]
+    clips = []
+    top = rect.y0
+    while top < rect.y1:
+        bottom = min(rect.y1, top + band)
+        clips.append(fitz.Rect(rect.x0, top, rect.x1, bottom))
+        if bottom >= rect.y1:
+            break
+        top = bottom - VISION_TILE_OVERLAP_POINTS
+    return clips
+
+
+def encode_page(page: fitz.Page, options: Optional[VisionImageOptions] = None) -> List[EncodedImage]:
+    """Renders and encodes a page for a vision call, as one image or several tiles."""
+    options = options or VisionImageOptions()
+    if options.image_format not in MIME_TYPES:
+        raise ValueError(f"Unsupported vision image format: {options.image_format}")
+    dpi = options.dpi or choose_dpi(page)
+    colorspace = fitz.csGRAY if options.grayscale else fitz.csRGB
+    clips = _tile_clips(page, dpi, options.tile_max_px) if options.tile else [None]
+
+    images = []
+    for clip in clips:
+        pix = page.get_pixmap(dpi=dpi, colorspace=colorspace, alpha=False, clip=clip)
+        images.append(EncodedImage(
+            data=_encode_pixmap(pix, options),
+            mime_type=MIME_TYPES[options.image_format],
+            width=pix.width,
+            height=pix.height,
+            dpi=dpi,
+            offset=(clip.x0, clip.y0) if clip is not None else (0.0, 0.0)
+        ))
+    return images
+
+
+def encode_page_image(page: fitz.Page, options: Optional[VisionImageOptions] = None) -> EncodedImage:
+    """The whole page as a single image, whatever the tiling option says."""
+    options = replace(options or VisionImageOptions(), tile=False)
+    return encode_page(page, options)[0]
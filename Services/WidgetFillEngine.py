@@ -0,0 +1,84 @@
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Tuple, Optional
+
+import fitz
+
+
+@dataclass
+class FillResult:
+    filled: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    missing: List[str] = field(default_factory=list)
+    failed: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def applied(self) -> List[str]:
+        """Fields that hold the requested value after the fill, whether written now or already set."""
+        return self.filled + self.unchanged
+
+
+def build_widget_index(doc: fitz.Document) -> Dict[str, Tuple[int, fitz.Widget]]:
+    """Maps each field name to the first widget carrying it, in one pass over the document."""
+    index = {}
+    for page_num, page in enumerate(doc):
+        for widget in page.widgets():
+            name = widget.field_name
+            if name and name not in index:
+                index[name] = (page_num, widget)
+    return index
+
+
+def apply_field_updates(doc: fitz.Document, updates: Dict[str, Any],
+                        index: Optional[Dict[str, Tuple[int, fitz.Widget]]] = None) -> FillResult:
+    """Writes all field values into an open document in a single pass per page.
+
+    Widgets whose current value already equals the new one are left alone so
+    their appearance streams aren't regenerated. The caller saves the
+    document once afterwards.
+    """
+    index = index if index is not None else build_widget_index(doc)
+    result = FillResult()
+
+    by_page: Dict[int, List[Tuple[str, fitz.Widget, str]]] = {}
+    for name, value in updates.items():
+        entry = index.get(name)
+        if entry is None:
+            result.missing.append(name)
+            continue
+        page_num, widget = entry
+        by_page.setdefault(page_num, []).append((name, widget, str(value)))
+
+    for page_num in sorted(by_page):
+        for name, widget, value in by_page[page_num]:
+            current = widget.field_value
+            if current is not None and str(current) == value:
+                result.unchanged.append(name)
+                continue
+
+            print(f"✍️ Filling: '{value}' → '{name}' (Page {page_num + 1})")
+            try:
+                widget.field_value = value
+                widget.update()
+                result.filled.append(name)
+            except Exception as e:
+                print(f"⚠️ Error filling {name}: {e}")
+                result.failed[name] = str(e)
+
+    if result.unchanged:
+        print(f"⏭️ Skipped {len(result.unchanged)} fields that already held their value")
+    return result
+
+
+def filled_widget_values(doc: fitz.Document) -> Dict[str, Any]:
+    """Reads back every non-empty field value from the open document's widgets."""
+    values = {}
+    for page in doc:
+        for widget in page.widgets():
+            if widget.field_name and widget.field_value not in (None, "", "Off"):
+                values.setdefault(widget.field_name, widget.field_value)
+    return values
+
+
+def document_bytes(doc: fitz.Document) -> bytes:
+    """Serializes the document once, compacted, for streaming or a single write to disk."""
+    return doc.tobytes(deflate=True, clean=True)
@@ -0,0 +1,116 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, Callable, Optional
+
+# Worker counts per CPU-bound stage, overridable through the environment
+DEFAULT_STAGE_WORKERS = {
+    "render": int(os.environ.get("PDF_RENDER_WORKERS", 2)),
+    "ocr": int(os.environ.get("PDF_OCR_WORKERS", 1)),
+    "fill": int(os.environ.get("PDF_FILL_WORKERS", 2)),
+}
+# In-flight jobs allowed per worker before callers start waiting
+QUEUE_DEPTH_PER_WORKER = int(os.environ.get("PDF_QUEUE_DEPTH_PER_WORKER", 2))
+# Set to 0 to run the blocking stages in-process (e.g. when debugging)
+WORKER_POOL_ENABLED = os.environ.get("PDF_WORKER_POOL", "1") == "1"
+
+
+class PdfWorkerPool:
+    """Bounded process pools for the blocking PDF stages (render, OCR, fill).
+
+    Each stage gets its own ProcessPoolExecutor so a burst of OCR jobs can't
+    starve cheap render/fill work, and an asyncio semaphore per stage caps
+    the number of submitted jobs so back-pressure lands on the request
+    handlers instead of an unbounded executor queue.
+    """
+
+    def __init__(self, stage_workers: Optional[Dict[str, int]] = None,
+                 queue_depth_per_worker: int = QUEUE_DEPTH_PER_WORKER,
+                 initializers: Optional[Dict[str, Callable]] = None):
+        stage_workers = {**DEFAULT_STAGE_WORKERS, **(stage_workers or {})}
+        initializers = initializers or {}
+        # spawn keeps workers free of the server's threads and open handles
+        context = multiprocessing.get_context("spawn")
+
+        self.stage_workers = stage_workers
+        self._executors = {
+            stage: ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                       initializer=initializers.get(stage))
+            for stage, workers in stage_workers.items()
+        }
+        self._warm_stages = set()
+        self._semaphores = {
+            stage: asyncio.Semaphore(workers * queue_depth_per_worker)
+            for stage, workers in stage_workers.items()
+        }
+
+    async def run(self, stage: str, fn: Callable, *args) -> Any:
+        """Runs a picklable module-level function in the given stage's pool."""
+        if stage not in self._executors:
+            raise ValueError(f"Unknown worker stage: {stage}")
+
+        async with self._semaphores[stage]:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executors[stage], fn, *args)
+
+    async def prestart(self) -> None:
+        """Starts every worker up front so initializers (e.g. model loads) run before traffic."""
+        async def prestart_stage(stage: str, workers: int):
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(
+                loop.run_in_executor(self._executors[stage], _noop) for _ in range(workers)
+            ))
+            self._warm_stages.add(stage)
+
+        await asyncio.gather(*(
+            prestart_stage(stage, workers) for stage, workers in self.stage_workers.items()
+        ))
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            stage: {"workers": workers, "ready": stage in self._warm_stages}
+            for stage, workers in self.stage_workers.items()
+        }
+
+    def shutdown(self, wait: bool = True) -> None:
+        for executor in self._executors.values():
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def _noop() -> None:
+    return None
+
+
+_worker_pool: Optional[PdfWorkerPool] = None
+
+
+def configure_worker_pool(stage_workers: Optional[Dict[str, int]] = None,
+                          initializers: Optional[Dict[str, Callable]] = None) -> PdfWorkerPool:
+    """Creates the process-wide worker pool. Call once from the serving process."""
+    global _worker_pool
+    if _worker_pool is None:
+        _worker_pool = PdfWorkerPool(stage_workers, initializers=initializers)
+        print(f"✅ PDF worker pool ready: {_worker_pool.stage_workers}")
+    return _worker_pool
+
+
+def get_worker_pool() -> Optional[PdfWorkerPool]:
+    return _worker_pool
+
+
+def shutdown_worker_pool() -> None:
+    global _worker_pool
+    if _worker_pool is not None:
+        _worker_pool.shutdown()
+        _worker_pool = None
+
+
+async def run_in_worker(stage: str, fn: Callable, *args) -> Any:
+    """Offloads blocking work to the worker pool, or runs it inline when no pool is configured.
+
+    The inline fallback keeps the fillers usable from standalone scripts.
+    """
+    if _worker_pool is None:
+        return fn(*args)
+    return await _worker_pool.run(stage, fn, *args)
@@ -565,23 +565,28 @@
 #         print(f"Processed {pdf_path}: {len(result)} fields")
 
 
+import asyncio
 import fitz
 import logging
 import os
 import json
-import io
 import time
 from dataclasses import dataclass
 from typing import Dict, Any, List, Optional, Tuple
-import google.generativeai as genai
-from PIL import Image
 from concurrent.futures import ThreadPoolExecutor
 from Common.constants import  *
+from Services.APIKeyPool import get_key_pool, generate_content_pooled
+from Services.LLMCaller import backoff_delay, repair_json
+from Services.VisionImageEncoder import VisionImageOptions, encode_page_image
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Vision calls in flight at once, and pages rendered ahead while waiting for a free slot
+VISION_CONCURRENCY = int(os.environ.get("VISION_CONCURRENCY", 4))
+VISION_RENDER_AHEAD = int(os.environ.get("VISION_RENDER_AHEAD", 2))
+
 
 @dataclass
 class PDFField:
@@ -611,53 +616,102 @@ class GeminiPDFLabelExtractor:
     """PDF form field and label extractor using Gemini vision capabilities."""
 
     def __init__(self,
-                 gemini_api_key: str,
+                 gemini_api_key: Optional[str] = None,
                  model_name: str = "gemini-1.5-flash",
-                 scale_factor: float = 1.5,
-                 max_retries: int = 3):
-        """Initialize the extractor with Gemini API credentials and settings."""
+                 scale_factor: Optional[float] = None,
+                 max_retries: int = 3,
+                 concurrency: int = VISION_CONCURRENCY,
+                 image_options: Optional[VisionImageOptions] = None):
+        """Initialize the extractor with Gemini API credentials and settings.
+
+        Calls go through the shared API key pool; an explicit key is added to it.
+        Up to ``concurrency`` pages are sent to Gemini at once. Pages are
+        encoded per ``image_options``; a scale_factor pins the render DPI
+        (72 * scale_factor) instead of choosing it per page.
+        """
         self.gemini_api_key = gemini_api_key
         self.model_name = model_name
         self.scale_factor = scale_factor
+        self.image_options = image_options or VisionImageOptions()
+        if scale_factor:
+            self.image_options.dpi = 72 * scale_factor
         self.max_retries = max_retries
+        self.concurrency = max(1, concurrency)
 
-        # Configure Gemini
+        self.key_pool = get_key_pool()
         if self.gemini_api_key:
-            genai.configure(api_key=self.gemini_api_key)
-        else:
+            self.key_pool.add_key(self.gemini_api_key)
+        if not len(self.key_pool):
             raise ValueError("Gemini API key is required")
 
-    def _get_page_image(self, page: fitz.Page) -> Image.Image:
-        """Render a PDF page to a PIL Image with appropriate scaling."""
+    def _get_page_image(self, page: fitz.Page) -> Dict[str, Any]:
+        """Render a PDF page straight to an encoded image part, without a PNG round trip."""
         try:
-            pix = page.get_pixmap(matrix=fitz.Matrix(self.scale_factor, self.scale_factor))
-            img_bytes = io.BytesIO()
-            pix.pil_save(img_bytes, format="PNG")
-            img_bytes.seek(0)
-            return Image.open(img_bytes)
+            return encode_page_image(page, self.image_options).blob()
         except Exception as e:
-            logger.error(f"Error rendering page image with pil_save: {e}")
+            logger.error(f"Error encoding page image: {e}")
+            # Fallback with lower quality
+            pix = page.get_pixmap(matrix=fitz.Matrix(1.0, 1.0))
+            return {"mime_type": "image/png", "data": pix.tobytes("png")}
+
+    @staticmethod
+    def _run_sync(coro):
+        """Runs a coroutine for the synchronous API, even when called from inside an event loop."""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coro)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, coro).result()
+
+    async def _run_pages(self, doc: fitz.Document, page_nums: List[int], handle) -> List[Any]:
+        """Calls ``handle(img, page_num)`` for every page concurrently and returns the results in page order.
+
+        Pages are rendered one at a time (a fitz document must not be shared
+        between threads) while earlier pages' calls are in flight; rendering
+        runs at most VISION_RENDER_AHEAD pages ahead of the free call slots.
+        """
+        calls = asyncio.Semaphore(self.concurrency)
+        render_slots = asyncio.Semaphore(self.concurrency + VISION_RENDER_AHEAD)
+
+        async def call(img: Dict[str, Any], page_num: int):
             try:
-                # Alternative approach
-                pix = page.get_pixmap(matrix=fitz.Matrix(self.scale_factor, self.scale_factor))
-                img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                return img
-            except Exception as e2:
-                logger.error(f"Error rendering page image with alternative method: {e2}")
-                # Final fallback with lower quality
-                pix = page.get_pixmap(matrix=fitz.Matrix(1.0, 1.0))
-                img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                return img
-
-    def _extract_fields_and_labels(self, page: fitz.Page, page_num: int) -> List[PDFField]:
-        """Extract form fields and their associated labels using Gemini's visual capabilities."""
+                async with calls:
+                    return await handle(img, page_num)
+            finally:
+                render_slots.release()
+
+        tasks = []
         try:
-            # Get page as image
-            img = self._get_page_image(page)
+            for page_num in page_nums:
+                await render_slots.acquire()
+                img = await asyncio.to_thread(self._get_page_image, doc[page_num])
+                tasks.append(asyncio.create_task(call(img, page_num)))
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+    async def _vision_json(self, prompt: str, img: Dict[str, Any], context: str) -> Optional[Any]:
+        """Sends a page image with a prompt and parses the JSON reply, retrying with non-blocking backoff."""
+        for attempt in range(self.max_retries):
+            try:
+                response = await generate_content_pooled(self.model_name, [prompt, img], pool=self.key_pool)
+                data = repair_json(response.text)
+                if data is not None:
+                    return data
+                logger.warning(f"Could not extract valid JSON for {context} on attempt {attempt + 1}")
+            except Exception as e:
+                logger.warning(f"Gemini API error for {context} on attempt {attempt + 1}: {e}")
 
-            # Initialize Gemini model
-            model = genai.GenerativeModel(self.model_name)
+            if attempt < self.max_retries - 1:
+                await asyncio.sleep(backoff_delay(attempt + 1))
+        return None
 
+    async def _extract_fields_and_labels(self, img: Dict[str, Any], page_num: int) -> List[PDFField]:
+        """Extract form fields and their associated labels using Gemini's visual capabilities."""
+        try:
             # Create extraction prompt focused on labels
             prompt = """
             Analyze this PDF document image and identify all form fields present with their associated labels. 
@@ -681,50 +735,9 @@ class GeminiPDFLabelExtractor:
             Return valid JSON only.
             """
 
-            # Make request to Gemini with retry logic
-            fields_data = None
-
-            for attempt in range(self.max_retries):
-                try:
-                    response = model.generate_content([prompt, img])
-                    response_text = response.text
-
-                    # Try to extract JSON from the response
-                    try:
-                        # First attempt: direct JSON parsing
-                        fields_data = json.loads(response_text)
-                        break
-                    except json.JSONDecodeError:
-                        # Second attempt: Look for JSON code block
-                        import re
-                        json_match = re.search(r'```json\n(.*?)\n```', response_text, re.DOTALL)
-                        if json_match:
-                            try:
-                                fields_data = json.loads(json_match.group(1))
-                                break
-                            except json.JSONDecodeError:
-                                pass
-
-                        # Third attempt: Look for any JSON-like structure
-                        json_match = re.search(r'(\[.*\])', response_text, re.DOTALL)
-                        if json_match:
-                            try:
-                                fields_data = json.loads(json_match.group(1))
-                                break
-                            except json.JSONDecodeError:
-                                pass
-
-                        logger.warning(f"Could not extract valid JSON on attempt {attempt + 1}")
-
-                except Exception as e:
-                    logger.warning(f"Gemini API error on attempt {attempt + 1}: {e}")
-
-                # Wait before retry
-                if attempt < self.max_retries - 1:
-                    time.sleep(2 * (attempt + 1))  # Exponential backoff
-
+            fields_data = await self._vision_json(prompt, img, f"fields on page {page_num + 1}")
             if not fields_data:
-                logger.error("All attempts to extract fields with Gemini failed")
+                logger.error(f"All attempts to extract fields with Gemini failed for page {page_num + 1}")
                 return []
 
             # Convert to PDFField objects
@@ -771,25 +784,28 @@ class GeminiPDFLabelExtractor:
 
     def extract_field_labels(self, pdf_path: str) -> Dict[str, Dict[str, Any]]:
         """Extract all fields and their associated labels from the PDF."""
+        return self._run_sync(self.extract_field_labels_async(pdf_path))
+
+    async def extract_field_labels_async(self, pdf_path: str) -> Dict[str, Dict[str, Any]]:
+        """Async variant of extract_field_labels; pages are sent to Gemini concurrently."""
         if not os.path.exists(pdf_path):
             raise FileNotFoundError(f"PDF file not found: {pdf_path}")
 
         logger.info(f"Extracting fields and labels from: {pdf_path}")
+        start_time = time.perf_counter()
 
         # Dictionary to store all fields
         all_fields = {}
 
         try:
             doc = fitz.open(pdf_path)
+            try:
+                page_results = await self._run_pages(doc, list(range(len(doc))), self._extract_fields_and_labels)
+            finally:
+                doc.close()
 
-            # Process each page
-            for page_num in range(len(doc)):
-                logger.info(f"Processing page {page_num + 1} of {len(doc)}")
-
-                # Extract fields and labels using Gemini
-                fields = self._extract_fields_and_labels(doc[page_num], page_num)
-
-                # Add to results
+            # Add to results in page order
+            for fields in page_results:
                 for field in fields:
                     all_fields[field.name] = field.to_dict()
 
@@ -797,7 +813,8 @@ class GeminiPDFLabelExtractor:
                     logger.info(
                         f"Field: '{field.name}' (Page {field.page_num + 1}) [{field.field_type}] - Label: '{field.label}'")
 
-            doc.close()
+            logger.info(f"Processed {len(page_results)} pages in {time.perf_counter() - start_time:.2f}s "
+                        f"(concurrency {self.concurrency})")
             return all_fields
 
         except Exception as e:
@@ -805,7 +822,10 @@ class GeminiPDFLabelExtractor:
             raise
 
     def extract_labels_from_pymupdf_fields(self, pdf_path: str) -> Dict[str, str]:
+        return self._run_sync(self.extract_labels_from_pymupdf_fields_async(pdf_path))
 
+    async def extract_labels_from_pymupdf_fields_async(self, pdf_path: str) -> Dict[str, str]:
+        """Async variant of extract_labels_from_pymupdf_fields; pages are sent to Gemini concurrently."""
         if not os.path.exists(pdf_path):
             raise FileNotFoundError(f"PDF file not found: {pdf_path}")
 
@@ -813,119 +833,71 @@ class GeminiPDFLabelExtractor:
 
         try:
             doc = fitz.open(pdf_path)
+            try:
+                # First, extract basic fields using PyMuPDF
+                pymupdf_fields = {}
 
-            # First, extract basic fields using PyMuPDF
-            pymupdf_fields = {}
-
-            for page_num, page in enumerate(doc):
-                try:
-                    for widget in page.widgets():
-                        if not widget.field_name:
-                            continue
-
-                        field_name = widget.field_name.strip()
-                        pymupdf_fields[field_name] = {
-                            "page_num": page_num,
-                            "rect": [widget.rect.x0, widget.rect.y0, widget.rect.x1, widget.rect.y1],
-                            "field_type": widget.field_type
-                        }
-                except Exception as e:
-                    logger.error(f"Error extracting basic fields from page {page_num}: {e}")
-
-            # Now use Gemini to identify labels for these fields
-            field_labels = {}
-
-            for page_num in range(len(doc)):
-                page_fields = {k: v for k, v in pymupdf_fields.items() if v["page_num"] == page_num}
-
-                if not page_fields:
-                    continue
-
-                # Get page image
-                img = self._get_page_image(doc[page_num])
-
-                # Initialize Gemini model
-                model = genai.GenerativeModel(self.model_name)
-
-                # Prepare data for the prompt
-                fields_info = []
-                for field_name, info in page_fields.items():
-                    fields_info.append({
-                        "name": field_name,
-                        "rect": info["rect"],
-                        "type": info["field_type"]
-                    })
-
-                # Create prompt focusing on identifying labels
-                prompt = f"""
-                I have a PDF form with the following form fields on this page:
-                {json.dumps(fields_info, indent=2)}
-
-                For each form field listed above, identify the associated label or descriptive text near the field.
-                Consider proximity, alignment, and visual relationships to determine which text is meant to label each field.
-
-                Return a JSON object where:
-                - Each key is the original field name
-                - Each value is the text of the label associated with that field
-
-                Example:
-                {{
-                  "firstName": "First Name:",
-                  "lastName": "Last Name:",
-                  "dob": "Date of Birth"
-                }}
-
-                Return valid JSON only.
-                """
-
-                # Make request to Gemini
-                for attempt in range(self.max_retries):
+                for page_num, page in enumerate(doc):
                     try:
-                        response = model.generate_content([prompt, img])
-                        response_text = response.text
-
-                        # Try to extract JSON
-                        try:
-                            labels_data = json.loads(response_text)
-                            # Update the field_labels dictionary
-                            field_labels.update(labels_data)
-                            break
-                        except json.JSONDecodeError:
-                            # Try to find JSON in the response
-                            import re
-                            json_match = re.search(r'```json\n(.*?)\n```', response_text, re.DOTALL)
-                            if json_match:
-                                try:
-                                    labels_data = json.loads(json_match.group(1))
-                                    field_labels.update(labels_data)
-                                    break
-                                except json.JSONDecodeError:
-                                    pass
-
-                            # One more attempt with any JSON-like structure
-                            json_match = re.search(r'(\{.*\})', response_text, re.DOTALL)
-                            if json_match:
-                                try:
-                                    labels_data = json.loads(json_match.group(1))
-                                    field_labels.update(labels_data)
-                                    break
-                                except json.JSONDecodeError:
-                                    pass
-
-                            logger.warning(f"Could not extract valid JSON for labels on attempt {attempt + 1}")
-
+                        for widget in page.widgets():
+                            if not widget.field_name:
+                                continue
+
+                            field_name = widget.field_name.strip()
+                            pymupdf_fields[field_name] = {
+                                "page_num": page_num,
+                                "rect": [widget.rect.x0, widget.rect.y0, widget.rect.x1, widget.rect.y1],
+                                "field_type": widget.field_type
+                            }
                     except Exception as e:
-                        logger.warning(f"Gemini API error on labels attempt {attempt + 1}: {e}")
+                        logger.error(f"Error extracting basic fields from page {page_num}: {e}")
+
+                async def label_page(img: Dict[str, Any], page_num: int) -> Dict[str, str]:
+                    # Prepare data for the prompt
+                    fields_info = [
+                        {"name": field_name, "rect": info["rect"], "type": info["field_type"]}
+                        for field_name, info in pymupdf_fields.items() if info["page_num"] == page_num
+                    ]
+
+                    # Create prompt focusing on identifying labels
+                    prompt = f"""
+                    I have a PDF form with the following form fields on this page:
+                    {json.dumps(fields_info, indent=2)}
+
+                    For each form field listed above, identify the associated label or descriptive text near the field.
+                    Consider proximity, alignment, and visual relationships to determine which text is meant to label each field.
+
+                    Return a JSON object where:
+                    - Each key is the original field name
+                    - Each value is the text of the label associated with that field
+
+                    Example:
+                    {{
+                      "firstName": "First Name:",
+                      "lastName": "Last Name:",
+                      "dob": "Date of Birth"
+                    }}
+
+                    Return valid JSON only.
+                    """
+
+                    labels_data = await self._vision_json(prompt, img, f"labels on page {page_num + 1}")
+                    return labels_data if isinstance(labels_data, dict) else {}
+
+                # Now use Gemini to identify labels, only for pages that have fields
+                pages_with_fields = sorted({info["page_num"] for info in pymupdf_fields.values()})
+                page_labels = await self._run_pages(doc, pages_with_fields, label_page)
+            finally:
+                doc.close()
 
-                    # Wait before retry
-                    if attempt < self.max_retries - 1:
-                        time.sleep(2 * (attempt + 1))
+            field_labels = {}
+            for labels in page_labels:
+                field_labels.update(labels)
 
             # Log results
             for field_name, label in field_labels.items():
                 logger.info(f"Field: '{field_name}' - Label: '{label}'")
 
-            doc.close()
             return field_labels
 
         except Exception as e:
@@ -0,0 +1,17 @@
+from Services.LLMCaller import pick_consensus_winner
+
+
+def test_quorum_pair_beats_single_confident_vote():
+    # quorum 2: A has two votes at 0.4, B one vote at 0.95
+    candidates = {"A": [2, 0.8, None], "B": [1, 0.95, None]}
+    winner = pick_consensus_winner(candidates, quorum=2)
+    assert winner is not None and winner[0] == "A"
+
+
+def test_confidence_breaks_ties_between_quorum_pairs():
+    candidates = {"A": [2, 0.8, None], "B": [2, 1.6, None]}
+    assert pick_consensus_winner(candidates, quorum=2)[0] == "B"
+
+
+def test_no_winner_without_quorum():
+    assert pick_consensus_winner({"A": [1, 0.4, None], "B": [1, 0.95, None]}, quorum=2) is None
@@ -0,0 +1,23 @@
+from Services.LocalMatcher import LocalFieldMatcher
+
+TEXT_FIELD = {"type": 7, "is_readonly": False}
+
+
+def test_name_keys_do_not_resolve_to_entity_name():
+    flat_json = {"data.Registered_Agent.Name.RA_Name": "Jane Doe", "data.Payload.Name.CD_LLC_Name": "Acme LLC"}
+    result = LocalFieldMatcher().match(flat_json, {"Entity_Name": TEXT_FIELD})
+    assert result.matches == []
+    assert result.unresolved_fields == ["Entity_Name"]
+
+
+def test_single_token_field_is_left_for_the_model():
+    result = LocalFieldMatcher().match({"data.Name": "Acme"}, {"Name": TEXT_FIELD})
+    assert result.matches == []
+
+
+def test_specific_keys_still_resolve_locally():
+    fields = {"Entity_Name": TEXT_FIELD, "Registered_Agent_Name": TEXT_FIELD}
+    flat_json = {"data.Entity_Name": "Acme", "data.Registered_Agent.Name.RA_Name": "Jane Doe"}
+    matched = {m["json_field"]: m["pdf_field"] for m in LocalFieldMatcher().match(flat_json, fields).matches}
+    assert matched.get("data.Entity_Name") == "Entity_Name"
+    assert matched.get("data.Registered_Agent.Name.RA_Name") != "Entity_Name"